@@ -0,0 +1,67 @@
+"""Row-at-a-time insert_invoice versus bulk_insert_invoices.
+
+    PYTHONPATH=src python -m benchmarks.bench_bulk_import --rows 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from szamlazz_collections_mcp import storage
+from szamlazz_collections_mcp.models import InvoiceRecord
+
+from .common import generate_rows, temporary_database
+
+_FIELDS = (
+    "invoice_number",
+    "buyer_name",
+    "buyer_email",
+    "issue_date",
+    "due_date",
+    "gross_total",
+    "currency",
+    "status",
+    "created_at",
+    "last_reminded_at",
+    "reminders_sent_count",
+    "external_id",
+)
+
+
+def _records(count: int):
+    for row in generate_rows(count):
+        yield InvoiceRecord(**dict(zip(_FIELDS, row, strict=True)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument(
+        "--single-rows", type=int, default=2_000, help="rows for the per-row baseline"
+    )
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    with temporary_database():
+        storage.init_db()
+        start = time.perf_counter()
+        for record in _records(args.single_rows):
+            storage.insert_invoice(record)
+        per_row = (time.perf_counter() - start) / args.single_rows
+        print(f"insert_invoice:       {per_row * 1e6:8.1f} us/row ({args.single_rows} rows)")
+
+    with temporary_database():
+        storage.init_db()
+        start = time.perf_counter()
+        result = storage.bulk_insert_invoices(_records(args.rows), chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - start
+        per_row = elapsed / args.rows
+        print(
+            f"bulk_insert_invoices: {per_row * 1e6:8.1f} us/row ({args.rows} rows, {elapsed:.1f} s)"
+        )
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
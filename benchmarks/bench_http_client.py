@@ -0,0 +1,68 @@
+"""Latency of the pooled Számlázz.hu client versus a fresh httpx.Client per call.
+
+    PYTHONPATH=src python -m benchmarks.bench_http_client --requests 500
+
+Against the built-in local agent only the TCP handshake is saved; pass ``--url`` to
+measure against a real endpoint, where TLS setup dominates.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+import httpx
+
+from szamlazz_collections_mcp import szamlazz_client
+from szamlazz_collections_mcp.config import reset_settings
+
+from .common import local_agent, measure
+
+_FILES = {"action-szamla_agent_xml": ("request.xml", b"<xmlszamlaxml/>", "text/xml")}
+
+
+def _per_call(url: str) -> None:
+    client = httpx.Client()
+    try:
+        client.post(url, files=_FILES, timeout=30.0).raise_for_status()
+    finally:
+        client.close()
+
+
+def _run(url: str, count: int, repeat: int) -> None:
+    os.environ["SZAMLAZZ_BASE_URL"] = url
+    reset_settings()
+    szamlazz_client.close_http_client()
+    szamlazz_client.post_xml("action-szamla_agent_xml", "<xmlszamlaxml/>")
+
+    def per_call_batch():
+        for _ in range(count):
+            _per_call(url)
+
+    def pooled_batch():
+        for _ in range(count):
+            szamlazz_client.post_xml("action-szamla_agent_xml", "<xmlszamlaxml/>")
+
+    per_call = measure(per_call_batch, repeat=repeat)
+    pooled = measure(pooled_batch, repeat=repeat)
+    print(f"per-call client: {per_call['median_ms'] / count:8.3f} ms/request")
+    print(f"pooled client:   {pooled['median_ms'] / count:8.3f} ms/request")
+    szamlazz_client.close_http_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", default=None, help="endpoint to hit instead of the local agent")
+    args = parser.parse_args()
+
+    if args.url:
+        _run(args.url, args.requests, args.repeat)
+        return
+    with local_agent() as url:
+        _run(url, args.requests, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Query plans and latency of the hot invoice queries before and after the index migration.
+
+    PYTHONPATH=src python -m benchmarks.bench_indexes --rows 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date, timedelta
+
+from szamlazz_collections_mcp import storage
+from szamlazz_collections_mcp.utils import close_pool, db_connection
+
+from .common import generate_rows, measure, temporary_database
+
+BASELINE_VERSION = 1
+
+
+def _queries(today: date):
+    return {
+        "list_overdue": (
+            "SELECT * FROM invoices WHERE status = 'open' AND due_date < ? ORDER BY due_date ASC",
+            (today - timedelta(days=1),),
+        ),
+        "list_overdue_first_page": (
+            "SELECT * FROM invoices WHERE status = 'open' AND due_date < ? "
+            "ORDER BY due_date ASC LIMIT 100",
+            (today - timedelta(days=1),),
+        ),
+        "list_invoices_customer": (
+            "SELECT * FROM invoices WHERE buyer_email = ? ORDER BY due_date ASC",
+            ("customer7@example.com",),
+        ),
+        "list_invoices_status_due": (
+            "SELECT * FROM invoices WHERE status = ? AND due_date <= ? ORDER BY due_date ASC",
+            ("open", today - timedelta(days=90)),
+        ),
+        "external_id_lookup": ("SELECT * FROM invoices WHERE external_id = ?", ("order-12345",)),
+    }
+
+
+def _report(label: str, repeat: int) -> None:
+    today = date.today()
+    print(f"\n== {label} ==")
+    with db_connection(readonly=True) as conn:
+        for name, (sql, params) in _queries(today).items():
+            plan = "; ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+            timing = measure(
+                lambda sql=sql, params=params: conn.execute(sql, params).fetchall(), repeat=repeat
+            )
+            print(f"{name:26} {timing['median_ms']:>10.2f} ms  {plan}")
+    timing = measure(storage.aging_summary, repeat=repeat)
+    print(f"{'aging_summary':26} {timing['median_ms']:>10.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with temporary_database():
+        with db_connection() as conn:
+            storage.migrate(conn, target_version=BASELINE_VERSION)
+            start = time.perf_counter()
+            conn.executemany(storage.UPSERT_INVOICE_SQL, generate_rows(args.rows, args.customers))
+            conn.commit()
+            print(f"Loaded {args.rows} rows in {time.perf_counter() - start:.1f} s")
+
+        _report(f"schema version {BASELINE_VERSION} (no indexes)", args.repeat)
+
+        with db_connection() as conn:
+            start = time.perf_counter()
+            version = storage.migrate(conn)
+            print(f"\nMigrated to version {version} in {time.perf_counter() - start:.1f} s")
+        # Migrations run at startup; reopen connections so cached EXPLAIN statements are replanned.
+        close_pool()
+
+        _report(f"schema version {version}", args.repeat)
+
+
+if __name__ == "__main__":
+    main()
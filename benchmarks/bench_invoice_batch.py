@@ -0,0 +1,75 @@
+"""Sequential ``create_invoice`` calls versus one ``create_invoices`` batch.
+
+    PYTHONPATH=src python -m benchmarks.bench_invoice_batch --invoices 200 --latency 0.05
+
+The local agent delays every answer by ``--latency`` seconds, standing in for the
+Számlázz.hu round trip that dominates invoice creation. Each run uses fresh
+``external_id`` values, so nothing is answered from the idempotency store.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import os
+
+from szamlazz_collections_mcp import services, storage, szamlazz_async_client, szamlazz_client
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.invoice_batch import create_invoices
+from szamlazz_collections_mcp.models import InvoiceCreate
+
+from .bench_templates import INVOICE_DATA
+from .common import local_agent, measure, temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    invoice = InvoiceCreate.model_validate(INVOICE_DATA)
+    counter = itertools.count()
+
+    def batch() -> list:
+        return [
+            invoice.model_copy(update={"external_id": f"bench-{next(counter)}"})
+            for _ in range(args.invoices)
+        ]
+
+    async def submit(concurrency: int) -> None:
+        try:
+            result = await create_invoices(batch(), concurrency=concurrency)
+            assert result["created"] == args.invoices, result["failed"]
+        finally:
+            await szamlazz_async_client.close_async_client()
+
+    with local_agent(latency=args.latency) as url, temporary_database():
+        os.environ["SZAMLAZZ_BASE_URL"] = url
+        os.environ["SZAMLAZZ_MAX_CONNECTIONS"] = str(max(args.concurrency))
+        reset_settings()
+        storage.init_db()
+        szamlazz_client.close_http_client()
+
+        def sequential() -> None:
+            for item in batch():
+                services.create_invoice(item)
+
+        timings = {"sequential create_invoice": measure(sequential, repeat=args.repeat)}
+        for concurrency in args.concurrency:
+            timings[f"create_invoices (concurrency {concurrency})"] = measure(
+                lambda concurrency=concurrency: asyncio.run(submit(concurrency)),
+                repeat=args.repeat,
+            )
+        szamlazz_client.close_http_client()
+
+    print(f"{args.invoices} invoices, {args.latency * 1000:.0f} ms agent latency")
+    for name, timing in timings.items():
+        print(f"{name:34} {timing['median_ms'] / args.invoices:8.3f} ms/invoice")
+
+
+if __name__ == "__main__":
+    main()
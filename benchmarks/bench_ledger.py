@@ -0,0 +1,72 @@
+"""Aging and overdue reporting: SQL and pydantic rows versus the columnar ledger snapshot.
+
+    PYTHONPATH=src python -m benchmarks.bench_ledger --sizes 10000 100000 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date
+
+from szamlazz_collections_mcp import ledger, storage
+from szamlazz_collections_mcp.utils import db_connection
+
+from .common import generate_rows, measure, temporary_database
+
+
+def _overdue_via_records(min_days_overdue: int = 1) -> dict:
+    totals: dict = {}
+    for record in storage.iter_overdue(min_days_overdue):
+        totals[record.buyer_email] = totals.get(record.buyer_email, 0.0) + record.gross_total
+    return totals
+
+
+def _run(rows: int, customers: int, repeat: int) -> None:
+    today = date.today()
+    with temporary_database():
+        storage.init_db()
+        with db_connection() as conn:
+            rows_iter = generate_rows(rows, customers, today=today)
+            conn.executemany(storage.UPSERT_INVOICE_SQL, rows_iter)
+            conn.commit()
+        ledger.reset_snapshot()
+
+        start = time.perf_counter()
+        ledger.aging_summary(today=today)
+        load_ms = (time.perf_counter() - start) * 1000
+        timings = {
+            "aging_summary (SQL)": measure(lambda: storage.aging_summary(today=today), repeat),
+            "aging_summary (snapshot)": measure(lambda: ledger.aging_summary(today=today), repeat),
+            "overdue by customer (records)": measure(_overdue_via_records, repeat),
+            "overdue_summary (snapshot)": measure(
+                lambda: ledger.overdue_summary(today=today), repeat
+            ),
+        }
+        first = next(storage.iter_invoices(status="open"))
+        storage.mark_invoice_paid(first.invoice_number, today)
+        start = time.perf_counter()
+        ledger.aging_summary(today=today)
+        refresh_ms = (time.perf_counter() - start) * 1000
+        ledger.reset_snapshot()
+
+    engine = "numpy" if ledger.np is not None else "array"
+    print(f"\n== {rows} invoices ({engine}) ==")
+    print(f"{'snapshot load':32} {load_ms:>10.2f} ms")
+    for name, timing in timings.items():
+        print(f"{name:32} {timing['median_ms']:>10.2f} ms")
+    print(f"{'aging after one write':32} {refresh_ms:>10.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for rows in args.sizes:
+        _run(rows, args.customers, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Cost of the instrumentation layer on its hottest paths, with metrics on and off.
+
+    PYTHONPATH=src python -m benchmarks.bench_metrics --calls 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+from szamlazz_collections_mcp import metrics, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.utils import db_connection
+
+from .common import measure, temporary_database
+
+
+def _point_reads(calls: int) -> None:
+    for _ in range(calls):
+        with db_connection(readonly=True) as conn:
+            conn.execute("SELECT 1 FROM invoices WHERE invoice_number = ?", ("missing",)).fetchone()
+
+
+def _timed_noop(calls: int) -> None:
+    latency = metrics.histogram("bench_noop_seconds", "Benchmark no-op", ["op"])
+    for _ in range(calls):
+        with metrics.timed(latency, None, "noop"):
+            pass
+
+
+def _run(calls: int, repeat: int) -> None:
+    with temporary_database():
+        storage.init_db()
+        for enabled in ("false", "true"):
+            os.environ["METRICS_ENABLED"] = enabled
+            reset_settings()
+            reads = measure(lambda: _point_reads(calls), repeat)["median_ms"]
+            noop = measure(lambda: _timed_noop(calls), repeat)["median_ms"]
+            print(
+                f"metrics={enabled:5}  pooled point read {reads * 1000 / calls:7.2f} us"
+                f"   timed() block {noop * 1000 / calls:7.2f} us"
+            )
+        os.environ.pop("METRICS_ENABLED", None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    _run(args.calls, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
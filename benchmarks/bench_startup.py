@@ -0,0 +1,93 @@
+"""Cold-start cost: import time of the server and its modules, from ``-X importtime``.
+
+    PYTHONPATH=src python -m benchmarks.bench_startup --runs 10
+
+Every run imports the module in a fresh interpreter, so nothing is cached in
+``sys.modules``, and reports the module's cumulative import time as the interpreter
+measures it, without interpreter startup. The heaviest imports of one run are listed,
+and heavy dependencies the import pulled in are flagged: httpx, jinja2, smtplib, NumPy
+and python-dotenv should only load once a tool or the startup hook needs them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, NamedTuple, Optional, Tuple
+
+PACKAGE = "szamlazz_collections_mcp"
+MODULES = (f"{PACKAGE}.server", f"{PACKAGE}.jobs", f"{PACKAGE}.storage", f"{PACKAGE}.cli")
+HEAVY = ("httpx", "jinja2", "smtplib", "numpy", "dotenv", "http.server")
+
+_SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+class ImportRun(NamedTuple):
+    total_ms: float
+    heaviest: List[Tuple[str, float]]  # (module, self ms), largest first
+    heavy_loaded: List[str]
+
+
+def import_once(module: str) -> ImportRun:
+    """Import ``module`` in a fresh interpreter; raises ``ImportError`` if that fails."""
+    code = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps([name for name in {HEAVY!r} if name in sys.modules]))"
+    )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [_SRC, env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env
+    )
+    if proc.returncode != 0:
+        raise ImportError(proc.stderr.strip().splitlines()[-1])
+    total_us = 0
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append((name.strip(), int(self_us) / 1000))
+        # Top-level entries of the package; interpreter startup imports are not counted.
+        if not name[1:].startswith(" ") and name.strip().split(".")[0] == PACKAGE:
+            total_us += int(cumulative_us)
+    heaviest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:10]
+    return ImportRun(total_us / 1000, heaviest, json.loads(proc.stdout))
+
+
+def import_times(module: str, runs: int) -> Tuple[List[float], ImportRun]:
+    samples = []
+    last: Optional[ImportRun] = None
+    for _ in range(runs):
+        last = import_once(module)
+        samples.append(last.total_ms)
+    return samples, last
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            samples, last = import_times(module, args.runs)
+        except ImportError as exc:
+            print(f"{module}: cannot be imported ({exc})")
+            continue
+        print(
+            f"{module}: median {statistics.median(samples):.1f} ms, "
+            f"min {min(samples):.1f} ms over {args.runs} runs"
+        )
+        print(f"  heavy modules loaded: {', '.join(last.heavy_loaded) or 'none'}")
+        for name, self_ms in last.heaviest:
+            print(f"  {self_ms:8.2f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Throughput of build_xml and render_reminder with cached versus per-call environments.
+
+    PYTHONPATH=src python -m benchmarks.bench_templates --iterations 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import date, datetime
+
+from jinja2 import Environment, FileSystemLoader
+
+from szamlazz_collections_mcp import templating
+from szamlazz_collections_mcp.emailer import render_reminder
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.szamlazz_client import build_xml
+
+from .common import measure
+
+INVOICE_DATA = {
+    "agent_key": "key",
+    "buyer": {
+        "name": "Teszt Kft.",
+        "country": "HU",
+        "zip": "1011",
+        "city": "Budapest",
+        "address": "Fo ut 1",
+        "email": "teszt@example.com",
+        "tax_number": "12345678-2-41",
+        "identifier": None,
+    },
+    "items": [
+        {
+            "name": f"Item {i}",
+            "quantity": 1,
+            "net_unit_price": 1000,
+            "vat_rate": 27,
+            "net_value": 1000,
+            "vat_value": 270,
+            "gross_value": 1270,
+            "comment": None,
+        }
+        for i in range(10)
+    ],
+    "payment_method": "átutalás",
+    "currency": "HUF",
+    "issue_date": "2024-01-01",
+    "due_date": "2024-01-09",
+    "invoice_language": "hu",
+    "comment": None,
+    "order_number": None,
+    "external_id": None,
+    "username": None,
+    "password": None,
+}
+
+RECORD = InvoiceRecord(
+    invoice_number="E-BENCH-1",
+    buyer_name="Teszt Kft.",
+    buyer_email="teszt@example.com",
+    issue_date=date(2024, 1, 1),
+    due_date=date(2024, 1, 9),
+    gross_total=12700.0,
+    currency="HUF",
+    status="open",
+    created_at=datetime(2024, 1, 1),
+    last_reminded_at=None,
+    reminders_sent_count=0,
+)
+
+
+def _uncached_build_xml() -> str:
+    kind = "xml"
+    env = Environment(
+        loader=FileSystemLoader(templating.TEMPLATE_DIRS[kind]),
+        **templating._environment_options(kind),
+    )
+    return env.get_template("generate_invoice.xml.j2").render(**INVOICE_DATA)
+
+
+def _uncached_render_reminder() -> str:
+    env = Environment(
+        loader=FileSystemLoader(templating.TEMPLATE_DIRS["reminder"]), autoescape=False
+    )
+    return env.get_template("reminder_hu.txt.j2").render(
+        buyer_name=RECORD.buyer_name,
+        invoice_number=RECORD.invoice_number,
+        due_date=RECORD.due_date,
+        amount=RECORD.gross_total,
+        tone="polite",
+    )
+
+
+def _rate(func, iterations: int, repeat: int) -> float:
+    def batch():
+        for _ in range(iterations):
+            func()
+
+    return iterations / (measure(batch, repeat=repeat)["median_ms"] / 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    templating.warm_templates()
+    cases = {
+        "build_xml per-call env": _uncached_build_xml,
+        "build_xml cached env": lambda: build_xml("generate_invoice.xml.j2", INVOICE_DATA),
+        "render_reminder per-call env": _uncached_render_reminder,
+        "render_reminder cached env": lambda: render_reminder(RECORD),
+    }
+    for name, func in cases.items():
+        iterations = max(1, args.iterations // 20) if "per-call" in name else args.iterations
+        print(f"{name:30} {_rate(func, iterations, args.repeat):>12,.0f} renders/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Shared helpers for the benchmark scripts.
+
+Run the scripts from the repository root with ``src`` on the path, e.g.
+``PYTHONPATH=src python -m benchmarks.bench_indexes``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.utils import close_pool
+
+
+def generate_rows(
+    count: int, customers: int = 1000, seed: int = 42, today: Optional[date] = None
+) -> Iterator[Tuple]:
+    """Yield ``invoices`` rows in ``UPSERT_INVOICE_SQL`` parameter order."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    created_at = datetime.utcnow()
+    for index in range(count):
+        customer = rng.randrange(customers)
+        issue_date = today - timedelta(days=rng.randrange(0, 730))
+        due_date = issue_date + timedelta(days=rng.choice((8, 15, 30, 45)))
+        status = "open" if rng.random() < 0.3 or due_date > today else "paid"
+        yield (
+            f"BENCH-{index:08d}",
+            f"Customer {customer}",
+            f"customer{customer}@example.com",
+            issue_date,
+            due_date,
+            round(rng.uniform(1_000, 2_000_000), 2),
+            "HUF",
+            status,
+            created_at,
+            None,
+            0,
+            f"order-{index}",
+        )
+
+
+@contextmanager
+def temporary_database(name: str = "bench.db") -> Iterator[str]:
+    """Point ``DB_PATH`` at a throwaway database for the duration of the block."""
+    previous = os.environ.get("DB_PATH")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, name)
+        os.environ["DB_PATH"] = db_path
+        reset_settings()
+        try:
+            yield db_path
+        finally:
+            close_pool()
+            if previous is None:
+                os.environ.pop("DB_PATH", None)
+            else:
+                os.environ["DB_PATH"] = previous
+            reset_settings()
+
+
+def measure(func: Callable[[], object], repeat: int = 5) -> Dict[str, float]:
+    """Run ``func`` ``repeat`` times and return min/median wall time in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": round(min(samples), 3), "median_ms": round(statistics.median(samples), 3)}
+
+
+_AGENT_RESPONSES = {
+    b"action-xmlagentxmlfile": (
+        b"<xmlszamlavalasz><szamlaszam>E-BENCH-1</szamlaszam></xmlszamlavalasz>"
+    ),
+    b"action-szamla_agent_pdf": b"%PDF-1.4\n" + b"0" * 64_000 + b"\n%%EOF\n",
+    b"action-szamla_agent_xml": b"<szamla><szamlaszam>E-BENCH-1</szamlaszam></szamla>",
+    b"action-szamla_agent_kifiz": b"DONE",
+}
+
+
+@contextmanager
+def local_agent(latency: float = 0.0) -> Iterator[str]:
+    """Serve canned agent responses on localhost, optionally delayed by ``latency`` seconds."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            payload = next(
+                (value for key, value in _AGENT_RESPONSES.items() if key in body), b"DONE"
+            )
+            if latency:
+                time.sleep(latency)
+            self.send_response(200)
+            content_type = "application/pdf" if payload.startswith(b"%PDF") else "text/xml"
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/szamla/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def local_smtp() -> Iterator[Dict[str, str]]:
+    """Accept and discard mail on localhost; yields the ``SMTP_*`` settings to use.
+
+    Needs ``aiosmtpd`` from the ``dev`` extra.
+    """
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+
+    # aiosmtpd logs a deprecation warning on every AUTH.
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+    class Sink:
+        async def handle_DATA(self, server, session, envelope):
+            return "250 Message accepted for delivery"
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    controller = Controller(
+        Sink(),
+        hostname="127.0.0.1",
+        port=port,
+        authenticator=lambda *args: AuthResult(success=True),
+        auth_require_tls=False,
+    )
+    controller.start()
+    try:
+        yield {
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(port),
+            "SMTP_USER": "bench",
+            "SMTP_PASSWORD": "bench",
+            "SMTP_FROM": "bench@example.com",
+            "SMTP_STARTTLS": "false",
+        }
+    finally:
+        controller.stop()
@@ -0,0 +1,170 @@
+"""Synthetic ledgers with realistic customer, due-date and status distributions.
+
+    PYTHONPATH=src python -m benchmarks.datagen --invoices 100000 --customers 5000 \\
+        --output ledger.jsonl
+
+The output loads with ``szamlazz-collections import-invoices``. Generation is seeded,
+so the same arguments (including ``--today``) always produce the same ledger:
+
+- customer activity is Zipf-like: a few customers hold most invoices;
+- issue dates span two years and thicken towards today, as a growing business's would;
+- each customer has fixed payment terms, a currency and a typical payment delay, and a
+  small share of invoices is never paid, so old debt is rare but present;
+- amounts are log-normal around 100 000 HUF, converted for EUR and USD customers;
+- open overdue invoices carry a reminder every two weeks, up to five.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import math
+import random
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from typing import Iterator, List, Optional, Tuple
+
+from szamlazz_collections_mcp.models import InvoiceRecord
+
+HISTORY_DAYS = 730
+TERMS = ((8, 0.3), (15, 0.3), (30, 0.3), (45, 0.1))
+CURRENCIES = (("HUF", 1.0, 0.85), ("EUR", 395.0, 0.12), ("USD", 365.0, 0.03))
+NEVER_PAID = 0.02
+
+FIELDS = (
+    "invoice_number",
+    "buyer_name",
+    "buyer_email",
+    "issue_date",
+    "due_date",
+    "gross_total",
+    "currency",
+    "status",
+    "created_at",
+    "last_reminded_at",
+    "reminders_sent_count",
+    "external_id",
+)
+
+
+@dataclass(frozen=True)
+class Customer:
+    name: str
+    email: str
+    terms: int
+    currency: str
+    huf_rate: float
+    mean_delay: float
+
+
+def _weighted(rng: random.Random, options) -> tuple:
+    return rng.choices([option[:-1] for option in options], [option[-1] for option in options])[0]
+
+
+def make_customers(count: int, rng: random.Random) -> List[Customer]:
+    customers = []
+    for index in range(count):
+        (terms,) = _weighted(rng, TERMS)
+        currency, huf_rate = _weighted(rng, CURRENCIES)
+        # Most customers pay within days of the due date, a long tail pays months late.
+        mean_delay = rng.lognormvariate(math.log(6), 1.0)
+        customers.append(
+            Customer(
+                f"Customer {index}",
+                f"customer{index}@example.com",
+                terms,
+                currency,
+                huf_rate,
+                mean_delay,
+            )
+        )
+    return customers
+
+
+def generate_rows(
+    count: int, customers: int = 1000, seed: int = 42, today: Optional[date] = None
+) -> Iterator[Tuple]:
+    """Yield ``invoices`` rows in ``UPSERT_INVOICE_SQL`` parameter order."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    pool = make_customers(customers, rng)
+    cumulative = list(accumulate(1.0 / (rank + 1) ** 1.1 for rank in range(customers)))
+    for index in range(count):
+        customer = pool[bisect_left(cumulative, rng.random() * cumulative[-1])]
+        issue_date = today - timedelta(days=int(rng.triangular(0, HISTORY_DAYS, 0)))
+        due_date = issue_date + timedelta(days=customer.terms)
+        # Recorded when issued, so the rows depend on ``today`` and not on the clock.
+        created_at = datetime.combine(issue_date, datetime.min.time())
+        if rng.random() < NEVER_PAID:
+            paid = False
+        else:
+            delay = rng.expovariate(1.0 / customer.mean_delay) - customer.terms * 0.2
+            paid = due_date + timedelta(days=delay) <= today
+        days_overdue = (today - due_date).days
+        reminders = 0 if paid or days_overdue <= 0 else min(5, days_overdue // 14 + 1)
+        reminded_at = None
+        if reminders:
+            reminded_on = due_date + timedelta(days=1 + 14 * (reminders - 1))
+            reminded_at = datetime.combine(reminded_on, datetime.min.time())
+        amount = round(rng.lognormvariate(math.log(100_000), 1.1) / customer.huf_rate, 2)
+        yield (
+            f"SYN-{index:08d}",
+            customer.name,
+            customer.email,
+            issue_date,
+            due_date,
+            amount,
+            customer.currency,
+            "paid" if paid else "open",
+            created_at,
+            reminded_at,
+            reminders,
+            f"order-{index}",
+        )
+
+
+def generate_invoices(
+    count: int, customers: int = 1000, seed: int = 42, today: Optional[date] = None
+) -> Iterator[InvoiceRecord]:
+    for row in generate_rows(count, customers, seed, today):
+        yield InvoiceRecord(**dict(zip(FIELDS, row, strict=True)))
+
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def write_file(
+    path: str, count: int, customers: int, seed: int, today: Optional[date] = None
+) -> None:
+    rows = generate_rows(count, customers, seed, today)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for row in rows:
+                writer.writerow(["" if value is None else _serialize(value) for value in row])
+        else:
+            for row in rows:
+                record = {key: _serialize(value) for key, value in zip(FIELDS, row, strict=True)}
+                f.write(json.dumps(record) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--invoices", type=int, default=100_000)
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--output", required=True, help="a .csv or .jsonl path")
+    args = parser.parse_args()
+    write_file(args.output, args.invoices, args.customers, args.seed, args.today)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""Reproducible benchmark suite: storage, templates, upstream calls, MCP tools, startup.
+
+    PYTHONPATH=src python -m benchmarks.suite --invoices 100000 --customers 5000 \\
+        --output bench-results.json --baseline previous.json
+
+Every storage function runs against a seeded synthetic ledger (see ``datagen``);
+szamlazz.hu and SMTP are replaced by local stand-ins, and the MCP tools are called end
+to end through an in-process client; startup is the import time of the server and its
+core modules in a fresh interpreter. Timings are written as JSON, per operation. With
+``--baseline`` each median is compared to an earlier run and the command exits
+non-zero when any operation slowed down by more than ``--threshold``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from szamlazz_collections_mcp import fx, ledger, metrics, services, storage, szamlazz_client
+from szamlazz_collections_mcp.campaigns import run_reminder_campaign
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.emailer import render_reminder, send_batch, send_email
+from szamlazz_collections_mcp.models import InvoiceCreate
+from szamlazz_collections_mcp.szamlazz_client import build_xml
+from szamlazz_collections_mcp.utils import shutdown_executor
+
+from .bench_startup import MODULES as STARTUP_MODULES
+from .bench_startup import import_times
+from .bench_templates import INVOICE_DATA, RECORD
+from .common import local_agent, local_smtp, temporary_database
+from .datagen import generate_invoices
+
+GROUPS = ("storage", "templates", "upstream", "tools", "startup")
+
+
+class Suite:
+    def __init__(self, repeat: int) -> None:
+        self.repeat = repeat
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.skipped: Dict[str, str] = {}
+
+    def record(self, name: str, samples_ms: List[float], ops: int = 1) -> None:
+        per_op = [sample / ops for sample in samples_ms]
+        self.results[name] = {
+            "ops": ops,
+            "runs": len(per_op),
+            "min_ms": round(min(per_op), 6),
+            "median_ms": round(statistics.median(per_op), 6),
+            "max_ms": round(max(per_op), 6),
+        }
+        print(f"{name:58} {self.results[name]['median_ms']:>12.4f} ms/op  (x{ops})")
+
+    def time(
+        self, name: str, func: Callable[[], object], ops: int = 1, repeat: Optional[int] = None
+    ) -> None:
+        """Time ``func`` (which performs ``ops`` operations) after one untimed warm-up run.
+
+        One-shot measurements (``repeat=1``) such as bulk loads are not warmed up.
+        """
+        repeat = repeat or self.repeat
+        if repeat > 1:
+            func()
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        self.record(name, samples, ops)
+
+    def skip(self, group: str, reason: str) -> None:
+        self.skipped[group] = reason
+        print(f"-- skipped {group}: {reason}")
+
+
+@contextmanager
+def _env(**values: str) -> Iterator[None]:
+    previous = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    reset_settings()
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        reset_settings()
+
+
+def _write_fx_csv(path: str, today: date) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Dátum/ISO;EUR;USD\n")
+        for offset in range(60, -1, -1):
+            day = today - timedelta(days=offset)
+            f.write(f"{day:%Y.%m.%d.};{395 + offset % 7},00;{365 + offset % 5},50\n")
+
+
+def bench_storage(suite: Suite, invoices: int, customers: int, seed: int, today: date) -> None:
+    records = list(generate_invoices(invoices, customers, seed, today))
+    suite.time("storage.init_db", storage.init_db, repeat=1)
+    suite.time(
+        "storage.bulk_insert_invoices",
+        lambda: storage.bulk_insert_invoices(records),
+        len(records),
+        1,
+    )
+    suite.time(
+        "storage.bulk_insert_invoices (update)",
+        lambda: storage.bulk_insert_invoices(records),
+        len(records),
+        1,
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rates = os.path.join(tmpdir, "rates.csv")
+        _write_fx_csv(rates, today)
+        suite.time("fx.load_fx_rates", lambda: fx.load_fx_rates(rates), repeat=1)
+
+    sample = records[:: max(1, len(records) // 500)]
+    open_numbers = [r.invoice_number for r in records if r.status == "open"][:500]
+    emails = [r.buyer_email for r in sample]
+    top_customer = max(set(emails), key=emails.count)
+    numbers = [r.invoice_number for r in sample]
+    external_ids = [r.external_id for r in sample]
+
+    reads: Dict[str, Callable[[], object]] = {
+        "storage.list_invoices_page": lambda: storage.list_invoices_page(),
+        "storage.list_invoices_page (customer)": lambda: storage.list_invoices_page(
+            customer_email=top_customer
+        ),
+        "storage.list_invoices_page (open, due_before)": lambda: storage.list_invoices_page(
+            status="open", due_before=today
+        ),
+        "storage.list_invoices_page (include_totals)": lambda: storage.list_invoices_page(
+            status="open", include_totals=True
+        ),
+        "storage.list_overdue_page": lambda: storage.list_overdue_page(),
+        "storage.list_overdue_page (include_totals)": lambda: storage.list_overdue_page(
+            include_totals=True
+        ),
+        "storage.list_overdue": lambda: storage.list_overdue(),
+        "storage.list_invoices (customer)": lambda: storage.list_invoices(
+            customer_email=top_customer
+        ),
+        "storage.list_reminder_candidates": lambda: storage.list_reminder_candidates(limit=500),
+        "storage.aging_summary": lambda: storage.aging_summary(today=today),
+        "storage.customer_summary": lambda: storage.customer_summary(top_customer, today=today),
+        "storage.top_debtors": lambda: storage.top_debtors(today=today),
+        "ledger.aging_summary": lambda: ledger.aging_summary(today=today),
+        "ledger.overdue_summary": lambda: ledger.overdue_summary(today=today),
+    }
+    for name, func in reads.items():
+        suite.time(name, func)
+    suite.time(
+        "storage.iter_invoices (full scan)",
+        lambda: sum(1 for _ in storage.iter_invoices()),
+        len(records),
+    )
+    suite.time(
+        "storage.get_invoice", lambda: [storage.get_invoice(n) for n in numbers], len(numbers)
+    )
+    suite.time(
+        "storage.get_invoice_by_external_id",
+        lambda: [storage.get_invoice_by_external_id(e) for e in external_ids],
+        len(external_ids),
+    )
+
+    new_records = [
+        record.model_copy(update={"invoice_number": f"NEW-{index:06d}"})
+        for index, record in enumerate(sample)
+    ]
+    suite.time(
+        "storage.insert_invoice",
+        lambda: [storage.insert_invoice(record) for record in new_records],
+        len(new_records),
+    )
+    suite.time(
+        "storage.update_reminder_metadata",
+        lambda: [storage.update_reminder_metadata(n) for n in open_numbers[:200]],
+        len(open_numbers[:200]),
+    )
+    suite.time(
+        "storage.update_reminder_metadata_many",
+        lambda: storage.update_reminder_metadata_many(open_numbers),
+        len(open_numbers),
+    )
+    suite.time(
+        "storage.mark_invoice_paid",
+        lambda: [storage.mark_invoice_paid(n, today) for n in open_numbers[:200]],
+        len(open_numbers[:200]),
+    )
+    with _env(AGING_ROLLUP="true"):
+        suite.time("storage.init_db (build aging rollup)", storage.init_db, repeat=1)
+        suite.time("storage.aging_summary (rollup)", lambda: storage.aging_summary(today=today))
+        storage.init_db()
+    storage.init_db()
+    ledger.reset_snapshot()
+
+
+def bench_templates(suite: Suite, iterations: int) -> None:
+    payload = InvoiceCreate.model_validate(INVOICE_DATA).model_dump()
+    cases: Dict[str, Callable[[], object]] = {
+        "templates.build_xml (generate_invoice)": lambda: build_xml(
+            "generate_invoice.xml.j2", INVOICE_DATA
+        ),
+        "templates.generate_invoice request": lambda: szamlazz_client._generate_invoice_request(
+            payload
+        ),
+        "templates.query_invoice_pdf request": lambda: szamlazz_client._query_pdf_request(
+            "E-BENCH-1"
+        ),
+        "templates.query_invoice_xml request": lambda: szamlazz_client._query_xml_request(
+            "E-BENCH-1"
+        ),
+        "templates.register_payment request": lambda: szamlazz_client._register_payment_request(
+            "E-BENCH-1", "2024-01-10", 1270.0, "HUF"
+        ),
+        "templates.render_reminder (hu)": lambda: render_reminder(RECORD, "hu"),
+        "templates.render_reminder (en, firm)": lambda: render_reminder(RECORD, "en", "firm"),
+    }
+    for name, func in cases.items():
+        suite.time(name, lambda func=func: [func() for _ in range(iterations)], iterations)
+
+
+def bench_upstream(suite: Suite, calls: int, today: date) -> None:
+    invoice = InvoiceCreate.model_validate(INVOICE_DATA)
+    with local_agent() as url, tempfile.TemporaryDirectory() as tmpdir, _env(
+        SZAMLAZZ_BASE_URL=url, SZAMLAZZ_AGENT_KEY="bench", PDF_CACHE_DIR=tmpdir
+    ):
+        szamlazz_client.close_http_client()
+        counter = iter(range(10**9))
+        suite.time(
+            "upstream.create_invoice",
+            lambda: [
+                services.create_invoice(
+                    invoice.model_copy(update={"external_id": f"bench-{next(counter)}"})
+                )
+                for _ in range(calls)
+            ],
+            calls,
+        )
+        suite.time(
+            "upstream.query_invoice_xml",
+            lambda: [szamlazz_client.query_invoice_xml("E-BENCH-1") for _ in range(calls)],
+            calls,
+        )
+        suite.time(
+            "upstream.query_invoice_pdf (download)",
+            lambda: [
+                szamlazz_client.query_invoice_pdf("E-BENCH-1", save=False, refresh=True)
+                for _ in range(calls)
+            ],
+            calls,
+        )
+        suite.time(
+            "upstream.query_invoice_pdf (cached)",
+            lambda: [
+                szamlazz_client.query_invoice_pdf("E-BENCH-1", save=False) for _ in range(calls)
+            ],
+            calls,
+        )
+        suite.time(
+            "upstream.register_payment",
+            lambda: [
+                services.register_payment_remote("E-BENCH-1", today, 1270.0) for _ in range(calls)
+            ],
+            calls,
+        )
+        szamlazz_client.close_http_client()
+
+    try:
+        smtp = local_smtp()
+        settings = smtp.__enter__()
+    except ImportError as exc:
+        suite.skip("upstream.smtp", f"aiosmtpd is not installed ({exc})")
+        return
+    try:
+        with _env(**settings):
+            draft = render_reminder(RECORD, "hu")
+            messages = [(f"buyer{i}@example.com", draft) for i in range(calls)]
+            suite.time(
+                "upstream.send_email (session per message)",
+                lambda: [send_email(to, draft) for to, _ in messages],
+                calls,
+            )
+            suite.time(
+                "upstream.send_batch (2 sessions)",
+                lambda: send_batch(messages, sessions=2),
+                calls,
+            )
+            suite.time(
+                "upstream.run_reminder_campaign (dry run)",
+                lambda: run_reminder_campaign(limit=calls, dry_run=True),
+            )
+    finally:
+        smtp.__exit__(None, None, None)
+
+
+def bench_tools(suite: Suite, today: date) -> None:
+    try:
+        from fastmcp import Client
+
+        from szamlazz_collections_mcp import server
+    except ImportError as exc:
+        suite.skip("tools", f"the MCP server cannot be imported ({exc})")
+        return
+
+    open_invoice = next(storage.iter_invoices(status="open"), None)
+    top = storage.top_debtors(limit=1, today=today)
+    calls: Dict[str, Dict[str, Any]] = {
+        "health_check": {},
+        "list_invoices_tool": {"limit": 100},
+        "list_overdue_invoices": {"limit": 100, "include_totals": True},
+        "aging_summary_tool": {},
+        "overdue_summary": {},
+        "top_debtors_tool": {"limit": 10},
+    }
+    if top:
+        calls["customer_summary_tool"] = {"buyer_email": top[0]["buyer_email"]}
+    if open_invoice is not None:
+        calls["generate_reminder_email"] = {"invoice_number": open_invoice.invoice_number}
+
+    async def run() -> None:
+        async with Client(server.app) as client:
+            for name, arguments in calls.items():
+                samples = []
+                for _ in range(suite.repeat):
+                    start = time.perf_counter()
+                    await client.call_tool(name, arguments)
+                    samples.append((time.perf_counter() - start) * 1000)
+                suite.record(f"tools.{name}", samples)
+
+    asyncio.run(run())
+    shutdown_executor()
+
+
+def bench_startup(suite: Suite) -> None:
+    for module in STARTUP_MODULES:
+        try:
+            samples, last = import_times(module, suite.repeat)
+        except ImportError as exc:
+            suite.skip(f"startup ({module})", str(exc))
+            continue
+        suite.record(f"startup.import {module}", samples)
+        if last.heavy_loaded:
+            print(f"   {module} loaded {', '.join(last.heavy_loaded)} on import")
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline_path: str, threshold: float) -> List[str]:
+    """Print median ratios against ``baseline_path``; return the regressed operations."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\n== compared with {baseline_path} ==")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before or not before["median_ms"]:
+            continue
+        ratio = current["median_ms"] / before["median_ms"]
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:58} {ratio:>7.2f}x{flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--invoices", type=int, default=100_000)
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=1_000, help="template renders per run")
+    parser.add_argument("--calls", type=int, default=50, help="upstream calls per run")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio to flag")
+    args = parser.parse_args(argv)
+
+    suite = Suite(args.repeat)
+    # Pin the date, so the same seed always yields the same ledger and report buckets.
+    today = date(2025, 1, 15)
+    metrics_was = os.environ.get("METRICS_ENABLED")
+    with temporary_database():
+        if "storage" in args.only or "tools" in args.only:
+            bench_storage(suite, args.invoices, args.customers, args.seed, today)
+        if "templates" in args.only:
+            bench_templates(suite, args.iterations)
+        if "upstream" in args.only:
+            storage.init_db()
+            bench_upstream(suite, args.calls, today)
+        if "tools" in args.only:
+            bench_tools(suite, today)
+        ledger.reset_snapshot()
+    if "startup" in args.only:
+        bench_startup(suite)
+    if metrics_was is None:
+        metrics.reset()
+
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+            "numpy": ledger.np is not None,
+            "args": vars(args),
+        },
+        "skipped": suite.skipped,
+        "results": suite.results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"\nWrote {len(suite.results)} timings to {args.output}")
+
+    if args.baseline:
+        regressions = compare(suite.results, args.baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} operation(s) slower than {args.threshold}x the baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,30 @@
 """Számlázz.hu Collections MCP server package."""
 
 __all__ = [
+    "agent_guard",
+    "campaigns",
+    "cli",
     "config",
     "server",
+    "ledger",
+    "metrics",
     "models",
+    "pdf_cache",
+    "result_cache",
     "storage",
+    "cron",
+    "dunning",
     "emailer",
+    "exporter",
+    "fx",
+    "idempotency",
+    "importer",
+    "invoice_batch",
+    "jobs",
+    "services",
+    "sync",
     "szamlazz_client",
+    "szamlazz_async_client",
+    "templating",
     "utils",
 ]
@@ -0,0 +1,428 @@
+"""Client-side flow control for Számlázz.hu Agent API calls.
+
+Every attempt made by :mod:`szamlazz_client` or :mod:`szamlazz_async_client` passes
+through one process-wide :class:`AgentGuard`, which combines three mechanisms:
+
+* a token bucket holding calls to ``SZAMLAZZ_RATE_PER_SECOND`` (bursts of
+  ``SZAMLAZZ_RATE_BURST``), paused for as long as a 429 response's ``Retry-After`` asks;
+* a concurrency limit that adapts to the latency szamlazz.hu shows: it grows by one
+  slot per limit's worth of fast answers, up to ``SZAMLAZZ_MAX_CONNECTIONS``, and halves
+  when an answer takes longer than ``SZAMLAZZ_LATENCY_TARGET`` or reports overload. A
+  call that waits ``SZAMLAZZ_TIMEOUT`` for a slot is rejected;
+* a circuit breaker that opens after ``SZAMLAZZ_BREAKER_FAILURES`` consecutive failures
+  (429, 5xx, or no response at all) and rejects calls immediately for
+  ``SZAMLAZZ_BREAKER_COOLDOWN`` seconds. One probe call is then let through; its
+  outcome closes the circuit or opens it again.
+
+Rejected calls raise :class:`AgentUnavailable` before anything is sent, so they are
+safe to retry for every action; the rate token they took is given back.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from . import metrics
+from .config import get_settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_REJECTED = metrics.counter(
+    "szamlazz_rejected_total", "szamlazz.hu calls refused before sending", ["reason"]
+)
+_CIRCUIT_CHANGES = metrics.counter(
+    "szamlazz_circuit_transitions_total", "Circuit breaker state changes", ["state"]
+)
+
+
+class AgentUnavailable(RuntimeError):
+    """The call was refused without contacting szamlazz.hu."""
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    # Only the delay-seconds form; an HTTP date is rare from szamlazz.hu and ignored.
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class Clock:
+    """Time source of an :class:`AgentGuard`; tests pass one they advance by hand."""
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class _Waiter:
+    """A caller queued for a concurrency slot; ``wake`` is called once one is handed over."""
+
+    def __init__(self, wake: Callable[[], None]) -> None:
+        self.wake = wake
+        self.granted = False
+
+
+class Attempt:
+    """One call through the guard; report its response with :meth:`record`."""
+
+    def __init__(self, guard: AgentGuard) -> None:
+        self.guard = guard
+        self.probe = False
+        self.started = 0.0
+        self.recorded = False
+
+    def record(self, status_code: int, retry_after: Optional[str] = None) -> None:
+        """Report the response status, once its headers have arrived."""
+        if not self.recorded:
+            self.recorded = True
+            self.guard._sample(self, status_code, _retry_after(retry_after))
+
+
+class AgentGuard:
+    def __init__(
+        self,
+        rate_per_second: Optional[float] = None,
+        burst: int = 5,
+        max_concurrency: int = 10,
+        latency_target: float = 5.0,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        queue_timeout: Optional[float] = None,
+        clock: Optional[Clock] = None,
+    ) -> None:
+        self.rate = rate_per_second if rate_per_second and rate_per_second > 0 else None
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.latency_target = latency_target
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.queue_timeout = queue_timeout
+        self._clock = clock or Clock()
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refilled_at = self._clock.monotonic()
+        self._paused_until = 0.0
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._decreased_at = 0.0
+        self._latency: Optional[float] = None
+        self._state = CLOSED
+        self._failures = 0
+        self._retry_at = 0.0
+        self._probing = False
+
+    # Circuit breaker
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            self._state = state
+            metrics.inc(_CIRCUIT_CHANGES, state)
+
+    def _check_circuit(self, attempt: Attempt, now: float) -> None:
+        if attempt.probe:
+            return
+        if self._state == OPEN and now >= self._retry_at:
+            self._set_state(HALF_OPEN)
+        if self._state == HALF_OPEN and not self._probing:
+            self._probing = attempt.probe = True
+            return
+        if self._state != CLOSED:
+            metrics.inc(_REJECTED, "circuit_open")
+            retry_in = max(0.0, self._retry_at - now)
+            raise AgentUnavailable(
+                f"szamlazz.hu circuit is {self._state} after {self._failures} failures; "
+                f"retry in {retry_in:.0f}s"
+            )
+
+    def _open(self, now: float) -> None:
+        self._set_state(OPEN)
+        self._retry_at = now + self.cooldown
+
+    # Token bucket
+
+    def _reserve(self, now: float) -> float:
+        """Take a token; returns how long the caller must wait before sending."""
+        ready = now
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                ready = now - self._tokens / self.rate
+        return max(ready, self._paused_until) - now
+
+    def _refund(self) -> None:
+        """Give back the token of a call that was refused or abandoned before sending."""
+        if self.rate is not None:
+            self._tokens = min(float(self.burst), self._tokens + 1)
+
+    def _pause_remaining(self) -> float:
+        with self._lock:
+            return self._paused_until - self._clock.monotonic()
+
+    # Concurrency limit
+
+    def _capacity(self) -> int:
+        return max(1, int(self._limit))
+
+    def _try_acquire(self, waiter: _Waiter) -> bool:
+        if not self._waiters and self._in_flight < self._capacity():
+            self._in_flight += 1
+            return True
+        self._waiters.append(waiter)
+        return False
+
+    def _dispatch(self) -> None:
+        while self._waiters and self._in_flight < self._capacity():
+            waiter = self._waiters.popleft()
+            self._in_flight += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Stop waiting for a slot; False if one was handed over in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+        return True
+
+    def _queue_timeout_error(self) -> AgentUnavailable:
+        metrics.inc(_REJECTED, "queue_timeout")
+        return AgentUnavailable(
+            f"No szamlazz.hu call slot freed up within {self.queue_timeout:.0f}s "
+            f"({self._in_flight} in flight, limit {self._capacity()})"
+        )
+
+    def _started(self, attempt: Attempt) -> None:
+        with self._lock:
+            try:
+                self._check_circuit(attempt, self._clock.monotonic())
+            except AgentUnavailable:
+                self._refund()
+                self._release_slot(attempt)
+                raise
+        attempt.started = self._clock.monotonic()
+
+    def _sample(
+        self, attempt: Attempt, status_code: Optional[int], retry_after: Optional[float]
+    ) -> None:
+        now = self._clock.monotonic()
+        latency = now - attempt.started
+        overloaded = status_code is None or status_code == 429 or status_code >= 500
+        with self._lock:
+            if status_code is not None:
+                previous = latency if self._latency is None else self._latency
+                self._latency = 0.8 * previous + 0.2 * latency
+            if status_code == 429 and retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # Halve at most once per round of calls: those started before the last
+            # decrease saw the old limit and say nothing about the new one.
+            if overloaded or latency > self.latency_target:
+                if attempt.started >= self._decreased_at:
+                    self._limit = max(1.0, self._limit / 2)
+                    self._decreased_at = now
+            else:
+                self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+            if attempt.probe:
+                self._probing = False
+            if overloaded:
+                self._failures += 1
+                if attempt.probe or (
+                    self.failure_threshold > 0 and self._failures >= self.failure_threshold
+                ):
+                    self._open(now)
+            else:
+                self._failures = 0
+                self._set_state(CLOSED)
+
+    def _unprobe(self, attempt: Attempt) -> None:
+        if attempt.probe and not attempt.recorded:
+            # The probe ended without an answer to judge by; let the next call probe.
+            self._probing = False
+            attempt.probe = False
+
+    def _release_slot(self, attempt: Attempt) -> None:
+        self._unprobe(attempt)
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _withdraw(self, attempt: Attempt, holds_slot: bool) -> None:
+        """Undo the admission of a call that ends before it was sent."""
+        with self._lock:
+            self._refund()
+            if holds_slot:
+                self._release_slot(attempt)
+            else:
+                self._unprobe(attempt)
+
+    def _finish(self, attempt: Attempt, exc: Optional[BaseException]) -> None:
+        # An error before any response arrived means szamlazz.hu did not answer; a
+        # cancellation or interrupt says nothing about its health.
+        if not attempt.recorded and isinstance(exc, Exception):
+            attempt.recorded = True
+            self._sample(attempt, None, None)
+        with self._lock:
+            self._release_slot(attempt)
+
+    def _admit(self) -> Tuple[Attempt, float]:
+        attempt = Attempt(self)
+        with self._lock:
+            now = self._clock.monotonic()
+            self._check_circuit(attempt, now)
+            delay = self._reserve(now)
+        return attempt, delay
+
+    @contextmanager
+    def attempt(self) -> Iterator[Attempt]:
+        """Hold a call slot for one request; blocks while throttled."""
+        attempt, delay = self._admit()
+        acquired = False
+        try:
+            if delay > 0:
+                self._clock.sleep(delay)
+            event = threading.Event()
+            waiter = _Waiter(event.set)
+            with self._lock:
+                acquired = self._try_acquire(waiter)
+            if not acquired:
+                acquired = event.wait(self.queue_timeout) or not self._abandon(waiter)
+                if not acquired:
+                    raise self._queue_timeout_error()
+            # A 429 answered while this call waited for its slot pauses it as well.
+            while (pause := self._pause_remaining()) > 0:
+                self._clock.sleep(pause)
+        except BaseException:
+            self._withdraw(attempt, acquired)
+            raise
+        self._started(attempt)
+        try:
+            yield attempt
+        except BaseException as exc:
+            self._finish(attempt, exc)
+            raise
+        self._finish(attempt, None)
+
+    @asynccontextmanager
+    async def attempt_async(self) -> AsyncIterator[Attempt]:
+        """:meth:`attempt` for coroutines: waiting suspends instead of blocking."""
+        attempt, delay = self._admit()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = _Waiter(wake)
+        acquired = False
+        try:
+            if delay > 0:
+                await self._clock.sleep_async(delay)
+            with self._lock:
+                acquired = self._try_acquire(waiter)
+            if not acquired:
+                try:
+                    await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+                except TimeoutError:
+                    if self._abandon(waiter):
+                        raise self._queue_timeout_error() from None
+                except asyncio.CancelledError:
+                    # Cancelled just as a slot was handed over: it is passed on below.
+                    acquired = not self._abandon(waiter)
+                    raise
+                acquired = True
+            while (pause := self._pause_remaining()) > 0:
+                await self._clock.sleep_async(pause)
+        except BaseException:
+            self._withdraw(attempt, acquired)
+            raise
+        self._started(attempt)
+        try:
+            yield attempt
+        except BaseException as exc:
+            self._finish(attempt, exc)
+            raise
+        self._finish(attempt, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self._clock.monotonic()
+            tokens = self._tokens
+            if self.rate is not None:
+                tokens = min(self.burst, tokens + (now - self._refilled_at) * self.rate)
+            return {
+                "circuit": {
+                    "state": self._state,
+                    "consecutive_failures": self._failures,
+                    "failure_threshold": self.failure_threshold,
+                    "retry_in": round(max(0.0, self._retry_at - now), 3)
+                    if self._state == OPEN
+                    else None,
+                },
+                "concurrency": {
+                    "limit": self._capacity(),
+                    "max": self.max_concurrency,
+                    "in_flight": self._in_flight,
+                    "waiting": len(self._waiters),
+                    "latency_target": self.latency_target,
+                    "smoothed_latency": round(self._latency, 6)
+                    if self._latency is not None
+                    else None,
+                },
+                "rate": {
+                    "per_second": self.rate,
+                    "burst": self.burst,
+                    "tokens": round(tokens, 3) if self.rate is not None else None,
+                    "paused_for": round(max(0.0, self._paused_until - now), 3),
+                },
+            }
+
+
+_guard: Optional[AgentGuard] = None
+_guard_clock: Optional[Clock] = None
+_guard_lock = threading.Lock()
+
+
+def get_guard() -> AgentGuard:
+    global _guard
+    with _guard_lock:
+        if _guard is None:
+            settings = get_settings()
+            _guard = AgentGuard(
+                rate_per_second=settings.szamlazz_rate_per_second,
+                burst=settings.szamlazz_rate_burst,
+                max_concurrency=settings.szamlazz_max_connections,
+                latency_target=settings.szamlazz_latency_target,
+                failure_threshold=settings.szamlazz_breaker_failures,
+                cooldown=settings.szamlazz_breaker_cooldown,
+                queue_timeout=settings.szamlazz_timeout,
+                clock=_guard_clock,
+            )
+        return _guard
+
+
+def reset_guard(clock: Optional[Clock] = None) -> None:
+    """Drop the guard; the next :func:`get_guard` builds a new one running on ``clock``."""
+    global _guard, _guard_clock
+    with _guard_lock:
+        _guard = None
+        _guard_clock = clock
+
+
+def agent_status() -> Dict[str, Any]:
+    """Circuit, concurrency and rate-limit state of the szamlazz.hu client."""
+    return get_guard().snapshot()
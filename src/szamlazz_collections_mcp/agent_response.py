@@ -0,0 +1,268 @@
+"""Incremental parsing of szamlazz.hu Agent API responses.
+
+Response bodies are fed to :class:`ResponseParser` chunk by chunk as they arrive. The
+first bytes decide what the body is: a PDF (``%PDF`` magic) is passed on to a sink, or
+base64-encoded piece by piece, without ever being buffered whole; anything starting
+with ``<`` goes through an ``XMLPullParser`` that picks out the invoice number, error
+code and totals and drops every element as soon as it closes; anything else is a
+plain-text answer such as ``DONE;E-2024-1``. Only the first ``PREFIX_BYTES`` of a body
+are kept, for ``raw_response_summary`` and the plain-text fallback. ``szlahu_*``
+response headers, which carry the same fields, are read before the body.
+"""
+
+from __future__ import annotations
+
+import base64
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+from xml.etree.ElementTree import Element, ParseError, XMLPullParser
+
+from .utils import summarize_response
+
+PREFIX_BYTES = 2048
+
+PdfSink = Callable[[bytes], None]
+
+_HEADER_FIELDS = {
+    "szlahu_szamlaszam": "invoice_number",
+    "szlahu_error_code": "error_code",
+    "szlahu_error": "error_message",
+    "szlahu_nettovegosszeg": "net_total",
+    "szlahu_bruttovegosszeg": "gross_total",
+    "szlahu_kintlevoseg": "outstanding",
+    "szlahu_vevoifiokurl": "buyer_account_url",
+}
+
+# Keyed by lower-case tag, or "parent/tag" where the bare tag is ambiguous (item lines
+# carry their own <netto>/<brutto>). The first occurrence of a field wins.
+_XML_FIELDS = {
+    "szamlaszam": "invoice_number",
+    "invoicenumber": "invoice_number",
+    "sikeres": "success",
+    "hibakod": "error_code",
+    "errorcode": "error_code",
+    "hibauzenet": "error_message",
+    "errormessage": "error_message",
+    "nettovegosszeg": "net_total",
+    "bruttovegosszeg": "gross_total",
+    "kintlevoseg": "outstanding",
+    "vevoifiokurl": "buyer_account_url",
+    "alap/kelt": "issue_date",
+    "alap/telj": "fulfillment_date",
+    "alap/fizh": "due_date",
+    "alap/fizmod": "payment_method",
+    "alap/devizanem": "currency",
+    "vevo/nev": "buyer_name",
+    "vevo/email": "buyer_email",
+    "totalossz/netto": "net_total",
+    "totalossz/brutto": "gross_total",
+}
+
+_NUMERIC_FIELDS = frozenset({"net_total", "gross_total", "outstanding"})
+_CORE_FIELDS = frozenset({"invoice_number", "success", "error_code", "error_message"})
+
+_DONE_RE = re.compile(r"DONE;\s*([A-Za-z0-9\-\/]+)")
+_TAG_RE = re.compile(r"<(invoiceNumber|szamlaszam)>(.*?)</\1>", re.IGNORECASE)
+
+
+def parse_invoice_number(text: str) -> Optional[str]:
+    match = _DONE_RE.search(text)
+    if match:
+        return match.group(1)
+    match = _TAG_RE.search(text)
+    if match:
+        return match.group(2).strip()
+    return None
+
+
+@dataclass(frozen=True)
+class AgentResponse:
+    kind: str  # "pdf", "xml" or "text"
+    invoice_number: Optional[str] = None
+    success: Optional[bool] = None
+    error_code: Optional[str] = None
+    error_message: Optional[str] = None
+    summary: str = ""
+    pdf_base64: Optional[str] = None
+    size: int = 0
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+
+class _Base64Encoder:
+    """Encodes a byte stream in 3-byte-aligned pieces, so they concatenate into valid base64."""
+
+    def __init__(self) -> None:
+        self._parts: List[str] = []
+        self._carry = b""
+
+    def write(self, chunk: bytes) -> None:
+        data = self._carry + chunk
+        cut = len(data) - len(data) % 3
+        self._carry = data[cut:]
+        if cut:
+            self._parts.append(base64.b64encode(data[:cut]).decode())
+
+    def getvalue(self) -> str:
+        return "".join(self._parts) + base64.b64encode(self._carry).decode()
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1].lower()
+
+
+def _to_number(value: str) -> Any:
+    try:
+        return float(value.replace(",", ".").replace(" ", ""))
+    except ValueError:
+        return value
+
+
+class ResponseParser:
+    """Push parser for one Agent API response body.
+
+    ``pdf_sink`` receives the chunks of a PDF body; without one the PDF is returned
+    base64-encoded in :attr:`AgentResponse.pdf_base64`. Nothing else of the body is
+    retained beyond the first ``PREFIX_BYTES``.
+    """
+
+    def __init__(
+        self, headers: Optional[Mapping[str, str]] = None, pdf_sink: Optional[PdfSink] = None
+    ) -> None:
+        headers = headers or {}
+        self.fields: Dict[str, Any] = {}
+        for header, name in _HEADER_FIELDS.items():
+            value = headers.get(header)
+            if value:
+                self.fields[name] = value.strip()
+        self._pdf_content_type = "pdf" in headers.get("content-type", "")
+        self._pdf_sink = pdf_sink
+        self._encoder: Optional[_Base64Encoder] = None
+        self._xml: Optional[XMLPullParser] = None
+        self._stack: List[Element] = []
+        self._xml_failed = False
+        self.kind: Optional[str] = None
+        self._head = b""
+        self.prefix = b""
+        self.size = 0
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if len(self.prefix) < PREFIX_BYTES:
+            self.prefix += chunk[: PREFIX_BYTES - len(self.prefix)]
+        if self.kind is None:
+            # Hold back the first few bytes until they tell a PDF from XML.
+            self._head += chunk
+            if len(self._head) < 5:
+                return
+            chunk, self._head = self._head, b""
+            self._start(chunk)
+        self._consume(chunk)
+
+    def _start(self, head: bytes) -> None:
+        stripped = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+        if head.startswith(b"%PDF") or self._pdf_content_type:
+            self.kind = "pdf"
+            if self._pdf_sink is None:
+                self._encoder = _Base64Encoder()
+                self._pdf_sink = self._encoder.write
+        elif stripped.startswith(b"<"):
+            self.kind = "xml"
+            self._xml = XMLPullParser(events=("start", "end"))
+        else:
+            self.kind = "text"
+
+    def _consume(self, chunk: bytes) -> None:
+        if self.kind == "pdf":
+            self._pdf_sink(chunk)
+        elif self.kind == "xml" and not self._xml_failed:
+            try:
+                self._xml.feed(chunk)
+                self._drain()
+            except ParseError:
+                # Fall back to the text heuristics over the prefix, as for plain answers.
+                self._xml_failed = True
+
+    def _drain(self) -> None:
+        for event, element in self._xml.read_events():
+            if event == "start":
+                self._stack.append(element)
+                continue
+            self._stack.pop()
+            tag = _local_name(element.tag)
+            parent = _local_name(self._stack[-1].tag) if self._stack else ""
+            text = (element.text or "").strip()
+            if tag == "pdf" and "pdf_base64" not in self.fields and text:
+                self.fields["pdf_base64"] = "".join(text.split())
+            elif parent == "kifizetes" and tag == "osszeg":
+                # Payments are listed one by one; report their sum.
+                amount = _to_number(text)
+                if isinstance(amount, float):
+                    self.fields["paid_amount"] = self.fields.get("paid_amount", 0.0) + amount
+            else:
+                name = _XML_FIELDS.get(f"{parent}/{tag}") or _XML_FIELDS.get(tag)
+                if name and name not in self.fields and text:
+                    self.fields[name] = text
+            # Elements close in document order and earlier siblings are already gone,
+            # so this one is its parent's first child. Dropping it keeps memory flat
+            # however many item lines the document has.
+            if self._stack:
+                del self._stack[-1][0]
+
+    def close(self) -> AgentResponse:
+        if self.kind is None:
+            self._start(self._head)
+            if self._head:
+                self._consume(self._head)
+        if self._xml is not None and not self._xml_failed:
+            try:
+                self._xml.close()
+                self._drain()
+            except ParseError:
+                self._xml_failed = True
+        fields = dict(self.fields)
+        text = ""
+        if self.kind != "pdf":
+            text = self.prefix.decode("utf-8", errors="replace")
+            if "invoice_number" not in fields and (self.kind == "text" or self._xml_failed):
+                number = parse_invoice_number(text)
+                if number:
+                    fields["invoice_number"] = number
+        for name in _NUMERIC_FIELDS & fields.keys():
+            fields[name] = _to_number(fields[name])
+        pdf_base64 = fields.pop("pdf_base64", None)
+        if self._encoder is not None:
+            pdf_base64 = self._encoder.getvalue()
+        success = fields.get("success")
+        if success is not None:
+            success = success.lower() == "true"
+        elif "error_code" in fields:
+            success = False
+        elif self.kind == "pdf":
+            success = True
+        elif self.kind == "text":
+            success = "DONE" in text.upper()
+        return AgentResponse(
+            kind=self.kind or "text",
+            invoice_number=fields.get("invoice_number"),
+            success=success,
+            error_code=fields.get("error_code"),
+            error_message=fields.get("error_message"),
+            summary=summarize_response(text),
+            pdf_base64=pdf_base64,
+            size=self.size,
+            fields={name: value for name, value in fields.items() if name not in _CORE_FIELDS},
+        )
+
+
+def parse_chunks(
+    chunks: Iterable[bytes],
+    headers: Optional[Mapping[str, str]] = None,
+    pdf_sink: Optional[PdfSink] = None,
+) -> AgentResponse:
+    parser = ResponseParser(headers, pdf_sink)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from .emailer import ReminderMailer, render_reminder
+from .storage import list_reminder_candidates, update_reminder_metadata_many
+
+logger = logging.getLogger(__name__)
+
+
+def run_reminder_campaign(
+    min_days_overdue: int = 1,
+    not_reminded_within_days: int = 7,
+    language: str = "hu",
+    tone: str = "polite",
+    limit: Optional[int] = None,
+    dry_run: bool = False,
+    batch_size: int = 50,
+    sessions: Optional[int] = None,
+    rate_per_minute: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Remind every overdue invoice that has not been reminded recently.
+
+    Drafts are rendered up front and sent in batches of ``batch_size`` over SMTP
+    sessions that stay open for the whole campaign; each batch's successful sends are
+    recorded in a single transaction.
+    With ``dry_run`` nothing is sent and the drafts are returned instead.
+    """
+    candidates = list_reminder_candidates(
+        min_days_overdue=min_days_overdue,
+        not_reminded_within_days=not_reminded_within_days,
+        limit=limit,
+    )
+    drafts = [
+        (record.buyer_email, render_reminder(record, language=language, tone=tone))
+        for record in candidates
+    ]
+    if dry_run:
+        return {
+            "dry_run": True,
+            "selected": len(drafts),
+            "drafts": [{"to_email": to_email, **draft.model_dump()} for to_email, draft in drafts],
+        }
+
+    results: List[dict] = []
+    batch_size = max(1, batch_size)
+    if drafts:
+        with ReminderMailer(sessions=sessions, rate_per_minute=rate_per_minute) as mailer:
+            for start in range(0, len(drafts), batch_size):
+                batch_results = mailer.send_many(drafts[start : start + batch_size])
+                update_reminder_metadata_many(
+                    [result["invoice_number"] for result in batch_results if result["ok"]]
+                )
+                results.extend(batch_results)
+
+    sent = sum(1 for result in results if result["ok"])
+    logger.info("Reminder campaign sent %s of %s reminders", sent, len(results))
+    return {
+        "dry_run": False,
+        "selected": len(drafts),
+        "sent": sent,
+        "failed": [result for result in results if not result["ok"]],
+    }
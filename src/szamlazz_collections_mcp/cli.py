@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import argparse
+import json
+from typing import Optional, Sequence
+
+from .config import configure_logging
+from .utils import close_pool
+
+
+def _import_invoices(args: argparse.Namespace) -> dict:
+    from .importer import import_invoice_file
+    from .storage import init_db
+
+    init_db()
+    return import_invoice_file(args.path, file_format=args.format, chunk_size=args.chunk_size)
+
+
+def _import_fx_rates(args: argparse.Namespace) -> dict:
+    from .fx import load_fx_rates
+    from .storage import init_db
+
+    init_db()
+    return load_fx_rates(args.path)
+
+
+def _sync_ledger(args: argparse.Namespace) -> dict:
+    from .storage import init_db
+    from .sync import sync_invoices
+
+    init_db()
+    return sync_invoices(limit=args.limit, min_age=0.0 if args.force else None)
+
+
+def _compile_templates(args: argparse.Namespace) -> dict:
+    from .templating import compile_templates
+
+    return compile_templates(args.target)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="szamlazz-collections", description="Számlázz.hu collections tools"
+    )
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subcommands.add_parser(
+        "import-invoices", help="Bulk load invoices from a CSV or JSONL file"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    import_parser.add_argument("--chunk-size", type=int, default=5000)
+    import_parser.set_defaults(handler=_import_invoices)
+
+    fx_parser = subcommands.add_parser(
+        "import-fx-rates", help="Load daily rates from an MNB CSV export"
+    )
+    fx_parser.add_argument("path")
+    fx_parser.set_defaults(handler=_import_fx_rates)
+
+    sync_parser = subcommands.add_parser(
+        "sync-ledger", help="Refresh open invoices' paid amounts and status from Számlázz.hu"
+    )
+    sync_parser.add_argument("--limit", type=int, default=None)
+    sync_parser.add_argument("--force", action="store_true", help="Ignore SYNC_MIN_AGE")
+    sync_parser.set_defaults(handler=_sync_ledger)
+
+    compile_parser = subcommands.add_parser(
+        "compile-templates", help="Precompile Jinja templates for TEMPLATES_COMPILED_DIR"
+    )
+    compile_parser.add_argument("target")
+    compile_parser.set_defaults(handler=_compile_templates)
+
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    configure_logging()
+    try:
+        result = args.handler(args)
+    finally:
+        close_pool()
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,51 +2,161 @@ from __future__ import annotations
 
 import logging
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 
-from dotenv import load_dotenv
 
-load_dotenv()
+def _env(name: str, default: Optional[str] = None):
+    return field(default_factory=lambda: os.getenv(name, default))
 
 
-@dataclass
-class Settings:
-    mcp_token: str = os.getenv("MCP_TOKEN", "change-me")
-    mcp_transport: str = os.getenv("MCP_TRANSPORT", "http")
-    host: str = os.getenv("HOST", "0.0.0.0")
-    port: int = int(os.getenv("PORT", "8000"))
-    mcp_path: str = os.getenv("MCP_PATH", "/mcp")
+def _env_int(name: str, default: Optional[int] = None):
+    def factory() -> Optional[int]:
+        value = os.getenv(name)
+        return int(value) if value else default
+
+    return field(default_factory=factory)
+
+
+def _env_float(name: str, default: Optional[float] = None):
+    def factory() -> Optional[float]:
+        value = os.getenv(name)
+        return float(value) if value else default
+
+    return field(default_factory=factory)
+
 
-    szamlazz_agent_key: Optional[str] = os.getenv("SZAMLAZZ_AGENT_KEY")
-    szamlazz_username: Optional[str] = os.getenv("SZAMLAZZ_USERNAME")
-    szamlazz_password: Optional[str] = os.getenv("SZAMLAZZ_PASSWORD")
+def _env_bool(name: str, default: bool = False):
+    def factory() -> bool:
+        value = os.getenv(name)
+        if value is None or value == "":
+            return default
+        return value.strip().lower() in {"1", "true", "yes", "on"}
 
-    db_path: str = os.getenv("DB_PATH", "./data/app.db")
+    return field(default_factory=factory)
 
-    smtp_host: Optional[str] = os.getenv("SMTP_HOST")
-    smtp_port: Optional[int] = int(os.getenv("SMTP_PORT", "587")) if os.getenv("SMTP_PORT") else None
-    smtp_user: Optional[str] = os.getenv("SMTP_USER")
-    smtp_password: Optional[str] = os.getenv("SMTP_PASSWORD")
-    smtp_from: Optional[str] = os.getenv("SMTP_FROM")
 
-    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+@dataclass
+class Settings:
+    mcp_token: str = _env("MCP_TOKEN", "change-me")
+    mcp_transport: str = _env("MCP_TRANSPORT", "http")
+    host: str = _env("HOST", "0.0.0.0")
+    port: int = _env_int("PORT", 8000)
+    mcp_path: str = _env("MCP_PATH", "/mcp")
+
+    szamlazz_agent_key: Optional[str] = _env("SZAMLAZZ_AGENT_KEY")
+    szamlazz_username: Optional[str] = _env("SZAMLAZZ_USERNAME")
+    szamlazz_password: Optional[str] = _env("SZAMLAZZ_PASSWORD")
+    szamlazz_base_url: Optional[str] = _env("SZAMLAZZ_BASE_URL")
+    szamlazz_timeout: float = _env_float("SZAMLAZZ_TIMEOUT", 30.0)
+    szamlazz_connect_timeout: float = _env_float("SZAMLAZZ_CONNECT_TIMEOUT", 10.0)
+    szamlazz_max_connections: int = _env_int("SZAMLAZZ_MAX_CONNECTIONS", 10)
+    szamlazz_max_keepalive: int = _env_int("SZAMLAZZ_MAX_KEEPALIVE", 5)
+    szamlazz_keepalive_expiry: float = _env_float("SZAMLAZZ_KEEPALIVE_EXPIRY", 30.0)
+    szamlazz_http2: bool = _env_bool("SZAMLAZZ_HTTP2", False)
+    szamlazz_retries: int = _env_int("SZAMLAZZ_RETRIES", 2)
+    szamlazz_retry_backoff: float = _env_float("SZAMLAZZ_RETRY_BACKOFF", 0.5)
+    szamlazz_rate_per_second: Optional[float] = _env_float("SZAMLAZZ_RATE_PER_SECOND")
+    szamlazz_rate_burst: int = _env_int("SZAMLAZZ_RATE_BURST", 5)
+    szamlazz_latency_target: float = _env_float("SZAMLAZZ_LATENCY_TARGET", 5.0)
+    szamlazz_breaker_failures: int = _env_int("SZAMLAZZ_BREAKER_FAILURES", 5)
+    szamlazz_breaker_cooldown: float = _env_float("SZAMLAZZ_BREAKER_COOLDOWN", 30.0)
+    invoice_batch_concurrency: int = _env_int("INVOICE_BATCH_CONCURRENCY", 4)
+    invoice_batch_max_size: int = _env_int("INVOICE_BATCH_MAX_SIZE", 500)
+    idempotency_window: float = _env_float("IDEMPOTENCY_WINDOW", 3600.0)
+
+    db_path: str = _env("DB_PATH", "./data/app.db")
+    db_pool_size: int = _env_int("DB_POOL_SIZE", 4)
+    db_busy_timeout: int = _env_int("DB_BUSY_TIMEOUT", 30)
+    db_write_cache_kb: int = _env_int("DB_WRITE_CACHE_KB", 65536)
+    blocking_workers: int = _env_int("BLOCKING_WORKERS", 8)
+
+    pdf_cache_dir: str = _env("PDF_CACHE_DIR", "./data/pdf-cache")
+    pdf_cache_max_mb: float = _env_float("PDF_CACHE_MAX_MB", 256.0)
+    export_concurrency: int = _env_int("EXPORT_CONCURRENCY", 4)
+    export_dir: str = _env("EXPORT_DIR", "./data/exports")
+    import_dir: str = _env("IMPORT_DIR", "./data/imports")
+
+    aging_buckets: str = _env("AGING_BUCKETS", "7,30,60")
+    aging_rollup: bool = _env_bool("AGING_ROLLUP", False)
+    ledger_snapshot: bool = _env_bool("LEDGER_SNAPSHOT", False)
+    ledger_snapshot_ttl: float = _env_float("LEDGER_SNAPSHOT_TTL", 300.0)
+    fx_base_currency: str = _env("FX_BASE_CURRENCY", "HUF")
+    result_cache_size: int = _env_int("RESULT_CACHE_SIZE", 256)
+    result_cache_ttl: float = _env_float("RESULT_CACHE_TTL", 60.0)
+
+    smtp_host: Optional[str] = _env("SMTP_HOST")
+    smtp_port: Optional[int] = _env_int("SMTP_PORT")
+    smtp_user: Optional[str] = _env("SMTP_USER")
+    smtp_password: Optional[str] = _env("SMTP_PASSWORD")
+    smtp_from: Optional[str] = _env("SMTP_FROM")
+    smtp_starttls: bool = _env_bool("SMTP_STARTTLS", True)
+    smtp_timeout: float = _env_float("SMTP_TIMEOUT", 30.0)
+    smtp_sessions: int = _env_int("SMTP_SESSIONS", 1)
+    smtp_rate_per_minute: Optional[float] = _env_float("SMTP_RATE_PER_MINUTE")
+
+    jobs_enabled: bool = _env_bool("JOBS_ENABLED", True)
+    jobs_szamlazz_concurrency: int = _env_int("JOBS_SZAMLAZZ_CONCURRENCY", 4)
+    jobs_smtp_concurrency: int = _env_int("JOBS_SMTP_CONCURRENCY", 2)
+    jobs_max_attempts: int = _env_int("JOBS_MAX_ATTEMPTS", 5)
+    jobs_retry_backoff: float = _env_float("JOBS_RETRY_BACKOFF", 5.0)
+    jobs_max_backoff: float = _env_float("JOBS_MAX_BACKOFF", 300.0)
+    jobs_poll_interval: float = _env_float("JOBS_POLL_INTERVAL", 1.0)
+    jobs_lease: float = _env_float("JOBS_LEASE", 300.0)
+
+    sync_interval: float = _env_float("SYNC_INTERVAL", 0.0)
+    sync_min_age: float = _env_float("SYNC_MIN_AGE", 21600.0)
+    sync_batch_size: int = _env_int("SYNC_BATCH_SIZE", 500)
+    sync_concurrency: int = _env_int("SYNC_CONCURRENCY", 4)
+
+    dunning_schedule: Optional[str] = _env("DUNNING_SCHEDULE")
+    dunning_policy: str = _env("DUNNING_POLICY", "1:polite,14:firm,30:final")
+    dunning_min_interval_days: int = _env_int("DUNNING_MIN_INTERVAL_DAYS", 7)
+    dunning_language: str = _env("DUNNING_LANGUAGE", "hu")
+    dunning_max_per_run: int = _env_int("DUNNING_MAX_PER_RUN", 500)
+
+    templates_auto_reload: bool = _env_bool("TEMPLATES_AUTO_RELOAD", False)
+    templates_compiled_dir: Optional[str] = _env("TEMPLATES_COMPILED_DIR")
+
+    metrics_enabled: bool = _env_bool("METRICS_ENABLED", True)
+    metrics_host: str = _env("METRICS_HOST", "127.0.0.1")
+    metrics_port: Optional[int] = _env_int("METRICS_PORT")
+
+    log_level: str = _env("LOG_LEVEL", "INFO")
 
     @property
     def has_smtp(self) -> bool:
         return bool(self.smtp_host and self.smtp_port and self.smtp_user and self.smtp_password and self.smtp_from)
 
+    @property
+    def aging_bucket_bounds(self) -> List[int]:
+        bounds = {int(part) for part in self.aging_buckets.split(",") if part.strip()}
+        return sorted(bound for bound in bounds if bound > 0)
+
     @property
     def has_agent_key(self) -> bool:
         return bool(self.szamlazz_agent_key)
 
 
 _settings: Optional[Settings] = None
+_dotenv_loaded = False
+
+
+def _load_dotenv() -> None:
+    # Deferred to the first settings access, so importing the package does not search
+    # the directory tree for a .env file.
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _dotenv_loaded = True
 
 
 def get_settings() -> Settings:
     global _settings
     if _settings is None:
+        _load_dotenv()
         _settings = Settings()
     return _settings
 
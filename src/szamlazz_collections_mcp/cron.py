@@ -0,0 +1,102 @@
+"""Five-field cron expressions (minute hour day-of-month month day-of-week).
+
+Fields accept ``*``, numbers, ranges (``1-5``), lists (``1,15``) and steps (``*/15``,
+``8-18/2``); day-of-week runs from 0 (Sunday) to 6, with 7 also meaning Sunday. As in
+cron, when both day fields are restricted a day matching either one fires.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import FrozenSet, NamedTuple, Tuple
+
+_FIELDS: Tuple[Tuple[str, int, int], ...] = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 7),
+)
+
+# Longest gap between two matches is under five years (29 February on a given weekday).
+_SEARCH_LIMIT = timedelta(days=5 * 366)
+
+
+def _parse_field(text: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        spec, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start_text, end_text = spec.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(spec)
+            end = high if step_text else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Invalid cron {name} field: {text!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule(NamedTuple):
+    minutes: FrozenSet[int]
+    hours: FrozenSet[int]
+    days: FrozenSet[int]
+    months: FrozenSet[int]
+    weekdays: FrozenSet[int]
+    days_restricted: bool
+    weekdays_restricted: bool
+    expression: str
+
+    @classmethod
+    def parse(cls, expression: str) -> CronSchedule:
+        parts = expression.split()
+        if len(parts) != len(_FIELDS):
+            raise ValueError(f"Cron expression needs 5 fields, got {expression!r}")
+        try:
+            parsed = [
+                _parse_field(part, name, low, high)
+                for part, (name, low, high) in zip(parts, _FIELDS, strict=True)
+            ]
+        except ValueError as exc:
+            raise ValueError(f"Invalid cron expression {expression!r}: {exc}") from exc
+        weekdays = frozenset(day % 7 for day in parsed[4])
+        return cls(
+            *parsed[:4],
+            weekdays,
+            days_restricted=parts[2] != "*",
+            weekdays_restricted=parts[4] != "*",
+            expression=expression,
+        )
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        # datetime.weekday() counts from Monday; cron counts from Sunday.
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """The first matching minute strictly after ``moment``."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + _SEARCH_LIMIT
+        # Skip whole months, days and hours that cannot match before scanning minutes.
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(
+                    year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
@@ -0,0 +1,343 @@
+"""Scheduled dunning: reminders sent in the background by an escalation policy.
+
+``DUNNING_POLICY`` has one ``min_days_overdue:tone`` step per reminder. With the default
+``1:polite,14:firm,30:final`` the first reminder goes out a day after the due date, the
+second once the invoice is 14 days late and the third at 30 days; nothing follows the
+last step. At least ``DUNNING_MIN_INTERVAL_DAYS`` pass between two reminders for the
+same invoice, and an invoice already past a later step's threshold gets that step's
+tone, so escalation follows both the reminders sent and how late the invoice is.
+
+Each step is one range scan over the open-invoice index on (reminders sent, due date),
+so a run only reads invoices with an action due. Drafts are rendered per run and sent
+in batches over the pooled sessions of :class:`~.emailer.ReminderMailer`; every run and
+every reminder it sent is recorded in ``dunning_runs`` and ``dunning_actions``.
+``DUNNING_SCHEDULE``, a cron expression in server local time, runs it periodically.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import UTC, date, datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from .config import get_settings
+from .cron import CronSchedule
+from .emailer import ReminderMailer, render_reminder
+from .models import InvoiceRecord
+from .storage import list_dunning_candidates, update_reminder_metadata_many
+from .utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+TONES = ("polite", "firm", "final")
+BATCH_SIZE = 50
+
+
+class DunningStep(NamedTuple):
+    reminder: int  # reminders already sent when this step applies
+    min_days_overdue: int
+    tone: str
+
+
+class DunningAction(NamedTuple):
+    record: InvoiceRecord
+    step: int
+    tone: str
+    days_overdue: int
+
+
+def parse_policy(text: str) -> List[DunningStep]:
+    steps: List[DunningStep] = []
+    for part in (part.strip() for part in text.split(",")):
+        if not part:
+            continue
+        days_text, _, tone = part.partition(":")
+        tone = tone.strip() or "polite"
+        try:
+            days = int(days_text)
+        except ValueError:
+            raise ValueError(f"Invalid dunning step {part!r}; expected DAYS:TONE") from None
+        if tone not in TONES:
+            raise ValueError(f"Unknown dunning tone {tone!r}; expected one of {TONES}")
+        if steps and days < steps[-1].min_days_overdue:
+            raise ValueError("Dunning steps must not decrease in days overdue")
+        steps.append(DunningStep(len(steps), days, tone))
+    if not steps:
+        raise ValueError("The dunning policy needs at least one step")
+    return steps
+
+
+def _tone_for(steps: Sequence[DunningStep], step: DunningStep, days_overdue: int) -> str:
+    reached = [candidate for candidate in steps if candidate.min_days_overdue <= days_overdue]
+    return max([step, *reached], key=lambda candidate: candidate.reminder).tone
+
+
+def due_actions(
+    limit: Optional[int] = None,
+    today: Optional[date] = None,
+    now: Optional[datetime] = None,
+    steps: Optional[Sequence[DunningStep]] = None,
+) -> List[DunningAction]:
+    """The reminders a run at ``now`` (UTC) would send, earliest policy step first."""
+    settings = get_settings()
+    steps = steps or parse_policy(settings.dunning_policy)
+    today = today or date.today()
+    now = now or datetime.utcnow()
+    limit = settings.dunning_max_per_run if limit is None else limit
+    reminded_before = now - timedelta(days=settings.dunning_min_interval_days)
+    actions: List[DunningAction] = []
+    for step in steps:
+        remaining = limit - len(actions)
+        if remaining <= 0:
+            break
+        due_by = today - timedelta(days=step.min_days_overdue)
+        for record in list_dunning_candidates(step.reminder, due_by, reminded_before, remaining):
+            days_overdue = (today - record.due_date).days
+            tone = _tone_for(steps, step, days_overdue)
+            actions.append(DunningAction(record, step.reminder, tone, days_overdue))
+    return actions
+
+
+def _action_dict(action: DunningAction) -> Dict[str, Any]:
+    return {
+        "invoice_number": action.record.invoice_number,
+        "to_email": action.record.buyer_email,
+        "step": action.step,
+        "tone": action.tone,
+        "days_overdue": action.days_overdue,
+        "amount": action.record.gross_total,
+        "currency": action.record.currency,
+    }
+
+
+def _start_run(trigger: str) -> int:
+    with db_connection() as conn:
+        cur = conn.execute(
+            "INSERT INTO dunning_runs (trigger, status, started_at) VALUES (?, ?, ?)",
+            (trigger, "running", datetime.utcnow()),
+        )
+        conn.commit()
+        return cur.lastrowid
+
+
+def _finish_run(
+    run_id: int, status: str, stats: Dict[str, int], error: Optional[str] = None
+) -> None:
+    with db_connection() as conn:
+        conn.execute(
+            """
+            UPDATE dunning_runs
+            SET status = ?, selected = ?, sent = ?, failed = ?, error = ?, finished_at = ?
+            WHERE id = ?
+            """,
+            (
+                status,
+                stats["selected"],
+                stats["sent"],
+                stats["failed"],
+                error,
+                datetime.utcnow(),
+                run_id,
+            ),
+        )
+        conn.commit()
+
+
+def _record_actions(
+    run_id: int, actions: Sequence[DunningAction], results: Sequence[Dict[str, Any]]
+) -> None:
+    now = datetime.utcnow()
+    with db_connection() as conn:
+        conn.executemany(
+            """
+            INSERT INTO dunning_actions (
+                run_id, invoice_number, step, tone, days_overdue, to_email, ok, message,
+                created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    run_id,
+                    action.record.invoice_number,
+                    action.step,
+                    action.tone,
+                    action.days_overdue,
+                    result["sent_to"],
+                    result["ok"],
+                    result.get("message"),
+                    now,
+                )
+                for action, result in zip(actions, results, strict=True)
+            ],
+        )
+        conn.commit()
+
+
+_run_lock = threading.Lock()
+
+
+def run_dunning(
+    trigger: str = "manual", limit: Optional[int] = None, today: Optional[date] = None
+) -> Dict[str, Any]:
+    """Send every reminder the policy has due now, and record the run.
+
+    Sends that fail are recorded and leave the invoice due for the next run. Only one
+    run executes at a time; a second one raises ``RuntimeError``.
+    """
+    if not _run_lock.acquire(blocking=False):
+        raise RuntimeError("A dunning run is already in progress")
+    try:
+        return _run(trigger, limit, today)
+    finally:
+        _run_lock.release()
+
+
+def _run(trigger: str, limit: Optional[int], today: Optional[date]) -> Dict[str, Any]:
+    language = get_settings().dunning_language
+    run_id = _start_run(trigger)
+    stats = {"selected": 0, "sent": 0, "failed": 0}
+    failures: List[Dict[str, Any]] = []
+    try:
+        actions = due_actions(limit=limit, today=today)
+        stats["selected"] = len(actions)
+        drafts = [
+            (action.record.buyer_email, render_reminder(action.record, language, action.tone))
+            for action in actions
+        ]
+        if drafts:
+            with ReminderMailer() as mailer:
+                for start in range(0, len(drafts), BATCH_SIZE):
+                    batch = actions[start : start + BATCH_SIZE]
+                    results = mailer.send_many(drafts[start : start + BATCH_SIZE])
+                    update_reminder_metadata_many(
+                        [result["invoice_number"] for result in results if result["ok"]]
+                    )
+                    _record_actions(run_id, batch, results)
+                    failures.extend(result for result in results if not result["ok"])
+                    stats["sent"] += sum(1 for result in results if result["ok"])
+                    stats["failed"] = len(failures)
+    except Exception as exc:
+        _finish_run(run_id, "failed", stats, f"{exc.__class__.__name__}: {exc}")
+        logger.exception("Dunning run %s failed", run_id)
+        raise
+    _finish_run(run_id, "succeeded", stats)
+    logger.info(
+        "Dunning run %s sent %s of %s reminders", run_id, stats["sent"], stats["selected"]
+    )
+    return {"run_id": run_id, **stats, "failures": failures}
+
+
+def preview_next_run(limit: int = 50) -> Dict[str, Any]:
+    """What the next scheduled run would send, as of its start time.
+
+    Without a schedule the preview is for a run started now. ``limit`` caps the listed
+    actions, not the counts.
+    """
+    schedule = get_settings().dunning_schedule
+    next_at = None
+    if _scheduler is not None:
+        next_at = _scheduler.next_run_at
+    elif schedule:
+        next_at = CronSchedule.parse(schedule).next_after(datetime.now())
+    if next_at is not None:
+        actions = due_actions(
+            today=next_at.date(),
+            now=next_at.astimezone(UTC).replace(tzinfo=None),
+        )
+    else:
+        actions = due_actions()
+    by_tone: Dict[str, int] = {}
+    for action in actions:
+        by_tone[action.tone] = by_tone.get(action.tone, 0) + 1
+    return {
+        "schedule": schedule or None,
+        "next_run_at": next_at.isoformat() if next_at else None,
+        "policy": [step._asdict() for step in parse_policy(get_settings().dunning_policy)],
+        "selected": len(actions),
+        "by_tone": by_tone,
+        "actions": [_action_dict(action) for action in actions[:limit]],
+    }
+
+
+def dunning_history(limit: int = 20, run_id: Optional[int] = None) -> Dict[str, Any]:
+    """Recent runs, newest first, or one run with the reminders it sent."""
+    with db_connection(readonly=True) as conn:
+        if run_id is None:
+            rows = conn.execute(
+                "SELECT * FROM dunning_runs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return {"runs": [dict(row) for row in rows]}
+        run = conn.execute("SELECT * FROM dunning_runs WHERE id = ?", (run_id,)).fetchone()
+        if run is None:
+            return {"run_id": run_id, "status": "not_found"}
+        actions = conn.execute(
+            "SELECT * FROM dunning_actions WHERE run_id = ? ORDER BY invoice_number", (run_id,)
+        ).fetchall()
+    return {"run": dict(run), "actions": [dict(action) for action in actions]}
+
+
+class DunningScheduler:
+    """Runs :func:`run_dunning` on a cron schedule from a daemon thread."""
+
+    def __init__(self, schedule: CronSchedule) -> None:
+        self.schedule = schedule
+        self.next_run_at: Optional[datetime] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _wait_until(self, moment: datetime) -> bool:
+        # Short waits, re-checking the wall clock, so clock changes cannot stall a run.
+        while (delay := (moment - datetime.now()).total_seconds()) > 0:
+            if self._stopping.wait(min(delay, 60.0)):
+                return False
+        return True
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self.next_run_at = self.schedule.next_after(datetime.now())
+            if not self._wait_until(self.next_run_at):
+                return
+            try:
+                run_dunning(trigger="schedule")
+            except Exception:
+                logger.exception("Scheduled dunning run failed")
+
+    def start(self) -> None:
+        self.next_run_at = self.schedule.next_after(datetime.now())
+        self._thread = threading.Thread(target=self._run, name="dunning", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Dunning on %r, next run at %s", self.schedule.expression, self.next_run_at
+        )
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_scheduler: Optional[DunningScheduler] = None
+
+
+def start_dunning() -> Optional[DunningScheduler]:
+    global _scheduler
+    settings = get_settings()
+    if not settings.dunning_schedule or _scheduler is not None:
+        return _scheduler
+    if not settings.has_smtp:
+        logger.warning("DUNNING_SCHEDULE is set but SMTP is not configured; not scheduling")
+        return None
+    schedule = CronSchedule.parse(settings.dunning_schedule)
+    parse_policy(settings.dunning_policy)
+    _scheduler = DunningScheduler(schedule)
+    _scheduler.start()
+    return _scheduler
+
+
+def stop_dunning(timeout: Optional[float] = 30.0) -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop(timeout)
+        _scheduler = None
@@ -1,40 +1,73 @@
 from __future__ import annotations
 
 import logging
-import os
+import queue
 import smtplib
+import threading
+import time
 from datetime import date
 from email.message import EmailMessage
-from typing import Optional
+from typing import List, Optional, Sequence, Tuple
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment
 
+from . import metrics
 from .config import get_settings
 from .models import InvoiceRecord, ReminderDraft
+from .templating import get_environment
 
 logger = logging.getLogger(__name__)
 
+_RENDER_SECONDS = metrics.histogram(
+    "reminder_render_duration_seconds", "Reminder email rendering time", ["language"]
+)
+_RENDER_ERRORS = metrics.counter(
+    "reminder_render_errors_total", "Reminder email rendering failures", ["language", "error"]
+)
+# ``mode`` is "single" for one-off sends and "session" for sends over a pooled session.
+_SEND_SECONDS = metrics.histogram(
+    "smtp_send_duration_seconds", "SMTP send time, including connecting when needed", ["mode"]
+)
+_SEND_ERRORS = metrics.counter(
+    "smtp_send_errors_total", "SMTP sends that failed", ["mode", "error"]
+)
+_MESSAGE_BYTES = metrics.histogram(
+    "smtp_message_bytes", "Reminder email body size", ["mode"], metrics.SIZE_BUCKETS
+)
+
+
+# Keyed by (language, tone); the reminder templates escalate through the same tones.
+_SUBJECT_PREFIXES = {
+    ("hu", "polite"): "Kíméletes emlékeztető",
+    ("hu", "firm"): "Fizetési felszólítás",
+    ("hu", "final"): "Utolsó felszólítás",
+    ("en", "polite"): "Friendly reminder",
+    ("en", "firm"): "Payment overdue",
+    ("en", "final"): "Final notice",
+}
+
 
 def _jinja_env() -> Environment:
-    templates_path = os.path.join(os.path.dirname(__file__), "templates")
-    return Environment(loader=FileSystemLoader(templates_path), autoescape=False)
+    return get_environment("reminder")
 
 
 def render_reminder(record: InvoiceRecord, language: str = "hu", tone: str = "polite") -> ReminderDraft:
-    env = _jinja_env()
-    template_name = f"reminder_{language}.txt.j2"
-    template = env.get_template(template_name)
-    body = template.render(
-        buyer_name=record.buyer_name,
-        invoice_number=record.invoice_number,
-        due_date=record.due_date,
-        amount=record.gross_total,
-        tone=tone,
-    )
-    subject = {
-        "hu": f"Kíméletes emlékeztető: Számla {record.invoice_number}",
-        "en": f"Friendly reminder: Invoice {record.invoice_number}",
-    }.get(language, f"Invoice {record.invoice_number} reminder")
+    with metrics.timed(_RENDER_SECONDS, _RENDER_ERRORS, language):
+        env = _jinja_env()
+        template_name = f"reminder_{language}.txt.j2"
+        template = env.get_template(template_name)
+        body = template.render(
+            buyer_name=record.buyer_name,
+            invoice_number=record.invoice_number,
+            due_date=record.due_date,
+            amount=record.gross_total,
+            tone=tone,
+        )
+    prefix = _SUBJECT_PREFIXES.get((language, tone)) or _SUBJECT_PREFIXES.get((language, "polite"))
+    if prefix:
+        subject = f"{prefix}: {'Számla' if language == 'hu' else 'Invoice'} {record.invoice_number}"
+    else:
+        subject = f"Invoice {record.invoice_number} reminder"
 
     return ReminderDraft(
         subject=subject,
@@ -47,20 +80,180 @@ def render_reminder(record: InvoiceRecord, language: str = "hu", tone: str = "po
     )
 
 
-def send_email(to_email: str, draft: ReminderDraft) -> dict:
-    settings = get_settings()
-    if not settings.has_smtp:
+def _require_smtp() -> None:
+    if not get_settings().has_smtp:
         raise RuntimeError("SMTP is not configured. Set SMTP_* environment variables.")
 
+
+def _build_message(to_email: str, draft: ReminderDraft) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = draft.subject
-    msg["From"] = settings.smtp_from
+    msg["From"] = get_settings().smtp_from
     msg["To"] = to_email
     msg.set_content(draft.body)
+    return msg
+
 
-    with smtplib.SMTP(settings.smtp_host, settings.smtp_port) as server:
-        server.starttls()
+def open_smtp_session() -> smtplib.SMTP:
+    """Connect, upgrade to TLS and authenticate; the caller owns and must quit the session."""
+    settings = get_settings()
+    server = smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=settings.smtp_timeout)
+    try:
+        if settings.smtp_starttls:
+            server.starttls()
         server.login(settings.smtp_user, settings.smtp_password)
-        server.send_message(msg)
+    except BaseException:
+        server.close()
+        raise
+    return server
+
+
+def _close_session(server: Optional[smtplib.SMTP]) -> None:
+    if server is None:
+        return
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+def send_email(to_email: str, draft: ReminderDraft) -> dict:
+    _require_smtp()
+    msg = _build_message(to_email, draft)
+    metrics.observe(_MESSAGE_BYTES, len(draft.body.encode("utf-8")), "single")
+    with metrics.timed(_SEND_SECONDS, _SEND_ERRORS, "single"):
+        server = open_smtp_session()
+        try:
+            server.send_message(msg)
+        finally:
+            _close_session(server)
     logger.info("Sent reminder to %s", to_email)
     return {"ok": True, "sent_to": to_email, "message": "Email sent"}
+
+
+class _Throttle:
+    """Spaces sends evenly across all sessions to stay under ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: Optional[float]) -> None:
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+class ReminderMailer:
+    """A small pool of long-lived, authenticated SMTP sessions for sending many reminders.
+
+    Each session connects on first use and stays open across :meth:`send_many` calls
+    until the mailer is closed, reconnecting only after the server drops it. Use as a
+    context manager.
+    """
+
+    def __init__(
+        self, sessions: Optional[int] = None, rate_per_minute: Optional[float] = None
+    ) -> None:
+        _require_smtp()
+        settings = get_settings()
+        self.size = max(1, sessions or settings.smtp_sessions)
+        self._sessions: List[Optional[smtplib.SMTP]] = [None] * self.size
+        self._throttle = _Throttle(
+            rate_per_minute if rate_per_minute is not None else settings.smtp_rate_per_minute
+        )
+
+    def __enter__(self) -> ReminderMailer:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for slot, server in enumerate(self._sessions):
+            _close_session(server)
+            self._sessions[slot] = None
+
+    def _send_one(self, slot: int, to_email: str, draft: ReminderDraft) -> dict:
+        metrics.observe(_MESSAGE_BYTES, len(draft.body.encode("utf-8")), "session")
+        start = time.perf_counter()
+        result = self._deliver(slot, to_email, draft)
+        metrics.observe(_SEND_SECONDS, time.perf_counter() - start, "session")
+        # A send that succeeded after reconnecting still carries the first error.
+        error = result.pop("error", None)
+        if not result["ok"]:
+            metrics.inc(_SEND_ERRORS, "session", error or "Unknown")
+        return result
+
+    def _deliver(self, slot: int, to_email: str, draft: ReminderDraft) -> dict:
+        result = {"ok": False, "sent_to": to_email, "invoice_number": draft.invoice_number}
+        for attempt in range(2):
+            try:
+                if self._sessions[slot] is None:
+                    self._sessions[slot] = open_smtp_session()
+                self._sessions[slot].send_message(_build_message(to_email, draft))
+                result.update(ok=True, message="Email sent")
+                break
+            except smtplib.SMTPServerDisconnected as exc:
+                self._sessions[slot] = None
+                result["message"] = str(exc) or exc.__class__.__name__
+                result["error"] = exc.__class__.__name__
+                if attempt:
+                    break
+            except (smtplib.SMTPException, OSError) as exc:
+                # A rejected recipient leaves the session usable; anything else may not.
+                recoverable = (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)
+                if not isinstance(exc, recoverable):
+                    _close_session(self._sessions[slot])
+                    self._sessions[slot] = None
+                result["message"] = str(exc) or exc.__class__.__name__
+                result["error"] = exc.__class__.__name__
+                break
+        return result
+
+    def send_many(self, messages: Sequence[Tuple[str, ReminderDraft]]) -> List[dict]:
+        """Send ``messages`` across the sessions; results come back in input order.
+
+        A failed message is reported in its result instead of aborting the batch.
+        """
+        pending: queue.Queue[Tuple[int, str, ReminderDraft]] = queue.Queue()
+        for index, (to_email, draft) in enumerate(messages):
+            pending.put((index, to_email, draft))
+        results: List[dict] = [{} for _ in messages]
+
+        def worker(slot: int) -> None:
+            while True:
+                try:
+                    index, to_email, draft = pending.get_nowait()
+                except queue.Empty:
+                    return
+                self._throttle.wait()
+                results[index] = self._send_one(slot, to_email, draft)
+
+        workers = min(self.size, len(messages))
+        if workers == 1:
+            worker(0)
+        else:
+            threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        sent = sum(1 for result in results if result["ok"])
+        logger.info("Sent %s of %s reminders over %s SMTP session(s)", sent, len(results), workers)
+        return results
+
+
+def send_batch(
+    messages: Sequence[Tuple[str, ReminderDraft]],
+    sessions: Optional[int] = None,
+    rate_per_minute: Optional[float] = None,
+) -> List[dict]:
+    with ReminderMailer(sessions=sessions, rate_per_minute=rate_per_minute) as mailer:
+        return mailer.send_many(messages)
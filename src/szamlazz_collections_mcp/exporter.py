@@ -0,0 +1,135 @@
+"""Bulk export of invoice PDFs and XMLs into a ZIP archive.
+
+Documents are fetched concurrently by a bounded thread pool over the shared keep-alive
+client, while the calling thread appends each finished document to the archive on disk.
+PDFs come from the local PDF cache when present, so re-running an export only
+downloads what is missing.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .config import get_settings
+from .storage import iter_invoices
+from .szamlazz_client import query_invoice_pdf, query_invoice_xml
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+_UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def _archive_name(kind: str, invoice_number: str) -> str:
+    return f"{kind}/{_UNSAFE_NAME_RE.sub('_', invoice_number)}.{kind}"
+
+
+def _fetch(kind: str, invoice_number: str) -> Tuple[str, Dict[str, Any]]:
+    if kind == "pdf":
+        return kind, query_invoice_pdf(invoice_number, save=False, inline=False)
+    result = query_invoice_xml(invoice_number)
+    # The Agent reports errors in an XML body with HTTP 200; never archive those.
+    if result["success"] is False or result["error_code"]:
+        raise RuntimeError(f"{result['error_code']}: {result['error_message']}")
+    return kind, result
+
+
+def export_invoices(
+    target_path: str,
+    status: Optional[str] = None,
+    due_before: Optional[date] = None,
+    customer_email: Optional[str] = None,
+    include_pdf: bool = True,
+    include_xml: bool = True,
+    concurrency: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """Write the PDF and/or XML of every matching invoice to a ZIP file at ``target_path``.
+
+    At most ``2 * concurrency`` downloads are in flight, so memory stays bounded however
+    many invoices match. The archive is built next to the target and moved into place
+    when complete. Failed documents are reported, not fatal.
+    """
+    kinds = [kind for kind, wanted in (("pdf", include_pdf), ("xml", include_xml)) if wanted]
+    if not kinds:
+        raise ValueError("Nothing to export: enable include_pdf and/or include_xml")
+    workers = max(1, concurrency or get_settings().export_concurrency)
+    invoice_numbers = [
+        record.invoice_number for record in iter_invoices(status, due_before, customer_email)
+    ]
+    tasks = [(kind, number) for number in invoice_numbers for kind in kinds]
+    total = len(tasks)
+
+    directory = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(directory, exist_ok=True)
+    partial_path = f"{target_path}.partial"
+    done = downloaded = cached = 0
+    errors: List[Dict[str, str]] = []
+
+    def collect(archive: zipfile.ZipFile, future: Future, task: Tuple[str, str]) -> None:
+        nonlocal done, downloaded, cached
+        kind, number = task
+        try:
+            _, result = future.result()
+            # The cached PDF can be evicted between download and archiving; that only
+            # fails this document.
+            if kind == "pdf":
+                archive.write(result["cache_path"], _archive_name(kind, number))
+            else:
+                archive.writestr(_archive_name(kind, number), result["xml"].encode("utf-8"))
+        except Exception as exc:
+            error = f"{exc.__class__.__name__}: {exc}"
+            errors.append({"invoice_number": number, "kind": kind, "error": error})
+        else:
+            if kind == "pdf":
+                cached += result["cached"]
+                downloaded += not result["cached"]
+            else:
+                downloaded += 1
+        done += 1
+        if progress is not None:
+            progress(done, total)
+
+    try:
+        with (
+            zipfile.ZipFile(partial_path, "w", compression=zipfile.ZIP_DEFLATED) as archive,
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="szamlazz-export") as pool,
+        ):
+            pending: Dict[Future, Tuple[str, str]] = {}
+            for task in tasks:
+                if len(pending) >= 2 * workers:
+                    finished: Set[Future] = wait(pending, return_when=FIRST_COMPLETED).done
+                    for future in finished:
+                        collect(archive, future, pending.pop(future))
+                pending[pool.submit(_fetch, *task)] = task
+            for future in list(pending):
+                collect(archive, future, pending.pop(future))
+        os.replace(partial_path, target_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+
+    logger.info(
+        "Exported %s documents for %s invoices to %s (%s from cache, %s failed)",
+        done - len(errors),
+        len(invoice_numbers),
+        target_path,
+        cached,
+        len(errors),
+    )
+    return {
+        "path": target_path,
+        "invoices": len(invoice_numbers),
+        "documents": done - len(errors),
+        "downloaded": downloaded,
+        "from_cache": cached,
+        "failed": errors,
+    }
@@ -0,0 +1,191 @@
+"""Foreign-exchange rates for converting multi-currency totals.
+
+Rates are loaded from the Magyar Nemzeti Bank's CSV export: a header row of currency
+codes, an optional unit row (e.g. JPY is quoted per 100), then one row per day with
+HUF prices using a decimal comma. Lookups use the latest rate on or before the
+requested date and are memoized per ``(currency, date)``. Reports aggregate per
+currency in SQL and convert the handful of resulting sums, never individual rows.
+"""
+
+from __future__ import annotations
+
+import csv
+import functools
+import io
+import logging
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import get_settings
+from .utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+# MNB quotes every currency in forints.
+QUOTE_CURRENCY = "HUF"
+
+_DATE_FORMATS = ("%Y.%m.%d.", "%Y.%m.%d", "%Y-%m-%d", "%Y/%m/%d")
+_UNIT_LABELS = {"egység", "egység:", "egyseg", "unit", "units"}
+
+UPSERT_RATE_SQL = """
+INSERT INTO fx_rates (currency, rate_date, rate) VALUES (?, ?, ?)
+ON CONFLICT (currency, rate_date) DO UPDATE SET rate = excluded.rate
+"""
+
+# Bumped whenever rates are loaded, which invalidates every memoized lookup.
+_generation = 0
+
+
+def rates_generation() -> int:
+    return _generation
+
+
+def _parse_date(text: str) -> Optional[date]:
+    text = text.strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_number(text: str) -> Optional[float]:
+    text = text.strip().replace("\xa0", "").replace(" ", "").replace(",", ".")
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Older MNB exports are encoded for Windows Central European locales.
+        return raw.decode("cp1250")
+
+
+def parse_mnb_csv(path: str) -> Iterator[Tuple[str, date, float]]:
+    """Yield ``(currency, date, HUF per one unit)`` from an MNB rate export."""
+    text = _read_text(path)
+    first_line = text.split("\n", 1)[0]
+    delimiter = ";" if ";" in first_line else ("\t" if "\t" in first_line else ",")
+    rows = csv.reader(io.StringIO(text), delimiter=delimiter)
+    header = next(rows, None)
+    if not header:
+        raise ValueError(f"{path!r} is empty")
+    currencies = [cell.strip().upper() for cell in header[1:]]
+    units = [1.0] * len(currencies)
+    for row in rows:
+        if not row or not row[0].strip():
+            continue
+        rate_date = _parse_date(row[0])
+        if rate_date is None:
+            if row[0].strip().lower() in _UNIT_LABELS:
+                units = [_parse_number(cell) or 1.0 for cell in row[1 : len(currencies) + 1]]
+                units += [1.0] * (len(currencies) - len(units))
+            continue
+        # Trailing cells may be missing on days a currency was not quoted.
+        for currency, unit, cell in zip(currencies, units, row[1:], strict=False):
+            value = _parse_number(cell)
+            if currency and value:
+                yield currency, rate_date, value / unit
+
+
+def load_fx_rates(path: str, chunk_size: int = 5000) -> Dict[str, Any]:
+    """Upsert every rate in an MNB CSV file in one transaction."""
+    global _generation
+    rates: Iterable[Tuple[str, date, float]] = parse_mnb_csv(path)
+    iterator = iter(rates)
+    count = 0
+    currencies = set()
+    first: Optional[date] = None
+    last: Optional[date] = None
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        while chunk := list(islice(iterator, chunk_size)):
+            conn.executemany(UPSERT_RATE_SQL, chunk)
+            count += len(chunk)
+            for currency, rate_date, _ in chunk:
+                currencies.add(currency)
+                first = rate_date if first is None else min(first, rate_date)
+                last = rate_date if last is None else max(last, rate_date)
+        conn.commit()
+    _generation += 1
+    _cached_rate.cache_clear()
+    logger.info("Loaded %s FX rates for %s currencies from %s", count, len(currencies), path)
+    return {
+        "rates": count,
+        "currencies": sorted(currencies),
+        "first_date": first,
+        "last_date": last,
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_rate(db_path: str, generation: int, currency: str, on_date: date) -> Optional[float]:
+    with db_connection(readonly=True) as conn:
+        row = conn.execute(
+            """
+            SELECT rate FROM fx_rates WHERE currency = ? AND rate_date <= ?
+            ORDER BY rate_date DESC LIMIT 1
+            """,
+            (currency, on_date),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def get_rate(currency: str, on_date: Optional[date] = None) -> Optional[float]:
+    """HUF price of one unit of ``currency`` on ``on_date``, or None if unknown."""
+    currency = currency.upper()
+    if currency == QUOTE_CURRENCY:
+        return 1.0
+    return _cached_rate(get_settings().db_path, _generation, currency, on_date or date.today())
+
+
+def conversion_rates(
+    currencies: Iterable[str], on_date: Optional[date] = None, base: Optional[str] = None
+) -> Tuple[Dict[str, float], List[str]]:
+    """Factors converting each currency into ``base``, and the currencies lacking a rate."""
+    base = (base or get_settings().fx_base_currency).upper()
+    base_rate = get_rate(base, on_date)
+    factors: Dict[str, float] = {}
+    missing: List[str] = []
+    for currency in sorted(set(currencies)):
+        if currency.upper() == base:
+            factors[currency] = 1.0
+            continue
+        rate = get_rate(currency, on_date)
+        if rate is None or base_rate is None:
+            missing.append(currency)
+        else:
+            factors[currency] = rate / base_rate
+    return factors, missing
+
+
+def convert_totals(
+    totals: Dict[str, Dict[str, Any]], on_date: Optional[date] = None
+) -> Dict[str, Any]:
+    """Summarize ``{currency: {"count", "gross_total"}}`` in the base currency."""
+    factors, missing = conversion_rates(totals, on_date)
+    converted = sum(
+        entry["gross_total"] * factors[currency]
+        for currency, entry in totals.items()
+        if currency in factors
+    )
+    return {
+        "base_currency": get_settings().fx_base_currency.upper(),
+        "count": sum(entry["count"] for entry in totals.values()),
+        "gross_total": round(converted, 2),
+        "by_currency": {
+            currency: {"count": entry["count"], "gross_total": round(entry["gross_total"], 2)}
+            for currency, entry in sorted(totals.items())
+        },
+        "missing_rates": missing,
+    }
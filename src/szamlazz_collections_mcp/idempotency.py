@@ -0,0 +1,195 @@
+"""Idempotency layer for invoice creation.
+
+Every ``create_invoice`` request is recorded in ``invoice_requests`` under its
+``external_id`` or, without one, the SHA-256 of the normalized payload. A retry of a
+completed request returns the stored response without calling szamlazz.hu; a retry of a
+request whose outcome is unknown (it timed out after being sent) is refused until an
+operator has checked Számlázz.hu and resubmits with ``force``.
+
+An ``external_id`` deduplicates for good. A payload hash only does so for
+``IDEMPOTENCY_WINDOW`` seconds after the request completed: a later identical payload is
+a new invoice, not a retry.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+
+from .config import get_settings
+from .models import InvoiceCreate, InvoiceRecord
+from .storage import UPSERT_INVOICE_SQL, _record_params, notify_invoice_write
+from .szamlazz_client import request_not_sent
+from .utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+UNKNOWN = "unknown"
+
+# An in-flight request older than this belongs to a process that died mid-call.
+STALE_AFTER = timedelta(minutes=10)
+
+
+def request_hash(invoice: InvoiceCreate) -> str:
+    normalized = json.dumps(invoice.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def idempotency_key(invoice: InvoiceCreate, digest: str) -> str:
+    return f"external:{invoice.external_id}" if invoice.external_id else f"sha256:{digest}"
+
+
+def _claim(
+    conn: sqlite3.Connection, invoice: InvoiceCreate, force: bool, now: datetime
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    digest = request_hash(invoice)
+    key = idempotency_key(invoice, digest)
+    window = timedelta(seconds=max(0.0, get_settings().idempotency_window))
+    row = conn.execute(
+        """
+        SELECT request_hash, status, response, last_error, updated_at < ? AS stale,
+               updated_at < ? AS expired
+        FROM invoice_requests WHERE idempotency_key = ?
+        """,
+        (now - STALE_AFTER, now - window, key),
+    ).fetchone()
+    expired = row is not None and row["status"] == COMPLETED and row["expired"]
+    if expired and not invoice.external_id:
+        logger.info("Dedupe window of create_invoice request %s has passed", key)
+        conn.execute("DELETE FROM invoice_requests WHERE idempotency_key = ?", (key,))
+        row = None
+    if row is None:
+        conn.execute(
+            """
+            INSERT INTO invoice_requests (
+                idempotency_key, request_hash, status, created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?)
+            """,
+            (key, digest, IN_FLIGHT, now, now),
+        )
+        return key, None
+    if row["request_hash"] != digest:
+        raise ValueError(
+            f"external_id {invoice.external_id!r} was already used for a different invoice"
+        )
+    if row["status"] == COMPLETED:
+        logger.info("Replaying stored result for create_invoice request %s", key)
+        return key, {**json.loads(row["response"]), "idempotent_replay": True}
+    if row["status"] == IN_FLIGHT and not row["stale"]:
+        raise ValueError("An identical create_invoice request is still in progress")
+    if not force:
+        reason = row["last_error"] or "the process handling it stopped"
+        raise ValueError(
+            "An identical create_invoice request may already have created the invoice "
+            f"({reason}). Check Számlázz.hu, then resubmit with force=true if it does "
+            "not exist."
+        )
+    conn.execute(
+        "UPDATE invoice_requests SET status = ?, last_error = NULL, updated_at = ? "
+        "WHERE idempotency_key = ?",
+        (IN_FLIGHT, now, key),
+    )
+    logger.warning("Resubmitting create_invoice request %s with force", key)
+    return key, None
+
+
+def begin_invoice_request(
+    invoice: InvoiceCreate, force: bool = False
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Claim the request's idempotency key.
+
+    Returns ``(key, None)`` when the caller should call szamlazz.hu, or ``(key, response)``
+    with the stored response of an earlier identical request.
+    """
+    with db_connection() as conn:
+        claim = _claim(conn, invoice, force, datetime.utcnow())
+        conn.commit()
+    return claim
+
+
+def begin_invoice_requests(
+    invoices: Sequence[InvoiceCreate], force: bool = False
+) -> List[Union[Tuple[str, Optional[Dict[str, Any]]], ValueError]]:
+    """Claim the keys of a batch in one transaction.
+
+    Each entry is what :func:`begin_invoice_request` would return for that invoice, or
+    the ``ValueError`` it would raise. A payload repeated within the batch gets the
+    in-progress error, as a concurrent duplicate request would.
+    """
+    claims: List[Union[Tuple[str, Optional[Dict[str, Any]]], ValueError]] = []
+    now = datetime.utcnow()
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for invoice in invoices:
+            try:
+                claims.append(_claim(conn, invoice, force, now))
+            except ValueError as exc:
+                claims.append(exc)
+        conn.commit()
+    return claims
+
+
+def complete_invoice_request(
+    key: str, record: Optional[InvoiceRecord], response: Dict[str, Any]
+) -> None:
+    """Store the created invoice and the request's response in one transaction."""
+    complete_invoice_requests([(key, record, response)])
+
+
+def complete_invoice_requests(
+    completed: Sequence[Tuple[str, Optional[InvoiceRecord], Dict[str, Any]]],
+) -> None:
+    """Store the created invoices and responses of several requests in one transaction."""
+    if not completed:
+        return
+    now = datetime.utcnow()
+    records = [record for _, record, _ in completed if record is not None]
+    with db_connection() as conn:
+        if records:
+            conn.executemany(UPSERT_INVOICE_SQL, [_record_params(record) for record in records])
+        conn.executemany(
+            """
+            UPDATE invoice_requests
+            SET status = ?, invoice_number = ?, response = ?, last_error = NULL, updated_at = ?
+            WHERE idempotency_key = ?
+            """,
+            [
+                (
+                    COMPLETED,
+                    record.invoice_number if record else None,
+                    json.dumps(response, default=str),
+                    now,
+                    key,
+                )
+                for key, record, response in completed
+            ],
+        )
+        conn.commit()
+    if records:
+        notify_invoice_write([record.invoice_number for record in records])
+
+
+def fail_invoice_request(key: str, exc: BaseException) -> None:
+    """Release the key if szamlazz.hu provably did not create the invoice.
+
+    Otherwise the request is marked unknown, which blocks silent resubmission.
+    """
+    rejected = isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code < 500
+    with db_connection() as conn:
+        if request_not_sent(exc) or rejected:
+            conn.execute("DELETE FROM invoice_requests WHERE idempotency_key = ?", (key,))
+        else:
+            conn.execute(
+                "UPDATE invoice_requests SET status = ?, last_error = ?, updated_at = ? "
+                "WHERE idempotency_key = ?",
+                (UNKNOWN, f"{exc.__class__.__name__}: {exc}", datetime.utcnow(), key),
+            )
+        conn.commit()
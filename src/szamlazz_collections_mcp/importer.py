@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from .models import InvoiceRecord
+from .storage import bulk_insert_invoices
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ("csv", "jsonl")
+
+_OPTIONAL_FIELDS = ("last_reminded_at", "external_id")
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in {"jsonl", "ndjson"}:
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    raise ValueError(f"Cannot infer import format from {path!r}; pass one of {SUPPORTED_FORMATS}")
+
+
+def _to_record(row: Dict[str, Any], imported_at: datetime) -> InvoiceRecord:
+    data = {key: value for key, value in row.items() if key in InvoiceRecord.model_fields}
+    for key in _OPTIONAL_FIELDS:
+        if data.get(key) == "":
+            data[key] = None
+    data.setdefault("status", "open")
+    data.setdefault("last_reminded_at", None)
+    data.setdefault("reminders_sent_count", 0)
+    if not data.get("created_at"):
+        data["created_at"] = imported_at
+    return InvoiceRecord(**data)
+
+
+def iter_invoice_file(path: str, file_format: Optional[str] = None) -> Iterator[InvoiceRecord]:
+    """Yield ``InvoiceRecord``s from a CSV (with header) or JSONL file without loading it whole.
+
+    Columns are ``InvoiceRecord`` field names; ``status``, ``created_at``,
+    ``last_reminded_at``, ``reminders_sent_count`` and ``external_id`` may be omitted.
+    """
+    file_format = file_format or detect_format(path)
+    if file_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported import format {file_format!r}")
+    imported_at = datetime.utcnow()
+    with open(path, newline="", encoding="utf-8") as handle:
+        if file_format == "csv":
+            rows = csv.DictReader(handle)
+            for line_number, row in enumerate(rows, start=2):
+                try:
+                    yield _to_record(row, imported_at)
+                except ValueError as exc:
+                    raise ValueError(f"{path}:{line_number}: {exc}") from exc
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield _to_record(json.loads(line), imported_at)
+                except ValueError as exc:
+                    raise ValueError(f"{path}:{line_number}: {exc}") from exc
+
+
+def import_invoice_file(
+    path: str, file_format: Optional[str] = None, chunk_size: int = 5000
+) -> Dict[str, Any]:
+    result = bulk_insert_invoices(iter_invoice_file(path, file_format), chunk_size=chunk_size)
+    logger.info("Imported %s: %s", path, result)
+    return {"path": path, **result}
@@ -0,0 +1,96 @@
+"""Batch invoice creation for order-system bursts.
+
+A batch is validated and its idempotency keys claimed in one transaction before any
+request goes out, then submitted to szamlazz.hu over the shared async client with at
+most ``INVOICE_BATCH_CONCURRENCY`` requests in flight. The created invoices and stored
+responses are written in one transaction at the end. Every item gets its own result,
+so a rejected or failed invoice does not abort the others; retrying a batch replays
+the invoices already created, exactly as retrying ``create_invoice`` does.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import get_settings
+from .idempotency import begin_invoice_requests, complete_invoice_requests, fail_invoice_request
+from .models import InvoiceCreate, InvoiceRecord
+from .services import invoice_outcome
+from .szamlazz_async_client import generate_invoice
+from .utils import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+def _error(exc: BaseException) -> str:
+    return f"{exc.__class__.__name__}: {exc}"
+
+
+def _fail_requests(failed: Sequence[Tuple[str, BaseException]]) -> None:
+    for key, exc in failed:
+        fail_invoice_request(key, exc)
+
+
+async def create_invoices(
+    invoices: Sequence[InvoiceCreate],
+    force: bool = False,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Issue a batch of invoices; results come back in input order.
+
+    Each result has ``index`` and ``ok`` plus either the ``create_invoice`` response or
+    an ``error``.
+    """
+    settings = get_settings()
+    if len(invoices) > settings.invoice_batch_max_size:
+        raise ValueError(
+            f"A batch holds at most {settings.invoice_batch_max_size} invoices, "
+            f"got {len(invoices)}"
+        )
+    workers = max(1, concurrency or settings.invoice_batch_concurrency)
+    claims = await run_blocking(begin_invoice_requests, invoices, force)
+    results: List[Dict[str, Any]] = [{"index": index} for index in range(len(invoices))]
+    submit: List[Tuple[int, str]] = []
+    for index, claim in enumerate(claims):
+        if isinstance(claim, ValueError):
+            results[index].update(ok=False, error=str(claim))
+            continue
+        key, stored = claim
+        if stored is not None:
+            results[index].update(ok=stored.get("invoice_number") is not None, **stored)
+        else:
+            submit.append((index, key))
+
+    semaphore = asyncio.Semaphore(workers)
+
+    async def generate(invoice: InvoiceCreate) -> Dict[str, Any]:
+        async with semaphore:
+            return await generate_invoice(invoice.model_dump())
+
+    outcomes = await asyncio.gather(
+        *(generate(invoices[index]) for index, _ in submit), return_exceptions=True
+    )
+    completed: List[Tuple[str, Optional[InvoiceRecord], Dict[str, Any]]] = []
+    failed: List[Tuple[str, BaseException]] = []
+    for (index, key), outcome in zip(submit, outcomes, strict=True):
+        if isinstance(outcome, BaseException):
+            failed.append((key, outcome))
+            results[index].update(ok=False, error=_error(outcome))
+            continue
+        record, response = invoice_outcome(key, invoices[index], outcome)
+        completed.append((key, record, response))
+        results[index].update(ok=record is not None, **response)
+        if record is None and outcome.get("error_message"):
+            results[index]["error"] = outcome["error_message"]
+    await run_blocking(complete_invoice_requests, completed)
+    if failed:
+        await run_blocking(_fail_requests, failed)
+
+    created = sum(1 for _, record, _ in completed if record is not None)
+    errors = sum(1 for result in results if not result["ok"])
+    logger.info(
+        "Invoice batch of %s: %s created, %s failed", len(invoices), created, errors
+    )
+    return {"total": len(invoices), "created": created, "failed": errors, "results": results}
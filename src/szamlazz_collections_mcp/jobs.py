@@ -0,0 +1,391 @@
+"""Durable SQLite-backed queue for outbound Számlázz.hu and SMTP work.
+
+Tools enqueue a job and return its id at once; worker threads, grouped per destination
+so a slow SMTP server cannot starve invoice submission, claim ready jobs and run them.
+Failures that are known to be transient are retried with exponential backoff. Only one
+queued or running job may exist per dedupe key.
+
+A claimed job carries the claiming process's ``WORKER_ID`` and a lease of ``JOBS_LEASE``
+seconds, which the worker pool renews while the process lives. Only jobs whose lease
+has run out are treated as interrupted, so processes sharing the database never
+recover each other's running jobs.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import get_settings
+from .models import InvoiceCreate
+from .utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+SZAMLAZZ = "szamlazz"
+SMTP = "smtp"
+DESTINATIONS = (SZAMLAZZ, SMTP)
+
+
+@dataclass(frozen=True)
+class JobHandler:
+    destination: str
+    run: Callable[[Dict[str, Any]], Dict[str, Any]]
+    is_retryable: Callable[[Exception], bool]
+    # Whether a job interrupted mid-attempt (process crash) may simply be run again.
+    resumable: bool
+
+
+# The workflows, and httpx and smtplib with them, are imported when the first job runs,
+# so starting the workers costs no more than the SQLite queries they poll with.
+
+
+def _transient_smtp_failure(exc: Exception) -> bool:
+    import smtplib
+
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError))
+
+
+def _request_not_sent(exc: Exception) -> bool:
+    from .szamlazz_client import request_not_sent
+
+    return request_not_sent(exc)
+
+
+def _run_create_invoice(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from .services import create_invoice
+
+    return create_invoice(InvoiceCreate.model_validate(payload))
+
+
+def _run_register_payment(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from .services import register_payment_remote
+
+    return register_payment_remote(
+        payload["invoice_number"],
+        date.fromisoformat(payload["paid_date"]),
+        payload["amount"],
+        payload.get("currency", "HUF"),
+    )
+
+
+def _run_send_reminder(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from .services import send_reminder
+
+    return send_reminder(**payload)
+
+
+# Invoice generation and payment registration are not idempotent upstream, so they are
+# only retried when the request provably never left this process.
+HANDLERS: Dict[str, JobHandler] = {
+    "create_invoice": JobHandler(
+        SZAMLAZZ, _run_create_invoice, _request_not_sent, resumable=False
+    ),
+    "register_payment": JobHandler(
+        SZAMLAZZ, _run_register_payment, _request_not_sent, resumable=False
+    ),
+    "send_reminder": JobHandler(SMTP, _run_send_reminder, _transient_smtp_failure, resumable=True),
+}
+
+_wakeups: Dict[str, threading.Condition] = {name: threading.Condition() for name in DESTINATIONS}
+
+
+def _job_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def _notify(destination: str) -> None:
+    condition = _wakeups[destination]
+    with condition:
+        condition.notify()
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    with db_connection(readonly=True) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+
+def enqueue_job(
+    kind: str, payload: Dict[str, Any], dedupe_key: Optional[str] = None
+) -> Dict[str, Any]:
+    """Persist a job and wake a worker; returns the job, or the active duplicate."""
+    handler = HANDLERS.get(kind)
+    if handler is None:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    now = datetime.utcnow()
+    deduplicated = False
+    with db_connection() as conn:
+        while True:
+            try:
+                cur = conn.execute(
+                    """
+                    INSERT INTO jobs (
+                        kind, destination, payload, dedupe_key, status, attempts, max_attempts,
+                        next_run_at, created_at, updated_at
+                    ) VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+                    """,
+                    (
+                        kind,
+                        handler.destination,
+                        json.dumps(payload, default=str),
+                        dedupe_key,
+                        get_settings().jobs_max_attempts,
+                        now,
+                        now,
+                        now,
+                    ),
+                )
+                conn.commit()
+                job_id = cur.lastrowid
+                break
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')",
+                    (dedupe_key,),
+                ).fetchone()
+                if row is not None:
+                    job_id = row[0]
+                    deduplicated = True
+                    break
+                # The duplicate finished, in another process, before it could be read
+                # back; its key is free again, so insert once more.
+    if not deduplicated:
+        logger.info("Enqueued %s job %s", kind, job_id)
+        _notify(handler.destination)
+    job = get_job(job_id)
+    job["deduplicated"] = deduplicated
+    return job
+
+
+def _lease_until(now: datetime) -> datetime:
+    return now + timedelta(seconds=get_settings().jobs_lease)
+
+
+def claim_job(destination: str) -> Optional[Dict[str, Any]]:
+    now = datetime.utcnow()
+    with db_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND destination = ? AND next_run_at <= ?
+            ORDER BY next_run_at, id LIMIT 1
+            """,
+            (destination, now),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            """
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?,
+                worker_id = ?, lease_expires_at = ?
+            WHERE id = ?
+            """,
+            (now, WORKER_ID, _lease_until(now), row[0]),
+        )
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row[0],)).fetchone()
+        conn.commit()
+    return _job_dict(job)
+
+
+def _finish(
+    job_id: int,
+    status: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+    next_run_at: Optional[datetime] = None,
+) -> None:
+    now = datetime.utcnow()
+    encoded = json.dumps(result, default=str) if result is not None else None
+    with db_connection() as conn:
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = ?, result = ?, last_error = ?,
+                next_run_at = COALESCE(?, next_run_at), updated_at = ?
+            WHERE id = ?
+            """,
+            (status, encoded, error, next_run_at, now, job_id),
+        )
+        conn.commit()
+
+
+def run_job(job: Dict[str, Any]) -> None:
+    handler = HANDLERS[job["kind"]]
+    try:
+        result = handler.run(job["payload"])
+    except Exception as exc:
+        error = f"{exc.__class__.__name__}: {exc}"
+        if handler.is_retryable(exc) and job["attempts"] < job["max_attempts"]:
+            settings = get_settings()
+            delay = min(
+                settings.jobs_retry_backoff * 2 ** (job["attempts"] - 1), settings.jobs_max_backoff
+            )
+            retry_at = datetime.utcnow() + timedelta(seconds=delay)
+            _finish(job["id"], "queued", error=error, next_run_at=retry_at)
+            logger.warning(
+                "Job %s (%s) failed, retrying in %.1fs: %s", job["id"], job["kind"], delay, error
+            )
+        else:
+            _finish(job["id"], "failed", error=error)
+            logger.error("Job %s (%s) failed permanently: %s", job["id"], job["kind"], error)
+        return
+    _finish(job["id"], "succeeded", result=result)
+    logger.info("Job %s (%s) succeeded", job["id"], job["kind"])
+
+
+def run_pending_jobs(destination: Optional[str] = None) -> int:
+    """Run every ready job on the calling thread; returns how many were run."""
+    count = 0
+    for name in [destination] if destination else DESTINATIONS:
+        while (job := claim_job(name)) is not None:
+            run_job(job)
+            count += 1
+    return count
+
+
+def renew_leases() -> int:
+    """Extend the leases of the jobs this process is running; returns how many."""
+    now = datetime.utcnow()
+    with db_connection() as conn:
+        renewed = conn.execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE status = 'running' AND worker_id = ?",
+            (_lease_until(now), WORKER_ID),
+        ).rowcount
+        conn.commit()
+    return renewed
+
+
+# Running jobs of another process whose lease has run out, or from before leases existed.
+_INTERRUPTED = (
+    "status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?) "
+    "AND (worker_id IS NULL OR worker_id != ?)"
+)
+
+
+def recover_interrupted_jobs() -> int:
+    """Handle jobs left 'running' by a process that stopped renewing their leases.
+
+    Resumable jobs are queued again; the rest are failed, because their upstream call
+    may or may not have gone through and must be checked before resubmitting.
+    """
+    resumable = [kind for kind, handler in HANDLERS.items() if handler.resumable]
+    placeholders = ", ".join("?" for _ in resumable)
+    now = datetime.utcnow()
+    with db_connection() as conn:
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? "
+            f"WHERE {_INTERRUPTED} AND kind IN ({placeholders})",
+            (now, now, WORKER_ID, *resumable),
+        ).rowcount
+        failed = conn.execute(
+            f"""
+            UPDATE jobs SET status = 'failed', updated_at = ?,
+                last_error = 'Interrupted by shutdown; verify in Számlázz.hu before retrying'
+            WHERE {_INTERRUPTED}
+            """,
+            (now, now, WORKER_ID),
+        ).rowcount
+        conn.commit()
+    if requeued or failed:
+        logger.warning("Recovered interrupted jobs: %s requeued, %s failed", requeued, failed)
+    return requeued + failed
+
+
+class JobWorkerPool:
+    def __init__(self, concurrency: Dict[str, int], poll_interval: float = 1.0) -> None:
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _work(self, destination: str) -> None:
+        condition = _wakeups[destination]
+        while not self._stopping.is_set():
+            try:
+                job = claim_job(destination)
+            except Exception:
+                logger.exception("Failed to claim %s job", destination)
+                job = None
+            if job is None:
+                with condition:
+                    condition.wait(timeout=self.poll_interval)
+                continue
+            run_job(job)
+
+    def _heartbeat(self, interval: float) -> None:
+        # Keeps this process's leases alive and picks up jobs of processes that died.
+        while not self._stopping.wait(interval):
+            try:
+                renew_leases()
+                recover_interrupted_jobs()
+            except Exception:
+                logger.exception("Failed to renew job leases")
+
+    def start(self) -> None:
+        for destination, workers in self.concurrency.items():
+            for index in range(max(0, workers)):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(destination,),
+                    name=f"jobs-{destination}-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info("Started %s job workers", len(self._threads))
+        interval = max(1.0, get_settings().jobs_lease / 3)
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(interval,), name="jobs-heartbeat", daemon=True
+        )
+        heartbeat.start()
+        self._threads.append(heartbeat)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        for condition in _wakeups.values():
+            with condition:
+                condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+
+_workers: Optional[JobWorkerPool] = None
+
+
+def start_workers() -> Optional[JobWorkerPool]:
+    global _workers
+    settings = get_settings()
+    if not settings.jobs_enabled or _workers is not None:
+        return _workers
+    recover_interrupted_jobs()
+    _workers = JobWorkerPool(
+        {SZAMLAZZ: settings.jobs_szamlazz_concurrency, SMTP: settings.jobs_smtp_concurrency},
+        poll_interval=settings.jobs_poll_interval,
+    )
+    _workers.start()
+    return _workers
+
+
+def stop_workers(timeout: Optional[float] = 30.0) -> None:
+    global _workers
+    if _workers is not None:
+        _workers.stop(timeout)
+        _workers = None
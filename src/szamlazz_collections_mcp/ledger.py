@@ -0,0 +1,262 @@
+"""Columnar in-memory snapshot of the invoice ledger for the reporting tools.
+
+Aggregates such as the aging report do not need ``InvoiceRecord`` objects, only a few
+columns. The snapshot keeps due dates (as ordinals), amounts and small integer codes
+for status, currency and customer in ``array`` buffers, loads them once, and patches
+the rows reported by the storage write listener. With NumPy installed (the
+``analytics`` extra) aggregates run vectorized over zero-copy views of those buffers;
+without it they fall back to a single pass in Python.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+from . import fx
+from .config import get_settings
+from .storage import OUTSTANDING_SQL, _aging_buckets, _aging_result, add_write_listener
+from .utils import db_connection
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when the analytics extra is missing
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# julianday() of 0001-01-01 is 1721425.5, so this yields date.toordinal() in SQL.
+_SELECT_SQL = f"""
+SELECT invoice_number, buyer_email, currency, status,
+       CAST(julianday(due_date) - 1721424.5 AS INTEGER), {OUTSTANDING_SQL}
+FROM invoices
+"""
+_REFRESH_BATCH = 500
+
+
+class _Codes:
+    """Interns strings as small integers."""
+
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def get(self, value: str) -> int:
+        return self._index.get(value, -1)
+
+
+class LedgerSnapshot:
+    def __init__(self) -> None:
+        self.invoice_numbers: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self.customers = _Codes()
+        self.currencies = _Codes()
+        self.statuses = _Codes()
+        self.customer = array("i")
+        self.currency = array("i")
+        self.status = array("i")
+        self.due = array("i")
+        self.amount = array("d")
+
+    def __len__(self) -> int:
+        return len(self.invoice_numbers)
+
+    def apply(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Insert or overwrite rows given in ``_SELECT_SQL`` column order."""
+        positions = self._positions
+        customer_code, currency_code, status_code = (
+            self.customers.code,
+            self.currencies.code,
+            self.statuses.code,
+        )
+        for number, email, currency, status, due, amount in rows:
+            position = positions.get(number)
+            if position is None:
+                positions[number] = len(self.invoice_numbers)
+                self.invoice_numbers.append(number)
+                self.customer.append(customer_code(email))
+                self.currency.append(currency_code(currency))
+                self.status.append(status_code(status))
+                self.due.append(due)
+                self.amount.append(amount)
+            else:
+                self.customer[position] = customer_code(email)
+                self.currency[position] = currency_code(currency)
+                self.status[position] = status_code(status)
+                self.due[position] = due
+                self.amount[position] = amount
+
+    def aging(self, bounds: Sequence[int], today: date) -> Dict[str, Any]:
+        buckets = _aging_buckets(bounds)
+        uppers = [upper for _, _, upper in buckets[:-1]]
+        open_code = self.statuses.get("open")
+        currencies = self.currencies.values
+        # One slot per (bucket, currency); the extra bucket row collects non-open invoices.
+        width = len(currencies)
+        slots = (len(buckets) + 1) * width
+        if np is not None and len(self):
+            amount = np.frombuffer(self.amount, dtype=np.float64)
+            days = today.toordinal() - np.frombuffer(self.due, dtype=np.int32)
+            index = np.where(
+                np.frombuffer(self.status, dtype=np.int32) == open_code,
+                np.searchsorted(np.asarray(uppers), days, side="left"),
+                len(buckets),
+            )
+            key = index * width + np.frombuffer(self.currency, dtype=np.int32)
+            counts = np.bincount(key, minlength=slots).tolist()
+            sums = np.bincount(key, weights=amount, minlength=slots).tolist()
+        else:
+            counts = [0] * slots
+            sums = [0.0] * slots
+            today_ordinal = today.toordinal()
+            columns = zip(self.status, self.currency, self.due, self.amount, strict=True)
+            for status, currency, due, amount in columns:
+                if status == open_code:
+                    index = bisect_left(uppers, today_ordinal - due)
+                else:
+                    index = len(buckets)
+                counts[index * width + currency] += 1
+                sums[index * width + currency] += amount
+        labels: List[Optional[str]] = [label for label, _, _ in buckets] + [None]
+        groups = [
+            (labels[key // width], currencies[key % width], int(count), total)
+            for key, (count, total) in enumerate(zip(counts, sums, strict=True))
+            if count
+        ]
+        return _aging_result(buckets, groups, today)
+
+    def overdue(self, min_days_overdue: int, today: date, top_customers: int) -> Dict[str, Any]:
+        """Overdue count and amounts, converted to the base currency at the ``today`` rate."""
+        open_code = self.statuses.get("open")
+        cutoff = today.toordinal() - min_days_overdue
+        factors, missing = fx.conversion_rates(self.currencies.values, today)
+        factor = [factors.get(currency, 0.0) for currency in self.currencies.values]
+        if np is not None and len(self):
+            mask = (np.frombuffer(self.status, dtype=np.int32) == open_code) & (
+                np.frombuffer(self.due, dtype=np.int32) < cutoff
+            )
+            currency = np.frombuffer(self.currency, dtype=np.int32)[mask]
+            amount = np.frombuffer(self.amount, dtype=np.float64)[mask]
+            amount = amount * np.asarray(factor, dtype=np.float64)[currency]
+            per_customer = np.bincount(
+                np.frombuffer(self.customer, dtype=np.int32)[mask],
+                weights=amount,
+                minlength=len(self.customers.values),
+            )
+            count, total = int(mask.sum()), float(amount.sum())
+            order = np.argsort(-per_customer, kind="stable")[:top_customers]
+            ranked = [
+                (int(code), float(per_customer[code])) for code in order if per_customer[code] > 0
+            ]
+        else:
+            totals: Dict[int, float] = {}
+            count, total = 0, 0.0
+            columns = zip(
+                self.customer, self.currency, self.status, self.due, self.amount, strict=True
+            )
+            for customer, currency, status, due, amount in columns:
+                if status == open_code and due < cutoff:
+                    amount *= factor[currency]
+                    count += 1
+                    total += amount
+                    totals[customer] = totals.get(customer, 0.0) + amount
+            ranked = sorted(totals.items(), key=lambda item: -item[1])[:top_customers]
+            ranked = [(code, amount) for code, amount in ranked if amount > 0]
+        return {
+            "count": count,
+            "gross_total": round(total, 2),
+            "base_currency": get_settings().fx_base_currency.upper(),
+            "missing_rates": missing,
+            "top_customers": [
+                {"buyer_email": self.customers.values[code], "gross_total": round(amount, 2)}
+                for code, amount in ranked
+            ],
+        }
+
+
+_lock = threading.Lock()
+_snapshot: Optional[LedgerSnapshot] = None
+_loaded_at = 0.0
+_dirty: Set[str] = set()
+_stale = False
+
+
+def _on_invoice_write(invoice_numbers: Optional[Sequence[str]]) -> None:
+    global _stale
+    with _lock:
+        if invoice_numbers is None:
+            _stale = True
+        else:
+            _dirty.update(invoice_numbers)
+
+
+def _load() -> LedgerSnapshot:
+    snapshot = LedgerSnapshot()
+    start = time.perf_counter()
+    with db_connection(readonly=True) as conn:
+        cur = conn.execute(_SELECT_SQL)
+        while rows := cur.fetchmany(10_000):
+            snapshot.apply(rows)
+    elapsed = time.perf_counter() - start
+    logger.info("Loaded ledger snapshot of %s invoices in %.3fs", len(snapshot), elapsed)
+    return snapshot
+
+
+def _refresh(snapshot: LedgerSnapshot, invoice_numbers: List[str]) -> None:
+    with db_connection(readonly=True) as conn:
+        for start in range(0, len(invoice_numbers), _REFRESH_BATCH):
+            batch = invoice_numbers[start : start + _REFRESH_BATCH]
+            placeholders = ", ".join("?" for _ in batch)
+            query = f"{_SELECT_SQL} WHERE invoice_number IN ({placeholders})"
+            snapshot.apply(conn.execute(query, batch))
+
+
+def _current() -> LedgerSnapshot:
+    """Return an up-to-date snapshot; the caller must hold ``_lock``."""
+    global _snapshot, _loaded_at, _stale
+    ttl = get_settings().ledger_snapshot_ttl
+    expired = ttl > 0 and time.monotonic() - _loaded_at > ttl
+    if _snapshot is None or _stale or expired or len(_dirty) > max(1000, len(_snapshot) // 5):
+        add_write_listener(_on_invoice_write)
+        _dirty.clear()
+        _stale = False
+        _snapshot = _load()
+        _loaded_at = time.monotonic()
+    elif _dirty:
+        _refresh(_snapshot, list(_dirty))
+        _dirty.clear()
+    return _snapshot
+
+
+def reset_snapshot() -> None:
+    global _snapshot
+    with _lock:
+        _snapshot = None
+        _dirty.clear()
+
+
+def aging_summary(bounds: Optional[Sequence[int]] = None, today: Optional[date] = None) -> dict:
+    """Same result as :func:`storage.aging_summary`, computed from the snapshot."""
+    bounds = sorted(set(bounds)) if bounds else get_settings().aging_bucket_bounds
+    with _lock:
+        return _current().aging(bounds, today or date.today())
+
+
+def overdue_summary(
+    min_days_overdue: int = 1, top_customers: int = 10, today: Optional[date] = None
+) -> dict:
+    """Same result as :func:`storage.overdue_summary`, computed from the snapshot."""
+    with _lock:
+        return _current().overdue(min_days_overdue, today or date.today(), max(0, top_customers))
@@ -0,0 +1,369 @@
+"""In-process counters and histograms, exported in the Prometheus text format.
+
+Hot paths (pooled SQLite connections, szamlazz.hu round-trips, template rendering,
+SMTP sends and every MCP tool) record into module-level metrics. An observation is a
+``perf_counter`` pair, a bisect over the bucket bounds and a short locked update, well
+under the cost of the work being measured, so instrumentation stays on in production;
+``METRICS_ENABLED=false`` skips it entirely. The text format is served on
+``METRICS_PORT`` at ``/metrics`` and summarized by the ``metrics`` tool.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from .config import get_settings
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def enabled() -> bool:
+    return get_settings().metrics_enabled
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = bounds
+        # The last slot counts observations above the largest bound (le="+Inf").
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by interpolating inside its bucket, as Prometheus does."""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index else 0.0
+                return lower + (self.bounds[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric: _Metric) -> Any:
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is None:
+            _registry[metric.name] = metric
+            return metric
+    if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+        raise ValueError(f"Metric {metric.name} is already registered with another shape")
+    return existing
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = LATENCY_BUCKETS,
+) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def reset() -> None:
+    """Drop every recorded series; the metrics themselves stay registered."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        metric.clear()
+
+
+def observe(metric: Histogram, value: float, *labels: str) -> None:
+    if enabled():
+        metric.labels(*labels).observe(value)
+
+
+def inc(metric: Counter, *labels: str, amount: float = 1.0) -> None:
+    if enabled():
+        metric.labels(*labels).inc(amount)
+
+
+TOOL_SECONDS = histogram("mcp_tool_duration_seconds", "MCP tool call latency", ["tool"])
+TOOL_ERRORS = counter("mcp_tool_errors_total", "MCP tool calls that raised", ["tool", "error"])
+
+
+@contextmanager
+def timed(latency: Histogram, errors: Optional[Counter], *labels: str) -> Iterator[None]:
+    """Record the duration of the block, and count exceptions it raises by type."""
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        if errors is not None:
+            errors.labels(*labels, exc.__class__.__name__).inc()
+        raise
+    finally:
+        latency.labels(*labels).observe(time.perf_counter() - start)
+
+
+def instrument(latency: Histogram, errors: Optional[Counter], *labels: str) -> Callable[[F], F]:
+    """Decorator form of :func:`timed` for sync and async functions."""
+
+    def decorator(func: F) -> F:
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with timed(latency, errors, *labels):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with timed(latency, errors, *labels):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def instrument_tool(func: F) -> F:
+    return instrument(TOOL_SECONDS, TOOL_ERRORS, func.__name__)(func)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for values, child in metric.children():
+            if isinstance(metric, Histogram):
+                with child._lock:
+                    counts, total = list(child.counts), child.sum
+                cumulative = 0
+                for bound, count in zip((*metric.buckets, "+Inf"), counts, strict=True):
+                    cumulative += count
+                    le = 'le="{}"'.format(bound if bound == "+Inf" else _format_value(bound))
+                    labels = _label_text(metric.labelnames, values, le)
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                labels = _label_text(metric.labelnames, values)
+                lines.append(f"{metric.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{metric.name}_count{labels} {cumulative}")
+            else:
+                labels = _label_text(metric.labelnames, values)
+                lines.append(f"{metric.name}{labels} {_format_value(child.value)}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, Any]:
+    """Per-series counts, totals and estimated p50/p95/p99, keyed by metric name."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    result: Dict[str, Any] = {}
+    for metric in metrics:
+        series = []
+        for values, child in metric.children():
+            entry: Dict[str, Any] = {"labels": dict(zip(metric.labelnames, values, strict=True))}
+            if isinstance(metric, Histogram):
+                with child._lock:
+                    count = sum(child.counts)
+                entry.update(
+                    count=count,
+                    sum=round(child.sum, 6),
+                    mean=round(child.sum / count, 6) if count else None,
+                    p50=child.quantile(0.5),
+                    p95=child.quantile(0.95),
+                    p99=child.quantile(0.99),
+                )
+            else:
+                entry["value"] = child.value
+            series.append(entry)
+        if series:
+            result[metric.name] = {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "series": series,
+            }
+    return result
+
+
+def _handler_class() -> type:
+    # http.server is only imported when the endpoint is enabled.
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug("metrics: " + format, *args)
+
+    return _MetricsHandler
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve ``/metrics`` from a daemon thread; independent of the MCP transport."""
+    global _server
+    if _server is None:
+        from http.server import ThreadingHTTPServer
+
+        _server = ThreadingHTTPServer((host, port), _handler_class())
+        _server.daemon_threads = True
+        thread = threading.Thread(
+            target=_server.serve_forever, name="metrics-http", daemon=True
+        )
+        thread.start()
+        logger.info("Serving metrics on http://%s:%s/metrics", host, _server.server_address[1])
+    return _server
+
+
+def stop_http_server() -> None:
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
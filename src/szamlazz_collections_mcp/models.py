@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, validator
 
@@ -60,6 +60,19 @@ class InvoiceRecord(BaseModel):
     last_reminded_at: Optional[datetime]
     reminders_sent_count: int
     external_id: Optional[str] = None
+    paid_amount: float = 0.0
+    last_synced_at: Optional[datetime] = None
+
+
+class InvoicePage(BaseModel):
+    items: List[InvoiceRecord]
+    next_cursor: Optional[str] = Field(
+        default=None, description="Opaque token for the next page; absent on the last page"
+    )
+    totals: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Per-currency and converted totals of every matching invoice, if requested",
+    )
 
 
 class ReminderDraft(BaseModel):
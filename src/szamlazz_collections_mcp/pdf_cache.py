@@ -0,0 +1,228 @@
+"""Content-addressed on-disk cache of invoice PDFs.
+
+Issued invoices never change, so a PDF is downloaded from szamlazz.hu once and served
+from ``PDF_CACHE_DIR`` afterwards. Blobs are stored under their SHA-256; the
+``pdf_cache`` table maps invoice numbers to blobs and tracks last access, and the least
+recently used entries are evicted once the cache grows past ``PDF_CACHE_MAX_MB``.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+
+from .config import get_settings
+from .utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class CachedPdf(NamedTuple):
+    invoice_number: str
+    path: str
+    sha256: str
+    size: int
+
+
+def _blob_path(sha256: str) -> str:
+    return os.path.join(get_settings().pdf_cache_dir, sha256[:2], f"{sha256}.pdf")
+
+
+def _write_blob(path: str, content: bytes) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_blob(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def lookup(invoice_number: str, touch: bool = True) -> Optional[CachedPdf]:
+    """Return the cached PDF for an invoice, or None.
+
+    Hits are read on a pooled reader connection; only ``touch`` (marking the entry as
+    recently used) and dropping an entry whose blob has vanished take the writer.
+    """
+    with db_connection(readonly=True) as conn:
+        row = conn.execute(
+            "SELECT sha256, size FROM pdf_cache WHERE invoice_number = ?", (invoice_number,)
+        ).fetchone()
+    if row is None:
+        return None
+    path = _blob_path(row["sha256"])
+    if not os.path.exists(path):
+        # The blob was removed behind our back; forget the entry and refetch.
+        with db_connection() as conn:
+            conn.execute(
+                "DELETE FROM pdf_cache WHERE invoice_number = ? AND sha256 = ?",
+                (invoice_number, row["sha256"]),
+            )
+            conn.commit()
+        return None
+    if touch:
+        with db_connection() as conn:
+            conn.execute(
+                "UPDATE pdf_cache SET last_accessed_at = ? WHERE invoice_number = ?",
+                (datetime.utcnow(), invoice_number),
+            )
+            conn.commit()
+    return CachedPdf(invoice_number, path, row["sha256"], row["size"])
+
+
+def _index(invoice_number: str, sha256: str, size: int) -> CachedPdf:
+    now = datetime.utcnow()
+    with db_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO pdf_cache (invoice_number, sha256, size, fetched_at, last_accessed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (invoice_number) DO UPDATE SET
+                sha256 = excluded.sha256,
+                size = excluded.size,
+                fetched_at = excluded.fetched_at,
+                last_accessed_at = excluded.last_accessed_at
+            """,
+            (invoice_number, sha256, size, now, now),
+        )
+        conn.commit()
+        evict(keep=invoice_number)
+    return CachedPdf(invoice_number, _blob_path(sha256), sha256, size)
+
+
+def store(invoice_number: str, content: bytes) -> CachedPdf:
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = _blob_path(sha256)
+    # Holding the writer connection keeps eviction from deleting the blob between it
+    # being written and its index row being committed.
+    with db_connection():
+        if not os.path.exists(path):
+            _write_blob(path, content)
+        return _index(invoice_number, sha256, len(content))
+
+
+class PdfWriter:
+    """Spools a PDF into the cache as it downloads, hashing it on the way.
+
+    Chunks go to a temporary file in ``PDF_CACHE_DIR``; :meth:`commit` moves it to its
+    content address and indexes it, :meth:`discard` drops it. The PDF is never held
+    in memory as a whole.
+    """
+
+    def __init__(self) -> None:
+        directory = get_settings().pdf_cache_dir
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self, invoice_number: str) -> CachedPdf:
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        path = _blob_path(sha256)
+        with db_connection():
+            if os.path.exists(path):
+                _remove_blob(self._tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self._tmp_path, path)
+            return _index(invoice_number, sha256, self.size)
+
+    def discard(self) -> None:
+        self._file.close()
+        _remove_blob(self._tmp_path)
+
+
+def cache_size() -> int:
+    with db_connection(readonly=True) as conn:
+        row = conn.execute(
+            """
+            SELECT COALESCE(SUM(size), 0)
+            FROM (SELECT MAX(size) AS size FROM pdf_cache GROUP BY sha256)
+            """
+        ).fetchone()
+        return row[0]
+
+
+def evict(max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+    """Drop least recently used entries until the blobs fit in ``max_bytes``.
+
+    ``keep`` is never evicted, so a PDF larger than the whole budget can still be served
+    once. Returns the number of entries removed.
+    """
+    if max_bytes is None:
+        max_bytes = int(get_settings().pdf_cache_max_mb * 1024 * 1024)
+    removed = 0
+    with db_connection() as conn:
+        total = cache_size()
+        if total <= max_bytes:
+            return 0
+        rows = conn.execute(
+            """
+            SELECT invoice_number, sha256, size FROM pdf_cache
+            WHERE invoice_number != ?
+            ORDER BY last_accessed_at, invoice_number
+            """,
+            (keep or "",),
+        ).fetchall()
+        for row in rows:
+            if total <= max_bytes:
+                break
+            conn.execute("DELETE FROM pdf_cache WHERE invoice_number = ?", (row["invoice_number"],))
+            removed += 1
+            shared = conn.execute(
+                "SELECT 1 FROM pdf_cache WHERE sha256 = ? LIMIT 1", (row["sha256"],)
+            ).fetchone()
+            if shared is None:
+                _remove_blob(_blob_path(row["sha256"]))
+                total -= row["size"]
+        conn.commit()
+    if removed:
+        logger.info("Evicted %s cached PDFs", removed)
+    return removed
+
+
+def read_chunk(
+    cached: CachedPdf, offset: int = 0, length: int = 3 * 256 * 1024
+) -> Dict[str, Any]:
+    """Return one base64 slice of a cached PDF, for clients that fetch it piecewise.
+
+    ``length`` is rounded down to a multiple of 3 so consecutive slices concatenate into
+    valid base64.
+    """
+    if offset < 0:
+        raise ValueError("offset must be non-negative")
+    length = max(3, length - length % 3)
+    with open(cached.path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(length)
+    end = offset + len(chunk)
+    return {
+        "invoice_number": cached.invoice_number,
+        "sha256": cached.sha256,
+        "size": cached.size,
+        "offset": offset,
+        "data_base64": base64.b64encode(chunk).decode(),
+        "next_offset": end if end < cached.size else None,
+    }
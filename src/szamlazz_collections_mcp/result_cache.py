@@ -0,0 +1,139 @@
+"""Result cache for the read-only ledger tools.
+
+Agents repeat the same listing or summary call several times in one conversation. A
+tool wrapped in :func:`cached_tool` keeps its results per argument set, in an LRU of
+``RESULT_CACHE_SIZE`` entries, for at most ``RESULT_CACHE_TTL`` seconds.
+
+Each entry is tagged with the ledger generation, which every committed invoice write in
+this process bumps (see :func:`~.storage.notify_invoice_write`), and with the FX rate
+generation; an entry from an older generation is never served. The ledger tools count
+overdue days and convert amounts as of today, so entries also lapse at local midnight.
+Writes made by another process, such as a command-line import, are only seen once the
+TTL has run out.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, NamedTuple, Optional, Tuple, TypeVar
+
+from . import fx, metrics
+from .config import get_settings
+from .storage import ledger_generation
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_REQUESTS = metrics.counter(
+    "result_cache_requests_total", "Read-only tool calls by cache outcome", ["tool", "outcome"]
+)
+
+Generation = Tuple[int, int]
+
+
+class _Entry(NamedTuple):
+    value: Any
+    generation: Generation
+    day: date
+    expires_at: float
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: str, generation: Generation, today: date) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if (
+                entry.generation != generation
+                or entry.day != today
+                or entry.expires_at <= time.monotonic()
+            ):
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry.value
+
+    def put(self, key: str, value: Any, generation: Generation, today: date) -> None:
+        entry = _Entry(value, generation, today, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[ResultCache] = None
+
+
+def get_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = ResultCache(settings.result_cache_size, settings.result_cache_ttl)
+    return _cache
+
+
+def reset_cache() -> None:
+    global _cache
+    _cache = None
+
+
+def _generation() -> Generation:
+    return ledger_generation(), fx.rates_generation()
+
+
+def _today() -> date:
+    return date.today()
+
+
+def cached_tool(func: F) -> F:
+    """Serve repeated calls of an async read-only tool from the result cache.
+
+    Cached values are shared between callers and must not be modified.
+    """
+    signature = inspect.signature(func)
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        cache = get_cache()
+        if not cache.enabled:
+            return await func(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = json.dumps([name, bound.arguments], sort_keys=True, default=str)
+        # Read before computing: a write that lands meanwhile leaves the entry outdated.
+        generation, today = _generation(), _today()
+        hit, value = cache.get(key, generation, today)
+        if hit:
+            metrics.inc(_REQUESTS, name, "hit")
+            return value
+        metrics.inc(_REQUESTS, name, "miss")
+        value = await func(*args, **kwargs)
+        cache.put(key, value, generation, today)
+        return value
+
+    return wrapper  # type: ignore[return-value]
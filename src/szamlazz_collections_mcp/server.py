@@ -1,174 +1,558 @@
 from __future__ import annotations
 
+import asyncio
+import importlib
 import logging
+import sys
 from datetime import date, datetime
-from typing import Optional
+from types import ModuleType
+from typing import Any, Callable, Optional, TypeVar
 
-from fastmcp import FastMCP, MCP
+from fastmcp import MCP, FastMCP
 from fastmcp.annotations import ToolAnnotation
 from fastmcp.auth import StaticTokenVerifier
 from fastmcp.context import Context
 
+from . import metrics
 from .config import configure_logging, get_settings
-from .emailer import render_reminder, send_email
-from .models import InvoiceCreate, InvoiceRecord
+from .fx import load_fx_rates
+from .importer import import_invoice_file
+from .jobs import enqueue_job, get_job, start_workers, stop_workers
+from .models import InvoiceCreate, InvoicePage, InvoiceRecord
+from .pdf_cache import CachedPdf, read_chunk
+from .pdf_cache import lookup as lookup_cached_pdf
+from .result_cache import cached_tool
 from .storage import (
+    DEFAULT_PAGE_SIZE,
     aging_summary,
+    bulk_insert_invoices,
+    customer_summary,
     get_invoice,
     init_db,
-    insert_invoice,
-    list_invoices,
-    list_overdue,
+    list_invoices_page,
+    list_overdue_page,
     mark_invoice_paid,
-    update_reminder_metadata,
+    top_debtors,
 )
-from .szamlazz_client import generate_invoice, query_invoice_pdf, query_invoice_xml, register_payment
+from .storage import overdue_summary as storage_overdue_summary
+from .utils import close_pool, get_pool, resolve_within, run_blocking, shutdown_executor
 
-configure_logging()
 logger = logging.getLogger(__name__)
-settings = get_settings()
 
 app: MCP = FastMCP("szamlazz-collections", description="Számlázz.hu collections MCP server")
-verifier = StaticTokenVerifier(token=settings.mcp_token)
-app.set_auth(verifier)
 
+F = TypeVar("F", bound=Callable[..., Any])
 
-@app.tool(
+
+# Only what the local ledger tools need is imported up front. The Számlázz.hu clients
+# (httpx), templates (jinja2), SMTP, the NumPy-backed ledger snapshot and the optional
+# background schedulers are reached through these two helpers instead.
+def _lazy(name: str) -> ModuleType:
+    """The package module ``name``, imported on first use."""
+    return importlib.import_module(f".{name}", __package__)
+
+
+def _loaded(name: str) -> Optional[ModuleType]:
+    """The package module ``name`` if it has been imported, for cleanup on shutdown."""
+    return sys.modules.get(f"{__package__}.{name}")
+
+
+def tool(**options: Any) -> Callable[[F], F]:
+    """``app.tool`` that also records each call's latency and errors under the tool name."""
+    register = app.tool(**options)
+    return lambda func: register(metrics.instrument_tool(func))
+
+
+@tool(
     title="Health check",
     annotations=[ToolAnnotation(readOnlyHint=True)],
 )
-def health_check() -> dict:
+async def health_check() -> dict:
     return {"status": "ok", "version": "0.1.0"}
 
 
-@app.tool(
+@tool(
     title="Create invoice",
     annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
 )
-def create_invoice(invoice: InvoiceCreate, context: Optional[Context] = None) -> dict:
-    payload = invoice.model_dump()
-    result = generate_invoice(payload)
-    invoice_number = result.get("invoice_number") or "unknown"
-    record = InvoiceRecord(
-        invoice_number=invoice_number,
-        buyer_name=invoice.buyer.name,
-        buyer_email=invoice.buyer.email,
-        issue_date=invoice.issue_date,
-        due_date=invoice.due_date,
-        gross_total=sum(item.gross_value for item in invoice.items),
-        currency=invoice.currency,
-        status="open",
-        created_at=datetime.utcnow(),
-        last_reminded_at=None,
-        reminders_sent_count=0,
-        external_id=invoice.external_id,
-    )
-    insert_invoice(record)
-    return {
-        "invoice_number": invoice_number,
-        "stored_record": record.model_dump(),
-        "raw_response_summary": result.get("raw_response_summary"),
-    }
+async def create_invoice(
+    invoice: InvoiceCreate,
+    context: Optional[Context] = None,
+    background: bool = False,
+    force: bool = False,
+) -> dict:
+    """Issue an invoice. Retrying an identical request returns the stored result.
+
+    ``force`` resubmits a request whose earlier attempt ended in an unknown state, after
+    checking in Számlázz.hu that no invoice was created.
+    """
+    if background:
+        dedupe_key = f"create_invoice:{invoice.external_id}" if invoice.external_id else None
+        payload = invoice.model_dump(mode="json")
+        return await run_blocking(enqueue_job, "create_invoice", payload, dedupe_key)
+    key, stored = await run_blocking(_lazy("idempotency").begin_invoice_request, invoice, force)
+    if stored is not None:
+        return stored
+    try:
+        result = await _lazy("szamlazz_async_client").generate_invoice(invoice.model_dump())
+    except Exception as exc:
+        await run_blocking(_lazy("idempotency").fail_invoice_request, key, exc)
+        raise
+    return await run_blocking(_lazy("services").finish_invoice_request, key, invoice, result)
+
+
+@tool(
+    title="Create invoices",
+    annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
+)
+async def create_invoices(invoices: list[InvoiceCreate], force: bool = False) -> dict:
+    """Issue a batch of invoices concurrently, with one result per invoice.
+
+    An invoice that fails does not stop the others; retrying the batch returns the
+    stored result for every invoice already created.
+    """
+    return await _lazy("invoice_batch").create_invoices(invoices, force=force)
 
 
-@app.tool(
+@tool(
+    title="Import invoices",
+    annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=False)],
+)
+async def import_invoices(
+    invoices: Optional[list[InvoiceRecord]] = None,
+    path: Optional[str] = None,
+    file_format: Optional[str] = None,
+    chunk_size: int = 5000,
+) -> dict:
+    """Bulk upsert invoice records, given inline or as a CSV/JSONL file in ``IMPORT_DIR``.
+
+    ``path`` is relative to ``IMPORT_DIR``; files outside it cannot be imported.
+    """
+    if path:
+        path = resolve_within(get_settings().import_dir, path)
+        return await run_blocking(
+            import_invoice_file, path, file_format=file_format, chunk_size=chunk_size
+        )
+    if invoices is None:
+        raise ValueError("Provide either invoices or path")
+    return await run_blocking(bulk_insert_invoices, invoices, chunk_size=chunk_size)
+
+
+@tool(
     title="Query invoice PDF",
     annotations=[ToolAnnotation(readOnlyHint=True)],
 )
-def query_invoice_pdf_tool(invoice_number: str, save: bool = True) -> dict:
-    return query_invoice_pdf(invoice_number, save=save)
+async def query_invoice_pdf_tool(
+    invoice_number: str, save: bool = True, inline: bool = True, refresh: bool = False
+) -> dict:
+    """Fetch an invoice PDF through the local cache.
+
+    Set ``inline`` to false to get the cached file path instead of base64 content, and
+    use ``read_invoice_pdf_chunk`` to transfer large files piecewise.
+    """
+    return await _lazy("szamlazz_async_client").query_invoice_pdf(
+        invoice_number, save=save, inline=inline, refresh=refresh
+    )
 
 
-@app.tool(
+@tool(
+    title="Read invoice PDF chunk",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+async def read_invoice_pdf_chunk(
+    invoice_number: str, offset: int = 0, length: int = 3 * 256 * 1024
+) -> dict:
+    """Return one base64 slice of an invoice PDF; follow ``next_offset`` until it is null."""
+    cached = None
+    if offset > 0:
+        # Only the first chunk marks the document as recently used in the cache.
+        cached = await run_blocking(lookup_cached_pdf, invoice_number, touch=False)
+    if cached is None:
+        result = await _lazy("szamlazz_async_client").query_invoice_pdf(
+            invoice_number, save=False, inline=False
+        )
+        cached = CachedPdf(invoice_number, result["cache_path"], result["sha256"], result["size"])
+    return await run_blocking(read_chunk, cached, offset, length)
+
+
+@tool(
     title="Query invoice XML",
     annotations=[ToolAnnotation(readOnlyHint=True)],
 )
-def query_invoice_xml_tool(invoice_number: str) -> dict:
-    return query_invoice_xml(invoice_number)
+async def query_invoice_xml_tool(invoice_number: str, include_xml: bool = True) -> dict:
+    """Return an invoice's key fields (dates, buyer, totals) and, optionally, its raw XML."""
+    client = _lazy("szamlazz_async_client")
+    return await client.query_invoice_xml(invoice_number, include_xml=include_xml)
+
 
+def _progress_reporter(context: Context) -> Callable[[int, int], None]:
+    """Forward progress from a worker thread to the MCP client on the event loop."""
+    loop = asyncio.get_running_loop()
 
-@app.tool(
+    def report(done: int, total: int) -> None:
+        asyncio.run_coroutine_threadsafe(context.report_progress(done, total), loop)
+
+    return report
+
+
+@tool(
+    title="Export invoice documents",
+    annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
+)
+async def export_invoice_documents(
+    status: Optional[str] = None,
+    due_before: Optional[date] = None,
+    customer_email: Optional[str] = None,
+    include_pdf: bool = True,
+    include_xml: bool = True,
+    target_path: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    context: Optional[Context] = None,
+) -> dict:
+    """Download the PDF/XML of every invoice matching the filters into a ZIP in ``EXPORT_DIR``.
+
+    ``target_path`` is relative to ``EXPORT_DIR``; paths outside it are refused.
+    """
+    if target_path is None:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        target_path = f"invoices-{stamp}.zip"
+    target_path = resolve_within(get_settings().export_dir, target_path)
+    progress = _progress_reporter(context) if context is not None else None
+    return await run_blocking(
+        _lazy("exporter").export_invoices,
+        target_path,
+        status=status,
+        due_before=due_before,
+        customer_email=customer_email,
+        include_pdf=include_pdf,
+        include_xml=include_xml,
+        concurrency=concurrency,
+        progress=progress,
+    )
+
+
+@tool(
     title="List invoices",
     annotations=[ToolAnnotation(readOnlyHint=True)],
 )
-def list_invoices_tool(
-    status: Optional[str] = None, due_before: Optional[date] = None, customer_email: Optional[str] = None
-) -> list[InvoiceRecord]:
-    return list_invoices(status=status, due_before=due_before, customer_email=customer_email)
+@cached_tool
+async def list_invoices_tool(
+    status: Optional[str] = None,
+    due_before: Optional[date] = None,
+    customer_email: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    include_totals: bool = False,
+) -> InvoicePage:
+    return await run_blocking(
+        list_invoices_page,
+        status=status,
+        due_before=due_before,
+        customer_email=customer_email,
+        limit=limit,
+        cursor=cursor,
+        include_totals=include_totals,
+    )
 
 
-@app.tool(
+@tool(
     title="List overdue invoices",
     annotations=[ToolAnnotation(readOnlyHint=True)],
 )
-def list_overdue_invoices(min_days_overdue: int = 1) -> list[InvoiceRecord]:
-    return list_overdue(min_days_overdue)
+@cached_tool
+async def list_overdue_invoices(
+    min_days_overdue: int = 1,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    include_totals: bool = False,
+) -> InvoicePage:
+    return await run_blocking(
+        list_overdue_page,
+        min_days_overdue,
+        limit=limit,
+        cursor=cursor,
+        include_totals=include_totals,
+    )
 
 
-@app.tool(
+@tool(
     title="Mark invoice paid (local)",
     annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=False)],
 )
-def mark_invoice_paid_local(invoice_number: str, paid_date: date) -> dict:
-    record = mark_invoice_paid(invoice_number, paid_date)
+async def mark_invoice_paid_local(invoice_number: str, paid_date: date) -> dict:
+    record = await run_blocking(mark_invoice_paid, invoice_number, paid_date)
     if not record:
         return {"invoice_number": invoice_number, "status": "not_found"}
     return {"invoice_number": invoice_number, "status": record.status}
 
 
-@app.tool(
+@tool(
     title="Register payment in Számlázz.hu",
     annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
 )
-def register_payment_in_szamlazz(invoice_number: str, paid_date: date, amount: float, currency: str = "HUF") -> dict:
-    response = register_payment(invoice_number, paid_date.isoformat(), amount, currency)
-    return response
-
-
-@app.tool(
+async def register_payment_in_szamlazz(
+    invoice_number: str,
+    paid_date: date,
+    amount: float,
+    currency: str = "HUF",
+    background: bool = False,
+) -> dict:
+    if background:
+        payload = {
+            "invoice_number": invoice_number,
+            "paid_date": paid_date.isoformat(),
+            "amount": amount,
+            "currency": currency,
+        }
+        return await run_blocking(
+            enqueue_job, "register_payment", payload, f"register_payment:{invoice_number}"
+        )
+    client = _lazy("szamlazz_async_client")
+    return await client.register_payment(invoice_number, paid_date.isoformat(), amount, currency)
+
+
+@tool(
     title="Generate reminder email",
     annotations=[ToolAnnotation(readOnlyHint=True)],
 )
-def generate_reminder_email(invoice_number: str, language: str = "hu", tone: str = "polite") -> dict:
-    record = get_invoice(invoice_number)
+async def generate_reminder_email(
+    invoice_number: str, language: str = "hu", tone: str = "polite"
+) -> dict:
+    record = await run_blocking(get_invoice, invoice_number)
     if not record:
         raise ValueError("Invoice not found in local store")
-    draft = render_reminder(record, language=language, tone=tone)
+    draft = _lazy("emailer").render_reminder(record, language=language, tone=tone)
     return draft.model_dump()
 
 
-@app.tool(
+@tool(
     title="Send reminder via SMTP",
     annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
 )
-def send_reminder_email_smtp(
-    invoice_number: str, to_email: Optional[str] = None, language: str = "hu", tone: str = "polite"
+async def send_reminder_email_smtp(
+    invoice_number: str,
+    to_email: Optional[str] = None,
+    language: str = "hu",
+    tone: str = "polite",
+    background: bool = False,
 ) -> dict:
-    record = get_invoice(invoice_number)
-    if not record:
-        raise ValueError("Invoice not found in local store")
-    target_email = to_email or record.buyer_email
-    draft = render_reminder(record, language=language, tone=tone)
-    result = send_email(target_email, draft)
-    update_reminder_metadata(invoice_number)
-    return result
+    if background:
+        payload = {
+            "invoice_number": invoice_number,
+            "to_email": to_email,
+            "language": language,
+            "tone": tone,
+        }
+        return await run_blocking(
+            enqueue_job, "send_reminder", payload, f"send_reminder:{invoice_number}"
+        )
+    return await run_blocking(
+        _lazy("services").send_reminder, invoice_number, to_email, language=language, tone=tone
+    )
+
+
+@tool(
+    title="Job status",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+async def job_status(job_id: int) -> dict:
+    job = await run_blocking(get_job, job_id)
+    if not job:
+        return {"job_id": job_id, "status": "not_found"}
+    return job
+
+
+@tool(
+    title="Run reminder campaign",
+    annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
+)
+async def run_reminder_campaign_tool(
+    min_days_overdue: int = 1,
+    not_reminded_within_days: int = 7,
+    language: str = "hu",
+    tone: str = "polite",
+    limit: Optional[int] = None,
+    dry_run: bool = True,
+    rate_per_minute: Optional[float] = None,
+) -> dict:
+    """Send reminders for all overdue invoices not reminded within the given number of days."""
+    return await run_blocking(
+        _lazy("campaigns").run_reminder_campaign,
+        min_days_overdue=min_days_overdue,
+        not_reminded_within_days=not_reminded_within_days,
+        language=language,
+        tone=tone,
+        limit=limit,
+        dry_run=dry_run,
+        rate_per_minute=rate_per_minute,
+    )
 
 
-@app.tool(
+@tool(
     title="Aging summary",
     annotations=[ToolAnnotation(readOnlyHint=True)],
 )
-def aging_summary_tool() -> dict:
-    return aging_summary()
+@cached_tool
+async def aging_summary_tool(bucket_bounds: Optional[list[int]] = None) -> dict:
+    summarize = aging_summary
+    if get_settings().ledger_snapshot:
+        summarize = _lazy("ledger").aging_summary
+    return await run_blocking(summarize, bounds=bucket_bounds)
+
+
+@tool(
+    title="Top debtors",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+@cached_tool
+async def top_debtors_tool(
+    limit: int = 10, currency: Optional[str] = None, dso_days: int = 90
+) -> list[dict]:
+    """Largest open balances converted to the base currency, with oldest open invoice and DSO."""
+    return await run_blocking(top_debtors, limit=limit, currency=currency, dso_days=dso_days)
+
+
+@tool(
+    title="Customer summary",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+@cached_tool
+async def customer_summary_tool(buyer_email: str, dso_days: int = 90) -> list[dict]:
+    """Open balance, oldest open invoice, reminders sent and DSO per currency."""
+    return await run_blocking(customer_summary, buyer_email, dso_days=dso_days)
+
+
+@tool(
+    title="Overdue summary",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+@cached_tool
+async def overdue_summary(min_days_overdue: int = 1, top_customers: int = 10) -> dict:
+    """Count and total of overdue invoices, plus the customers with the largest overdue sums."""
+    summarize = storage_overdue_summary
+    if get_settings().ledger_snapshot:
+        summarize = _lazy("ledger").overdue_summary
+    return await run_blocking(summarize, min_days_overdue, top_customers)
+
+
+@tool(
+    title="Sync ledger with Számlázz.hu",
+    annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
+)
+async def sync_ledger(limit: Optional[int] = None, force: bool = False) -> dict:
+    """Refresh paid amounts and status of open invoices from Számlázz.hu.
+
+    Invoices checked within ``SYNC_MIN_AGE`` are skipped unless ``force`` is set.
+    """
+    min_age = 0.0 if force else None
+    return await run_blocking(_lazy("sync").sync_invoices, limit=limit, min_age=min_age)
+
+
+@tool(
+    title="Preview dunning run",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+async def preview_dunning_run(limit: int = 50) -> dict:
+    """When the next scheduled dunning run starts and which reminders it would send."""
+    return await run_blocking(_lazy("dunning").preview_next_run, limit)
+
+
+@tool(
+    title="Run dunning now",
+    annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=True)],
+)
+async def run_dunning_now(limit: Optional[int] = None) -> dict:
+    """Send the reminders the dunning policy has due now, outside the schedule."""
+    return await run_blocking(_lazy("dunning").run_dunning, "manual", limit)
+
+
+@tool(
+    title="Dunning history",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+async def dunning_history_tool(limit: int = 20, run_id: Optional[int] = None) -> dict:
+    """Recent dunning runs, or the reminders sent by one run."""
+    return await run_blocking(_lazy("dunning").dunning_history, limit, run_id)
+
+
+@tool(
+    title="Import FX rates",
+    annotations=[ToolAnnotation(readOnlyHint=False, destructiveHint=False, openWorldHint=False)],
+)
+async def import_fx_rates(path: str) -> dict:
+    """Load daily exchange rates from an MNB CSV export in ``IMPORT_DIR``.
+
+    ``path`` is relative to ``IMPORT_DIR``; files outside it cannot be read.
+    """
+    path = resolve_within(get_settings().import_dir, path)
+    return await run_blocking(load_fx_rates, path)
+
+
+@tool(
+    title="Számlázz.hu client status",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+async def agent_status_tool() -> dict:
+    """Circuit breaker state, adaptive concurrency limit and rate-limit tokens for Számlázz.hu."""
+    return _lazy("agent_guard").agent_status()
+
+
+@tool(
+    title="Metrics",
+    annotations=[ToolAnnotation(readOnlyHint=True)],
+)
+async def metrics_tool(format: str = "summary") -> Any:
+    """Latency percentiles, counts, errors and sizes per instrumented operation.
+
+    ``format="prometheus"`` returns the same text the ``/metrics`` endpoint serves.
+    """
+    if format == "prometheus":
+        return metrics.render()
+    return metrics.snapshot()
 
 
 @app.on_event("startup")
 def on_startup() -> None:
+    settings = get_settings()
+    # Configured here rather than on import, so importing this module reads no settings
+    # (and no .env file); ``fastmcp run`` fires this event before serving as well.
+    app.set_auth(StaticTokenVerifier(token=settings.mcp_token))
+    configure_logging()
+    get_pool()
     init_db()
+    # Compile the templates now rather than in the first invoice or reminder call.
+    _lazy("templating").warm_templates()
+    start_workers()
+    if settings.sync_interval > 0:
+        _lazy("sync").start_sync()
+    if settings.dunning_schedule:
+        _lazy("dunning").start_dunning()
+    if settings.metrics_port:
+        metrics.start_http_server(settings.metrics_port, settings.metrics_host)
     logger.info("MCP server started")
 
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await run_blocking(stop_workers)
+    for name, stop in (("sync", "stop_sync"), ("dunning", "stop_dunning")):
+        module = _loaded(name)
+        if module is not None:
+            await run_blocking(getattr(module, stop))
+    metrics.stop_http_server()
+    async_client = _loaded("szamlazz_async_client")
+    if async_client is not None:
+        await async_client.close_async_client()
+    sync_client = _loaded("szamlazz_client")
+    if sync_client is not None:
+        sync_client.close_http_client()
+    shutdown_executor()
+    close_pool()
+    logger.info("MCP server stopped")
+
+
 def run() -> None:
+    settings = get_settings()
     transport = settings.mcp_transport or "http"
     app.run(transport=transport, host=settings.host, port=settings.port, path=settings.mcp_path)
 
@@ -0,0 +1,99 @@
+"""Synchronous workflows shared by the MCP tools and the background job workers."""
+
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from .emailer import render_reminder, send_email
+from .idempotency import begin_invoice_request, complete_invoice_request, fail_invoice_request
+from .models import InvoiceCreate, InvoiceRecord
+from .storage import get_invoice, update_reminder_metadata
+from .szamlazz_client import generate_invoice, register_payment
+
+logger = logging.getLogger(__name__)
+
+
+def build_invoice_record(invoice: InvoiceCreate, invoice_number: str) -> InvoiceRecord:
+    return InvoiceRecord(
+        invoice_number=invoice_number,
+        buyer_name=invoice.buyer.name,
+        buyer_email=invoice.buyer.email,
+        issue_date=invoice.issue_date,
+        due_date=invoice.due_date,
+        gross_total=sum(item.gross_value for item in invoice.items),
+        currency=invoice.currency,
+        status="open",
+        created_at=datetime.utcnow(),
+        last_reminded_at=None,
+        reminders_sent_count=0,
+        external_id=invoice.external_id,
+    )
+
+
+def invoice_created_response(
+    record: Optional[InvoiceRecord], result: Dict[str, Any]
+) -> Dict[str, Any]:
+    response = {
+        "invoice_number": record.invoice_number if record else None,
+        "stored_record": record.model_dump(mode="json") if record else None,
+        "raw_response_summary": result.get("raw_response_summary"),
+    }
+    if record is None:
+        response["warning"] = (
+            "No invoice number in the Számlázz.hu response; nothing was stored locally"
+        )
+    return response
+
+
+def invoice_outcome(
+    key: str, invoice: InvoiceCreate, result: Dict[str, Any]
+) -> Tuple[Optional[InvoiceRecord], Dict[str, Any]]:
+    """The record to store and the tool response for a successful upstream call."""
+    invoice_number = result.get("invoice_number")
+    if invoice_number:
+        record = build_invoice_record(invoice, invoice_number)
+    else:
+        record = None
+        logger.warning("Could not parse invoice number for request %s", key)
+    return record, invoice_created_response(record, result)
+
+
+def finish_invoice_request(
+    key: str, invoice: InvoiceCreate, result: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Store the outcome of a successful upstream call and return the tool response."""
+    record, response = invoice_outcome(key, invoice, result)
+    complete_invoice_request(key, record, response)
+    return response
+
+
+def create_invoice(invoice: InvoiceCreate, force: bool = False) -> Dict[str, Any]:
+    key, stored = begin_invoice_request(invoice, force=force)
+    if stored is not None:
+        return stored
+    try:
+        result = generate_invoice(invoice.model_dump())
+    except Exception as exc:
+        fail_invoice_request(key, exc)
+        raise
+    return finish_invoice_request(key, invoice, result)
+
+
+def register_payment_remote(
+    invoice_number: str, paid_date: date, amount: float, currency: str = "HUF"
+) -> Dict[str, Any]:
+    return register_payment(invoice_number, paid_date.isoformat(), amount, currency)
+
+
+def send_reminder(
+    invoice_number: str, to_email: Optional[str] = None, language: str = "hu", tone: str = "polite"
+) -> Dict[str, Any]:
+    record = get_invoice(invoice_number)
+    if not record:
+        raise ValueError("Invoice not found in local store")
+    draft = render_reminder(record, language=language, tone=tone)
+    result = send_email(to_email or record.buyer_email, draft)
+    update_reminder_metadata(invoice_number)
+    return result
@@ -1,14 +1,34 @@
 from __future__ import annotations
 
+import base64
+import json
 import logging
+import threading
 from datetime import date, datetime, timedelta
-from typing import List, Optional
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-from .models import InvoiceRecord
+from . import fx
+from .config import get_settings
+from .models import InvoicePage, InvoiceRecord
 from .utils import db_connection
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS invoices (
@@ -27,55 +47,588 @@ CREATE TABLE IF NOT EXISTS invoices (
 );
 """
 
+CREATE_INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_invoices_open_due
+    ON invoices (due_date, invoice_number) WHERE status = 'open';
+CREATE INDEX IF NOT EXISTS idx_invoices_status_due
+    ON invoices (status, due_date, invoice_number, gross_total);
+CREATE INDEX IF NOT EXISTS idx_invoices_buyer_due
+    ON invoices (buyer_email, due_date, invoice_number);
+CREATE INDEX IF NOT EXISTS idx_invoices_due
+    ON invoices (due_date, invoice_number);
+CREATE INDEX IF NOT EXISTS idx_invoices_external_id
+    ON invoices (external_id) WHERE external_id IS NOT NULL;
+"""
+
+CREATE_JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at TIMESTAMP NOT NULL,
+    result TEXT,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_dedupe
+    ON jobs (dedupe_key) WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_ready
+    ON jobs (destination, next_run_at, id) WHERE status = 'queued';
+"""
+
+# Index of the on-disk PDF cache: invoice number -> content hash, with the last access
+# time used for LRU eviction. Identical PDFs share one blob.
+CREATE_PDF_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS pdf_cache (
+    invoice_number TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at TIMESTAMP NOT NULL,
+    last_accessed_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pdf_cache_lru ON pdf_cache (last_accessed_at);
+CREATE INDEX IF NOT EXISTS idx_pdf_cache_sha256 ON pdf_cache (sha256);
+"""
+
+# One row per create_invoice request, keyed by external_id or a hash of the normalized
+# payload, so a retried request returns the stored outcome instead of issuing a second
+# invoice upstream.
+CREATE_INVOICE_REQUESTS_SQL = """
+CREATE TABLE IF NOT EXISTS invoice_requests (
+    idempotency_key TEXT PRIMARY KEY,
+    request_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    invoice_number TEXT,
+    response TEXT,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+"""
+
+# Per-(customer, currency) balances kept in step with ``invoices`` by triggers, in the
+# same transaction as the invoice write, so debtor reports read one row per customer
+# instead of every invoice of every customer. ``{old_open}`` and ``{new_open}`` stand for
+# the amount an open invoice adds to ``open_total``.
+_SUBTRACT_OLD_BALANCE_SQL = """
+    UPDATE customer_balances SET
+        invoice_count = invoice_count - 1,
+        billed_total = billed_total - OLD.gross_total,
+        open_count = open_count - (OLD.status = 'open'),
+        open_total = open_total - CASE WHEN OLD.status = 'open' THEN {old_open} ELSE 0 END,
+        reminders_sent = reminders_sent - OLD.reminders_sent_count,
+        (oldest_open_due_date, oldest_open_invoice) = (
+            SELECT due_date, invoice_number FROM invoices
+            WHERE buyer_email = OLD.buyer_email AND currency = OLD.currency AND status = 'open'
+            ORDER BY due_date, invoice_number LIMIT 1
+        )
+    WHERE buyer_email = OLD.buyer_email AND currency = OLD.currency;
+    DELETE FROM customer_balances
+    WHERE buyer_email = OLD.buyer_email AND currency = OLD.currency AND invoice_count <= 0;
+"""
+
+_ADD_NEW_BALANCE_SQL = """
+    INSERT INTO customer_balances (
+        buyer_email, currency, buyer_name, invoice_count, billed_total, open_count,
+        open_total, reminders_sent, oldest_open_due_date, oldest_open_invoice
+    ) VALUES (
+        NEW.buyer_email, NEW.currency, NEW.buyer_name, 1, NEW.gross_total,
+        NEW.status = 'open', CASE WHEN NEW.status = 'open' THEN {new_open} ELSE 0 END,
+        NEW.reminders_sent_count,
+        CASE WHEN NEW.status = 'open' THEN NEW.due_date END,
+        CASE WHEN NEW.status = 'open' THEN NEW.invoice_number END
+    )
+    ON CONFLICT (buyer_email, currency) DO UPDATE SET
+        buyer_name = excluded.buyer_name,
+        invoice_count = invoice_count + 1,
+        billed_total = billed_total + excluded.billed_total,
+        open_count = open_count + excluded.open_count,
+        open_total = open_total + excluded.open_total,
+        reminders_sent = reminders_sent + excluded.reminders_sent,
+        oldest_open_invoice = CASE
+            WHEN excluded.oldest_open_due_date IS NOT NULL AND (
+                oldest_open_due_date IS NULL
+                OR (excluded.oldest_open_due_date, excluded.oldest_open_invoice)
+                    < (oldest_open_due_date, oldest_open_invoice)
+            ) THEN excluded.oldest_open_invoice ELSE oldest_open_invoice END,
+        oldest_open_due_date = CASE
+            WHEN excluded.oldest_open_due_date IS NOT NULL AND (
+                oldest_open_due_date IS NULL
+                OR (excluded.oldest_open_due_date, excluded.oldest_open_invoice)
+                    < (oldest_open_due_date, oldest_open_invoice)
+            ) THEN excluded.oldest_open_due_date ELSE oldest_open_due_date END;
+"""
+
+CREATE_CUSTOMER_BALANCES_SQL = f"""
+CREATE TABLE IF NOT EXISTS customer_balances (
+    buyer_email TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    buyer_name TEXT NOT NULL,
+    invoice_count INTEGER NOT NULL,
+    billed_total REAL NOT NULL,
+    open_count INTEGER NOT NULL,
+    open_total REAL NOT NULL,
+    reminders_sent INTEGER NOT NULL,
+    oldest_open_due_date DATE,
+    oldest_open_invoice TEXT,
+    PRIMARY KEY (buyer_email, currency)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_customer_balances_open_total
+    ON customer_balances (currency, open_total);
+CREATE INDEX IF NOT EXISTS idx_invoices_open_buyer
+    ON invoices (buyer_email, currency, due_date, invoice_number) WHERE status = 'open';
+
+INSERT INTO customer_balances (
+    buyer_email, currency, buyer_name, invoice_count, billed_total, open_count,
+    open_total, reminders_sent
+)
+SELECT buyer_email, currency, MAX(buyer_name), COUNT(*), SUM(gross_total),
+       SUM(status = 'open'), SUM(CASE WHEN status = 'open' THEN gross_total ELSE 0 END),
+       SUM(reminders_sent_count)
+FROM invoices GROUP BY buyer_email, currency;
+UPDATE customer_balances SET (oldest_open_due_date, oldest_open_invoice) = (
+    SELECT due_date, invoice_number FROM invoices
+    WHERE invoices.buyer_email = customer_balances.buyer_email
+        AND invoices.currency = customer_balances.currency AND status = 'open'
+    ORDER BY due_date, invoice_number LIMIT 1
+);
+
+CREATE TRIGGER IF NOT EXISTS customer_balances_insert AFTER INSERT ON invoices BEGIN
+{_ADD_NEW_BALANCE_SQL.format(new_open="NEW.gross_total")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS customer_balances_delete AFTER DELETE ON invoices BEGIN
+{_SUBTRACT_OLD_BALANCE_SQL.format(old_open="OLD.gross_total")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS customer_balances_update
+AFTER UPDATE OF buyer_email, buyer_name, currency, gross_total, status, due_date,
+    reminders_sent_count ON invoices BEGIN
+{_SUBTRACT_OLD_BALANCE_SQL.format(old_open="OLD.gross_total")}
+{_ADD_NEW_BALANCE_SQL.format(new_open="NEW.gross_total")}
+END;
+"""
+
+# HUF price of one unit of ``currency`` as published for ``rate_date`` (see ``fx``).
+CREATE_FX_RATES_SQL = """
+CREATE TABLE IF NOT EXISTS fx_rates (
+    currency TEXT NOT NULL,
+    rate_date DATE NOT NULL,
+    rate REAL NOT NULL,
+    PRIMARY KEY (currency, rate_date)
+) WITHOUT ROWID;
+"""
+
+
+# Paid amount as last seen in szamlazz.hu, and when the invoice was last checked there
+# (see ``sync``). Never-checked open invoices sort first in the watermark index.
+ADD_SYNC_COLUMNS_SQL = """
+ALTER TABLE invoices ADD COLUMN paid_amount REAL NOT NULL DEFAULT 0;
+ALTER TABLE invoices ADD COLUMN last_synced_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_invoices_open_synced
+    ON invoices (last_synced_at, invoice_number) WHERE status = 'open';
+"""
+
+
+# What an invoice still adds to receivables: the unpaid part of an open invoice (``sync``
+# keeps ``paid_amount`` current), the gross total of any other.
+OUTSTANDING_SQL = "CASE WHEN status = 'open' THEN gross_total - paid_amount ELSE gross_total END"
+
+# Open balances count the unpaid part of partially paid invoices, not their gross total.
+COUNT_PAID_AMOUNT_SQL = f"""
+DROP TRIGGER IF EXISTS customer_balances_insert;
+DROP TRIGGER IF EXISTS customer_balances_delete;
+DROP TRIGGER IF EXISTS customer_balances_update;
+
+UPDATE customer_balances SET open_total = COALESCE((
+    SELECT SUM(gross_total - paid_amount) FROM invoices
+    WHERE invoices.buyer_email = customer_balances.buyer_email
+        AND invoices.currency = customer_balances.currency AND status = 'open'
+), 0);
+
+CREATE TRIGGER customer_balances_insert AFTER INSERT ON invoices BEGIN
+{_ADD_NEW_BALANCE_SQL.format(new_open="NEW.gross_total - NEW.paid_amount")}
+END;
+
+CREATE TRIGGER customer_balances_delete AFTER DELETE ON invoices BEGIN
+{_SUBTRACT_OLD_BALANCE_SQL.format(old_open="OLD.gross_total - OLD.paid_amount")}
+END;
+
+CREATE TRIGGER customer_balances_update
+AFTER UPDATE OF buyer_email, buyer_name, currency, gross_total, paid_amount, status,
+    due_date, reminders_sent_count ON invoices BEGIN
+{_SUBTRACT_OLD_BALANCE_SQL.format(old_open="OLD.gross_total - OLD.paid_amount")}
+{_ADD_NEW_BALANCE_SQL.format(new_open="NEW.gross_total - NEW.paid_amount")}
+END;
+"""
+
+# Which process runs a job, and until when its claim holds unless renewed (see ``jobs``).
+ADD_JOB_LEASE_SQL = """
+ALTER TABLE jobs ADD COLUMN worker_id TEXT;
+ALTER TABLE jobs ADD COLUMN lease_expires_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_jobs_running_lease
+    ON jobs (lease_expires_at) WHERE status = 'running';
+"""
+
+
+# Dunning runs and the reminders each sent (see ``dunning``). The invoice index serves
+# the per-step due-action scans: one reminder count, due dates up to a cutoff.
+CREATE_DUNNING_SQL = """
+CREATE TABLE IF NOT EXISTS dunning_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trigger TEXT NOT NULL,
+    status TEXT NOT NULL,
+    selected INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS dunning_actions (
+    run_id INTEGER NOT NULL REFERENCES dunning_runs (id),
+    invoice_number TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    tone TEXT NOT NULL,
+    days_overdue INTEGER NOT NULL,
+    to_email TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    message TEXT,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (run_id, invoice_number)
+);
+CREATE INDEX IF NOT EXISTS idx_dunning_actions_invoice
+    ON dunning_actions (invoice_number, created_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_open_dunning
+    ON invoices (reminders_sent_count, due_date, invoice_number) WHERE status = 'open';
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    script: str
+
+
+# Append-only: a released migration must never be edited, only followed by a new one.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create invoices table", CREATE_TABLE_SQL),
+    Migration(2, "add invoice lookup indexes", CREATE_INDEXES_SQL),
+    Migration(3, "create outbound jobs table", CREATE_JOBS_SQL),
+    Migration(4, "create pdf cache index", CREATE_PDF_CACHE_SQL),
+    Migration(5, "create invoice request idempotency table", CREATE_INVOICE_REQUESTS_SQL),
+    Migration(6, "create customer balances", CREATE_CUSTOMER_BALANCES_SQL),
+    Migration(7, "create fx rates table", CREATE_FX_RATES_SQL),
+    Migration(8, "add invoice sync columns", ADD_SYNC_COLUMNS_SQL),
+    Migration(9, "create dunning history tables", CREATE_DUNNING_SQL),
+    Migration(10, "add job worker leases", ADD_JOB_LEASE_SQL),
+    Migration(11, "count paid amounts in open balances", COUNT_PAID_AMOUNT_SQL),
+]
+
+CREATE_SCHEMA_MIGRATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL
+);
+"""
+
+# Per-(due_date, status, currency) totals kept in step with ``invoices`` by triggers, so
+# the aging report reads one row per calendar day and currency instead of one per invoice.
+# Open invoices count their unpaid part, as in ``OUTSTANDING_SQL``.
+CREATE_AGING_ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS aging_rollup (
+    due_date DATE NOT NULL,
+    status TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    invoice_count INTEGER NOT NULL,
+    gross_total REAL NOT NULL,
+    PRIMARY KEY (due_date, status, currency)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS aging_rollup_insert AFTER INSERT ON invoices BEGIN
+    INSERT INTO aging_rollup (due_date, status, currency, invoice_count, gross_total)
+    VALUES (
+        NEW.due_date, NEW.status, NEW.currency, 1,
+        NEW.gross_total - CASE WHEN NEW.status = 'open' THEN NEW.paid_amount ELSE 0 END
+    )
+    ON CONFLICT (due_date, status, currency) DO UPDATE SET
+        invoice_count = invoice_count + 1,
+        gross_total = gross_total + excluded.gross_total;
+END;
+
+CREATE TRIGGER IF NOT EXISTS aging_rollup_delete AFTER DELETE ON invoices BEGIN
+    UPDATE aging_rollup
+    SET invoice_count = invoice_count - 1,
+        gross_total = gross_total - OLD.gross_total
+            + CASE WHEN OLD.status = 'open' THEN OLD.paid_amount ELSE 0 END
+    WHERE due_date = OLD.due_date AND status = OLD.status AND currency = OLD.currency;
+    DELETE FROM aging_rollup
+    WHERE due_date = OLD.due_date AND status = OLD.status AND currency = OLD.currency
+        AND invoice_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS aging_rollup_update
+AFTER UPDATE OF due_date, status, currency, gross_total, paid_amount ON invoices BEGIN
+    UPDATE aging_rollup
+    SET invoice_count = invoice_count - 1,
+        gross_total = gross_total - OLD.gross_total
+            + CASE WHEN OLD.status = 'open' THEN OLD.paid_amount ELSE 0 END
+    WHERE due_date = OLD.due_date AND status = OLD.status AND currency = OLD.currency;
+    DELETE FROM aging_rollup
+    WHERE due_date = OLD.due_date AND status = OLD.status AND currency = OLD.currency
+        AND invoice_count <= 0;
+    INSERT INTO aging_rollup (due_date, status, currency, invoice_count, gross_total)
+    VALUES (
+        NEW.due_date, NEW.status, NEW.currency, 1,
+        NEW.gross_total - CASE WHEN NEW.status = 'open' THEN NEW.paid_amount ELSE 0 END
+    )
+    ON CONFLICT (due_date, status, currency) DO UPDATE SET
+        invoice_count = invoice_count + 1,
+        gross_total = gross_total + excluded.gross_total;
+END;
+"""
+
+DROP_AGING_ROLLUP_SQL = """
+DROP TRIGGER IF EXISTS aging_rollup_insert;
+DROP TRIGGER IF EXISTS aging_rollup_delete;
+DROP TRIGGER IF EXISTS aging_rollup_update;
+DROP TABLE IF EXISTS aging_rollup;
+"""
+
+UPSERT_INVOICE_SQL = """
+INSERT INTO invoices (
+    invoice_number, buyer_name, buyer_email, issue_date, due_date,
+    gross_total, currency, status, created_at, last_reminded_at,
+    reminders_sent_count, external_id
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (invoice_number) DO UPDATE SET
+    buyer_name = excluded.buyer_name,
+    buyer_email = excluded.buyer_email,
+    issue_date = excluded.issue_date,
+    due_date = excluded.due_date,
+    gross_total = excluded.gross_total,
+    currency = excluded.currency,
+    status = excluded.status,
+    created_at = excluded.created_at,
+    last_reminded_at = excluded.last_reminded_at,
+    reminders_sent_count = excluded.reminders_sent_count,
+    external_id = excluded.external_id
+"""
+
+
+# Called after each committed invoice write with the affected invoice numbers, or with
+# None when a bulk write changed too many rows to list. In-memory views of the ledger
+# subscribe here to stay current without re-reading the whole table.
+WriteListener = Callable[[Optional[Sequence[str]]], None]
+_write_listeners: List[WriteListener] = []
+
+# Bumped on every committed invoice write in this process, so results computed from the
+# ledger can be tagged with the generation they saw and discarded once it moves on.
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def ledger_generation() -> int:
+    return _generation
+
+
+def add_write_listener(listener: WriteListener) -> None:
+    if listener not in _write_listeners:
+        _write_listeners.append(listener)
+
+
+def remove_write_listener(listener: WriteListener) -> None:
+    if listener in _write_listeners:
+        _write_listeners.remove(listener)
+
+
+def notify_invoice_write(invoice_numbers: Optional[Sequence[str]]) -> None:
+    global _generation
+    for listener in list(_write_listeners):
+        try:
+            listener(invoice_numbers)
+        except Exception:
+            logger.exception("Invoice write listener %r failed", listener)
+    # Only after the listeners have run: a result computed from a snapshot they have
+    # not patched yet must be tagged with the old generation.
+    with _generation_lock:
+        _generation += 1
+
+
+def _table_exists(conn, name: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def _sync_aging_rollup(conn, enabled: bool) -> None:
+    if not enabled:
+        conn.executescript(DROP_AGING_ROLLUP_SQL)
+        return
+    if _table_exists(conn, "aging_rollup"):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(aging_rollup)")}
+        (trigger_sql,) = conn.execute(
+            "SELECT COALESCE(MAX(sql), '') FROM sqlite_master WHERE name = 'aging_rollup_update'"
+        ).fetchone()
+        if "currency" in columns and "paid_amount" in trigger_sql:
+            return
+        # Rollups built before totals were split per currency, or before open invoices
+        # counted only their unpaid part, are rebuilt from scratch.
+        conn.executescript(DROP_AGING_ROLLUP_SQL)
+    conn.executescript(CREATE_AGING_ROLLUP_SQL)
+    conn.execute(
+        f"""
+        INSERT INTO aging_rollup (due_date, status, currency, invoice_count, gross_total)
+        SELECT due_date, status, currency, COUNT(*), SUM({OUTSTANDING_SQL}) FROM invoices
+        GROUP BY due_date, status, currency
+        """
+    )
+    logger.info("Built aging rollup table")
+
+
+def schema_version(conn) -> int:
+    if not _table_exists(conn, "schema_migrations"):
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+
+def migrate(conn, target_version: Optional[int] = None) -> int:
+    """Apply pending migrations in order and return the resulting schema version.
+
+    Each migration runs in its own transaction together with its ``schema_migrations``
+    row, so a failure leaves the database at the previous version.
+    """
+    conn.execute(CREATE_SCHEMA_MIGRATIONS_SQL)
+    current = schema_version(conn)
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        if target_version is not None and migration.version > target_version:
+            break
+        description = migration.description.replace("'", "''")
+        try:
+            conn.executescript(
+                "BEGIN;\n"
+                f"{migration.script}\n"
+                "INSERT INTO schema_migrations (version, description, applied_at) "
+                f"VALUES ({migration.version}, '{description}', CURRENT_TIMESTAMP);\n"
+                "COMMIT;"
+            )
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.exception("Migration %s (%s) failed", migration.version, migration.description)
+            raise
+        current = migration.version
+        logger.info("Applied migration %s: %s", migration.version, migration.description)
+    return current
+
 
 def init_db() -> None:
     with db_connection() as conn:
-        conn.execute(CREATE_TABLE_SQL)
+        version = migrate(conn)
+        _sync_aging_rollup(conn, get_settings().aging_rollup)
         conn.commit()
-        logger.debug("Database initialized")
+        logger.debug("Database initialized at schema version %s", version)
+
+
+def _record_params(record: InvoiceRecord) -> Tuple:
+    return (
+        record.invoice_number,
+        record.buyer_name,
+        record.buyer_email,
+        record.issue_date,
+        record.due_date,
+        record.gross_total,
+        record.currency,
+        record.status,
+        record.created_at,
+        record.last_reminded_at,
+        record.reminders_sent_count,
+        record.external_id,
+    )
 
 
 def insert_invoice(record: InvoiceRecord) -> None:
+    with db_connection() as conn:
+        conn.execute(UPSERT_INVOICE_SQL, _record_params(record))
+        conn.commit()
+    notify_invoice_write([record.invoice_number])
+    logger.info("Stored invoice %s", record.invoice_number)
+
+
+def bulk_insert_invoices(
+    records: Iterable[InvoiceRecord], chunk_size: int = 5000
+) -> Dict[str, int]:
+    """Upsert ``records`` in chunks inside a single transaction.
+
+    The iterable is consumed lazily, ``chunk_size`` rows at a time, so arbitrarily large
+    imports run in constant memory and cost one commit in total. Nothing is written if
+    any record fails.
+    """
+    iterator = iter(records)
+    processed = 0
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        before = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+        while True:
+            chunk = [_record_params(record) for record in islice(iterator, chunk_size)]
+            if not chunk:
+                break
+            conn.executemany(UPSERT_INVOICE_SQL, chunk)
+            processed += len(chunk)
+            logger.debug("Bulk insert progress: %s rows", processed)
+        after = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+        conn.commit()
+    notify_invoice_write(None)
+    inserted = after - before
+    logger.info("Bulk stored %s invoices (%s new)", processed, inserted)
+    return {"processed": processed, "inserted": inserted, "updated": processed - inserted}
+
+
+def update_reminder_metadata(invoice_number: str) -> None:
     with db_connection() as conn:
         conn.execute(
             """
-            INSERT OR REPLACE INTO invoices (
-                invoice_number, buyer_name, buyer_email, issue_date, due_date,
-                gross_total, currency, status, created_at, last_reminded_at,
-                reminders_sent_count, external_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            UPDATE invoices
+            SET reminders_sent_count = reminders_sent_count + 1,
+                last_reminded_at = ?
+            WHERE invoice_number = ?
             """,
-            (
-                record.invoice_number,
-                record.buyer_name,
-                record.buyer_email,
-                record.issue_date,
-                record.due_date,
-                record.gross_total,
-                record.currency,
-                record.status,
-                record.created_at,
-                record.last_reminded_at,
-                record.reminders_sent_count,
-                record.external_id,
-            ),
+            (datetime.utcnow(), invoice_number),
         )
         conn.commit()
-        logger.info("Stored invoice %s", record.invoice_number)
+    notify_invoice_write([invoice_number])
 
 
-def update_reminder_metadata(invoice_number: str) -> None:
+def update_reminder_metadata_many(
+    invoice_numbers: Sequence[str], reminded_at: Optional[datetime] = None
+) -> int:
+    """Record a sent reminder for each invoice in one transaction; returns rows updated."""
+    if not invoice_numbers:
+        return 0
+    reminded_at = reminded_at or datetime.utcnow()
     with db_connection() as conn:
-        conn.execute(
+        cur = conn.executemany(
             """
             UPDATE invoices
             SET reminders_sent_count = reminders_sent_count + 1,
                 last_reminded_at = ?
             WHERE invoice_number = ?
             """,
-            (datetime.utcnow(), invoice_number),
+            [(reminded_at, invoice_number) for invoice_number in invoice_numbers],
         )
         conn.commit()
+    notify_invoice_write(invoice_numbers)
+    return cur.rowcount
 
 
 def mark_invoice_paid(invoice_number: str, paid_date: date) -> Optional[InvoiceRecord]:
@@ -89,11 +642,12 @@ def mark_invoice_paid(invoice_number: str, paid_date: date) -> Optional[InvoiceR
             (datetime.combine(paid_date, datetime.min.time()), invoice_number),
         )
         conn.commit()
+    notify_invoice_write([invoice_number])
     return get_invoice(invoice_number)
 
 
 def get_invoice(invoice_number: str) -> Optional[InvoiceRecord]:
-    with db_connection() as conn:
+    with db_connection(readonly=True) as conn:
         cur = conn.execute("SELECT * FROM invoices WHERE invoice_number = ?", (invoice_number,))
         row = cur.fetchone()
         if not row:
@@ -101,68 +655,445 @@ def get_invoice(invoice_number: str) -> Optional[InvoiceRecord]:
         return InvoiceRecord(**dict(row))
 
 
-def list_invoices(
-    status: Optional[str] = None, due_before: Optional[date] = None, customer_email: Optional[str] = None
-) -> List[InvoiceRecord]:
-    query = "SELECT * FROM invoices WHERE 1=1"
-    params = []
+def get_invoice_by_external_id(external_id: str) -> Optional[InvoiceRecord]:
+    with db_connection(readonly=True) as conn:
+        cur = conn.execute(
+            "SELECT * FROM invoices WHERE external_id = ? ORDER BY created_at DESC LIMIT 1",
+            (external_id,),
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        return InvoiceRecord(**dict(row))
+
+
+def encode_cursor(due_date: date, invoice_number: str) -> str:
+    payload = json.dumps([due_date.isoformat(), invoice_number], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        due_date, invoice_number = json.loads(base64.urlsafe_b64decode(padded))
+        return date.fromisoformat(due_date).isoformat(), str(invoice_number)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid pagination cursor") from exc
+
+
+def _iter_records(
+    where: List[str],
+    params: List[Any],
+    after: Optional[Tuple[str, str]] = None,
+    limit: Optional[int] = None,
+    batch_size: int = 500,
+) -> Iterator[InvoiceRecord]:
+    clauses = list(where)
+    params = list(params)
+    if after is not None:
+        clauses.append("(due_date, invoice_number) > (?, ?)")
+        params.extend(after)
+    query = "SELECT * FROM invoices"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY due_date ASC, invoice_number ASC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    with db_connection(readonly=True) as conn:
+        cur = conn.execute(query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield InvoiceRecord(**dict(row))
+
+
+def _page(records: Iterator[InvoiceRecord], limit: int) -> InvoicePage:
+    items = list(records)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last.due_date, last.invoice_number)
+    return InvoicePage(items=items, next_cursor=next_cursor)
+
+
+def _invoice_filters(
+    status: Optional[str], due_before: Optional[date], customer_email: Optional[str]
+) -> Tuple[List[str], List[Any]]:
+    where: List[str] = []
+    params: List[Any] = []
     if status:
-        query += " AND status = ?"
+        where.append("status = ?")
         params.append(status)
     if due_before:
-        query += " AND due_date <= ?"
+        where.append("due_date <= ?")
         params.append(due_before)
     if customer_email:
-        query += " AND buyer_email = ?"
+        where.append("buyer_email = ?")
         params.append(customer_email)
+    return where, params
 
-    query += " ORDER BY due_date ASC"
 
-    with db_connection() as conn:
-        cur = conn.execute(query, params)
-        rows = cur.fetchall()
-        return [InvoiceRecord(**dict(row)) for row in rows]
+def _overdue_filters(min_days_overdue: int) -> Tuple[List[str], List[Any]]:
+    cutoff = date.today() - timedelta(days=min_days_overdue)
+    return ["status = 'open'", "due_date < ?"], [cutoff]
+
+
+def iter_invoices(
+    status: Optional[str] = None,
+    due_before: Optional[date] = None,
+    customer_email: Optional[str] = None,
+    cursor: Optional[str] = None,
+) -> Iterator[InvoiceRecord]:
+    """Yield matching invoices lazily in ``(due_date, invoice_number)`` order.
+
+    The generator holds a pooled read connection until it is exhausted or closed, so
+    consume it on the thread that created it.
+    """
+    where, params = _invoice_filters(status, due_before, customer_email)
+    yield from _iter_records(where, params, after=decode_cursor(cursor) if cursor else None)
+
+
+def iter_overdue(
+    min_days_overdue: int = 1, cursor: Optional[str] = None
+) -> Iterator[InvoiceRecord]:
+    where, params = _overdue_filters(min_days_overdue)
+    yield from _iter_records(where, params, after=decode_cursor(cursor) if cursor else None)
+
+
+def list_reminder_candidates(
+    min_days_overdue: int = 1, not_reminded_within_days: int = 7, limit: Optional[int] = None
+) -> List[InvoiceRecord]:
+    """Open invoices at least ``min_days_overdue`` late and not reminded recently."""
+    where, params = _overdue_filters(min_days_overdue)
+    where.append("(last_reminded_at IS NULL OR last_reminded_at < ?)")
+    params.append(datetime.utcnow() - timedelta(days=not_reminded_within_days))
+    return list(_iter_records(where, params, limit=limit))
+
+
+def list_dunning_candidates(
+    reminders_sent: int,
+    due_on_or_before: date,
+    reminded_before: datetime,
+    limit: Optional[int] = None,
+) -> List[InvoiceRecord]:
+    """Open invoices due for reminder number ``reminders_sent + 1``, oldest first."""
+    where = [
+        "status = 'open'",
+        "reminders_sent_count = ?",
+        "due_date <= ?",
+        "(last_reminded_at IS NULL OR last_reminded_at < ?)",
+    ]
+    params: List[Any] = [reminders_sent, due_on_or_before, reminded_before]
+    return list(_iter_records(where, params, limit=limit))
+
+
+def list_invoices(
+    status: Optional[str] = None,
+    due_before: Optional[date] = None,
+    customer_email: Optional[str] = None,
+) -> List[InvoiceRecord]:
+    return list(iter_invoices(status=status, due_before=due_before, customer_email=customer_email))
 
 
 def list_overdue(min_days_overdue: int = 1) -> List[InvoiceRecord]:
-    cutoff = date.today() - timedelta(days=min_days_overdue)
-    query = "SELECT * FROM invoices WHERE status = 'open' AND due_date < ? ORDER BY due_date ASC"
-    with db_connection() as conn:
-        cur = conn.execute(query, (cutoff,))
-        rows = cur.fetchall()
-        return [InvoiceRecord(**dict(row)) for row in rows]
-
-
-def aging_summary() -> dict:
-    buckets = {
-        "current": (0, 0),
-        "1-7": (1, 7),
-        "8-30": (8, 30),
-        "31-60": (31, 60),
-        "60+": (61, 9999),
+    return list(iter_overdue(min_days_overdue))
+
+
+def list_invoices_page(
+    status: Optional[str] = None,
+    due_before: Optional[date] = None,
+    customer_email: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    include_totals: bool = False,
+) -> InvoicePage:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    where, params = _invoice_filters(status, due_before, customer_email)
+    after = decode_cursor(cursor) if cursor else None
+    page = _page(_iter_records(where, params, after=after, limit=limit + 1), limit)
+    if include_totals:
+        page.totals = invoice_totals(where, params)
+    return page
+
+
+def list_overdue_page(
+    min_days_overdue: int = 1,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    include_totals: bool = False,
+) -> InvoicePage:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    where, params = _overdue_filters(min_days_overdue)
+    after = decode_cursor(cursor) if cursor else None
+    page = _page(_iter_records(where, params, after=after, limit=limit + 1), limit)
+    if include_totals:
+        page.totals = invoice_totals(where, params)
+    return page
+
+
+def _aging_buckets(bounds: Sequence[int]) -> List[Tuple[str, int, Optional[int]]]:
+    buckets: List[Tuple[str, int, Optional[int]]] = [("current", 0, 0)]
+    lower = 1
+    for upper in bounds:
+        if upper < lower:
+            continue
+        buckets.append((f"{lower}-{upper}", lower, upper))
+        lower = upper + 1
+    buckets.append((f"{lower - 1}+", lower, None))
+    return buckets
+
+
+def _aging_bucket_case(
+    buckets: Sequence[Tuple[str, int, Optional[int]]], today: date
+) -> Tuple[str, List[Any]]:
+    """Build a CASE expression mapping ``status``/``due_date`` to a bucket label.
+
+    Days overdue are turned into due-date cutoffs up front, so SQLite compares plain
+    ISO dates instead of computing ``julianday`` per row.
+    """
+    clauses = ["WHEN status != 'open' THEN NULL"]
+    params: List[Any] = []
+    for label, _lower, upper in buckets:
+        if upper is None:
+            clauses.append("ELSE ?")
+            params.append(label)
+            break
+        clauses.append("WHEN due_date >= ? THEN ?")
+        params.extend([today - timedelta(days=upper), label])
+    return "CASE " + " ".join(clauses) + " END", params
+
+
+def _aging_result(
+    buckets: Sequence[Tuple[str, int, Optional[int]]],
+    groups: Iterable[Tuple[Optional[str], str, int, Optional[float]]],
+    today: date,
+) -> dict:
+    """Assemble the aging report from ``(bucket, currency, count, gross_total)`` groups.
+
+    ``bucket`` is None for invoices that are not open. Each currency keeps its own
+    buckets; the top-level figures convert every currency to the base currency at the
+    rate of ``today``. Counts cover all currencies, converted amounts only those with a
+    known rate, which are listed under ``missing_rates`` otherwise.
+    """
+    labels = [label for label, _, _ in buckets]
+
+    def empty() -> dict:
+        return {
+            "by_bucket": {label: {"count": 0, "gross_total": 0.0} for label in labels},
+            "totals": {"count": 0, "gross_total": 0.0},
+        }
+
+    by_currency: Dict[str, dict] = {}
+    for bucket, currency, count, gross_total in groups:
+        entry = by_currency.setdefault(currency, empty())
+        entry["totals"]["count"] += count
+        entry["totals"]["gross_total"] += gross_total or 0.0
+        if bucket is not None:
+            entry["by_bucket"][bucket]["count"] += count
+            entry["by_bucket"][bucket]["gross_total"] += gross_total or 0.0
+
+    factors, missing = fx.conversion_rates(by_currency, today)
+    result = empty()
+    for currency, entry in by_currency.items():
+        rate = factors.get(currency)
+        pairs = [(result["totals"], entry["totals"])]
+        pairs += [(result["by_bucket"][label], entry["by_bucket"][label]) for label in labels]
+        for converted, original in pairs:
+            converted["count"] += original["count"]
+            if rate is not None:
+                converted["gross_total"] += original["gross_total"] * rate
+            original["gross_total"] = round(original["gross_total"], 2)
+        entry["rate"] = rate
+    for totals in [result["totals"], *result["by_bucket"].values()]:
+        totals["gross_total"] = round(totals["gross_total"], 2)
+
+    result["base_currency"] = get_settings().fx_base_currency.upper()
+    result["by_currency"] = dict(sorted(by_currency.items()))
+    result["missing_rates"] = missing
+    return result
+
+
+def aging_summary(bounds: Optional[Sequence[int]] = None, today: Optional[date] = None) -> dict:
+    settings = get_settings()
+    today = today or date.today()
+    buckets = _aging_buckets(sorted(set(bounds)) if bounds else settings.aging_bucket_bounds)
+    case_sql, params = _aging_bucket_case(buckets, today)
+    if settings.aging_rollup:
+        query = (
+            f"SELECT {case_sql} AS bucket, currency, SUM(invoice_count), SUM(gross_total) "
+            "FROM aging_rollup GROUP BY bucket, currency"
+        )
+    else:
+        query = (
+            f"SELECT {case_sql} AS bucket, currency, COUNT(*), SUM({OUTSTANDING_SQL}) "
+            "FROM invoices GROUP BY bucket, currency"
+        )
+    with db_connection(readonly=True) as conn:
+        groups = [tuple(row) for row in conn.execute(query, params)]
+    return _aging_result(buckets, groups, today)
+
+
+def invoice_totals(
+    where: Sequence[str], params: Sequence[Any], today: Optional[date] = None
+) -> Dict[str, Any]:
+    """Count and outstanding total of the matching invoices, per currency and converted."""
+    query = f"SELECT currency, COUNT(*), SUM({OUTSTANDING_SQL}) FROM invoices"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " GROUP BY currency"
+    with db_connection(readonly=True) as conn:
+        totals = {
+            currency: {"count": count, "gross_total": gross_total or 0.0}
+            for currency, count, gross_total in conn.execute(query, list(params))
+        }
+    return fx.convert_totals(totals, today or date.today())
+
+
+def overdue_summary(
+    min_days_overdue: int = 1, top_customers: int = 10, today: Optional[date] = None
+) -> dict:
+    """Count and total of overdue open invoices, with the customers owing the most.
+
+    Amounts are converted to the base currency at the ``today`` rate; currencies without
+    a rate are counted but left out of the amounts and listed under ``missing_rates``.
+    """
+    today = today or date.today()
+    query = (
+        f"SELECT buyer_email, currency, COUNT(*), SUM({OUTSTANDING_SQL}) FROM invoices "
+        "WHERE status = 'open' AND due_date < ? GROUP BY buyer_email, currency"
+    )
+    with db_connection(readonly=True) as conn:
+        groups = conn.execute(query, [today - timedelta(days=min_days_overdue)]).fetchall()
+    factors, missing = fx.conversion_rates({row[1] for row in groups}, today)
+    count, total = 0, 0.0
+    per_customer: Dict[str, float] = {}
+    for buyer_email, currency, group_count, amount in groups:
+        amount = (amount or 0.0) * factors.get(currency, 0.0)
+        count += group_count
+        total += amount
+        per_customer[buyer_email] = per_customer.get(buyer_email, 0.0) + amount
+    ranked = sorted(per_customer.items(), key=lambda item: -item[1])[: max(0, top_customers)]
+    return {
+        "count": count,
+        "gross_total": round(total, 2),
+        "base_currency": get_settings().fx_base_currency.upper(),
+        "missing_rates": missing,
+        "top_customers": [
+            {"buyer_email": buyer_email, "gross_total": round(amount, 2)}
+            for buyer_email, amount in ranked
+            if amount > 0
+        ],
     }
-    results = {key: {"count": 0, "gross_total": 0.0} for key in buckets}
-    totals = {"count": 0, "gross_total": 0.0}
 
-    with db_connection() as conn:
-        cur = conn.execute("SELECT status, due_date, gross_total FROM invoices")
-        for status, due_date, gross_total in cur.fetchall():
-            totals["count"] += 1
-            totals["gross_total"] += gross_total
-            if status != "open":
-                continue
-            days_overdue = (date.today() - due_date).days
-            if days_overdue <= 0:
-                bucket = "current"
-            elif days_overdue <= 7:
-                bucket = "1-7"
-            elif days_overdue <= 30:
-                bucket = "8-30"
-            elif days_overdue <= 60:
-                bucket = "31-60"
-            else:
-                bucket = "60+"
-            results[bucket]["count"] += 1
-            results[bucket]["gross_total"] += gross_total
-
-    return {"by_bucket": results, "totals": totals}
+
+# Balances are ranked and limited first; sales in the DSO period are then summed in one
+# grouped pass over the invoices of the selected customers only.
+_BALANCE_SELECT_SQL = """
+WITH rates(currency, rate) AS (VALUES {rates}),
+balances AS (
+    SELECT customer_balances.*,
+           customer_balances.open_total * rates.rate AS open_total_converted
+    FROM customer_balances LEFT JOIN rates ON rates.currency = customer_balances.currency
+    {where} ORDER BY {order}{limit}
+),
+billed AS (
+    SELECT invoices.buyer_email, invoices.currency, SUM(invoices.gross_total) AS total
+    FROM balances JOIN invoices
+        ON invoices.buyer_email = balances.buyer_email
+        AND invoices.currency = balances.currency
+    WHERE invoices.issue_date > ?
+    GROUP BY invoices.buyer_email, invoices.currency
+)
+SELECT balances.*, COALESCE(billed.total, 0) AS billed_in_period
+FROM balances LEFT JOIN billed
+    ON billed.buyer_email = balances.buyer_email AND billed.currency = balances.currency
+ORDER BY {order}
+"""
+
+
+def _select_balances(
+    where: str,
+    params: Sequence[Any],
+    order: str,
+    limit: Optional[int],
+    today: date,
+    dso_days: int,
+) -> List[dict]:
+    """Run ``_BALANCE_SELECT_SQL`` with conversion factors for the currencies it covers.
+
+    ``order`` may only name columns of ``customer_balances`` and ``open_total_converted``.
+    """
+    distinct_sql = f"SELECT DISTINCT currency FROM customer_balances {where}"
+    with db_connection(readonly=True) as conn:
+        currencies = [row[0] for row in conn.execute(distinct_sql, params)]
+    factors, _ = fx.conversion_rates(currencies, today)
+    pairs = list(factors.items()) or [(None, None)]
+    query = _BALANCE_SELECT_SQL.format(
+        rates=", ".join("(?, ?)" for _ in pairs),
+        where=where,
+        order=order,
+        limit=f" LIMIT {limit}" if limit is not None else "",
+    )
+    rate_params = [value for pair in pairs for value in pair]
+    with db_connection(readonly=True) as conn:
+        rows = conn.execute(
+            query, [*rate_params, *params, today - timedelta(days=dso_days)]
+        ).fetchall()
+    return [_balance_dict(row, today, dso_days) for row in rows]
+
+
+def _balance_dict(row, today: date, dso_days: int) -> dict:
+    balance = dict(row)
+    billed = balance.pop("billed_in_period")
+    oldest_due = balance["oldest_open_due_date"]
+    balance["oldest_days_overdue"] = max(0, (today - oldest_due).days) if oldest_due else None
+    # Days sales outstanding over the trailing period: open balance / sales * period days.
+    balance["dso"] = round(balance["open_total"] / billed * dso_days, 1) if billed else None
+    balance["billed_total"] = round(balance["billed_total"], 2)
+    balance["open_total"] = round(balance["open_total"], 2)
+    converted = balance["open_total_converted"]
+    balance["open_total_converted"] = round(converted, 2) if converted is not None else None
+    balance["base_currency"] = get_settings().fx_base_currency.upper()
+    return balance
+
+
+def customer_summary(
+    buyer_email: str, dso_days: int = 90, today: Optional[date] = None
+) -> List[dict]:
+    """Balance, oldest open invoice, reminders and DSO of one customer, per currency."""
+    return _select_balances(
+        "WHERE buyer_email = ?", [buyer_email], "currency", None, today or date.today(), dso_days
+    )
+
+
+def top_debtors(
+    limit: int = 10,
+    currency: Optional[str] = None,
+    dso_days: int = 90,
+    today: Optional[date] = None,
+) -> List[dict]:
+    """Customers with the largest open balances converted to the base currency, largest first.
+
+    Balances in a currency without a known rate rank after all convertible ones.
+    """
+    where = "WHERE open_total > 0"
+    params: List[Any] = []
+    if currency:
+        where += " AND customer_balances.currency = ?"
+        params.append(currency)
+    order = (
+        "open_total_converted IS NULL, open_total_converted DESC, open_total DESC, buyer_email"
+    )
+    return _select_balances(
+        where,
+        params,
+        order,
+        max(1, min(limit, MAX_PAGE_SIZE)),
+        today or date.today(),
+        dso_days,
+    )
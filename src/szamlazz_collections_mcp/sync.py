@@ -0,0 +1,273 @@
+"""Reconciliation of the local ledger with szamlazz.hu.
+
+Payments registered in the szamlazz.hu web UI, or by the bank feed there, never reach
+the local store on their own. A sync cycle fetches the XML of open invoices over the
+shared keep-alive client, a bounded number at a time, compares the paid amount and
+status with the local rows and writes back only what differs, in batched transactions.
+
+Each checked invoice gets a ``last_synced_at`` watermark and is skipped until it is
+``SYNC_MIN_AGE`` seconds old, and paid invoices are never fetched again, so a cycle
+costs one request per invoice due for a check rather than one per invoice in the
+ledger. ``SYNC_INTERVAL`` runs cycles periodically in a background thread.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+from . import metrics
+from .config import get_settings
+from .storage import notify_invoice_write
+from .szamlazz_client import query_invoice_xml
+from .utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Amounts within this of the gross total count as fully paid (rounding in the XML).
+PAID_TOLERANCE = 0.005
+WRITE_BATCH_SIZE = 200
+
+_SYNC_SECONDS = metrics.histogram("ledger_sync_cycle_seconds", "Ledger sync cycle time")
+_SYNC_INVOICES = metrics.counter(
+    "ledger_sync_invoices_total", "Invoices checked by ledger sync", ["outcome"]
+)
+
+_SELECT_COLUMNS = "invoice_number, gross_total, paid_amount"
+
+
+class SyncCandidate(NamedTuple):
+    invoice_number: str
+    gross_total: float
+    paid_amount: float
+
+
+class SyncChange(NamedTuple):
+    invoice_number: str
+    paid_amount: float
+    status: str
+    previous_paid_amount: float
+
+
+def due_for_sync(
+    limit: int, min_age: float, now: Optional[datetime] = None
+) -> List[SyncCandidate]:
+    """Open invoices never checked, then those checked longest ago, up to ``limit``."""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=min_age)
+    # Two index range scans rather than one OR, so the cost follows the rows returned.
+    with db_connection(readonly=True) as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {_SELECT_COLUMNS} FROM invoices
+            WHERE status = 'open' AND last_synced_at IS NULL
+            ORDER BY invoice_number LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        if len(rows) < limit:
+            rows += conn.execute(
+                f"""
+                SELECT {_SELECT_COLUMNS} FROM invoices
+                WHERE status = 'open' AND last_synced_at < ?
+                ORDER BY last_synced_at, invoice_number LIMIT ?
+                """,
+                (cutoff, limit - len(rows)),
+            ).fetchall()
+    return [SyncCandidate(*row) for row in rows]
+
+
+def diff_invoice(candidate: SyncCandidate, remote: Dict[str, Any]) -> Optional[SyncChange]:
+    """The change a remote invoice XML implies for a local open invoice, if any."""
+    paid_amount = remote.get("paid_amount") or 0.0
+    gross_total = remote.get("gross_total")
+    if not isinstance(gross_total, float):
+        gross_total = candidate.gross_total
+    status = "paid" if paid_amount + PAID_TOLERANCE >= gross_total > 0 else "open"
+    if status == "open" and abs(paid_amount - candidate.paid_amount) < PAID_TOLERANCE:
+        return None
+    return SyncChange(candidate.invoice_number, paid_amount, status, candidate.paid_amount)
+
+
+def apply_changes(changes: List[SyncChange], checked: List[str], synced_at: datetime) -> List[str]:
+    """Write changes and watermarks in one transaction; returns the invoices updated.
+
+    A change only applies while the row still holds the values it was computed from,
+    so a payment recorded locally during the fetch is not overwritten.
+    """
+    updated: List[str] = []
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for change in changes:
+            cur = conn.execute(
+                """
+                UPDATE invoices SET paid_amount = ?, status = ?, last_synced_at = ?
+                WHERE invoice_number = ? AND status = 'open' AND paid_amount = ?
+                """,
+                (
+                    change.paid_amount,
+                    change.status,
+                    synced_at,
+                    change.invoice_number,
+                    change.previous_paid_amount,
+                ),
+            )
+            if cur.rowcount:
+                updated.append(change.invoice_number)
+        conn.executemany(
+            "UPDATE invoices SET last_synced_at = ? WHERE invoice_number = ?",
+            [(synced_at, number) for number in checked],
+        )
+        conn.commit()
+    if updated:
+        notify_invoice_write(updated)
+    return updated
+
+
+def _fetch(invoice_number: str) -> Dict[str, Any]:
+    return query_invoice_xml(invoice_number, include_xml=False)
+
+
+def sync_invoices(
+    limit: Optional[int] = None,
+    min_age: Optional[float] = None,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Run one sync cycle over the open invoices due for a check.
+
+    Invoices whose fetch raised keep their old watermark and are retried next cycle;
+    those szamlazz.hu answered with an error code are reported and skipped until due
+    again.
+    """
+    settings = get_settings()
+    limit = settings.sync_batch_size if limit is None else limit
+    min_age = settings.sync_min_age if min_age is None else min_age
+    workers = max(1, concurrency or settings.sync_concurrency)
+    start = time.perf_counter()
+    candidates = due_for_sync(limit, min_age)
+    changes: List[SyncChange] = []
+    checked: List[str] = []
+    updated: List[str] = []
+    answered = paid = 0
+    errors: List[Dict[str, str]] = []
+
+    def flush() -> None:
+        nonlocal paid
+        if not checked:
+            return
+        applied = set(apply_changes(changes, checked, datetime.utcnow()))
+        for change in changes:
+            if change.invoice_number in applied:
+                updated.append(change.invoice_number)
+                paid += change.status == "paid"
+        changes.clear()
+        checked.clear()
+
+    def collect(future: Future, candidate: SyncCandidate) -> None:
+        nonlocal answered
+        try:
+            remote = future.result()
+        except Exception as exc:
+            error = f"{exc.__class__.__name__}: {exc}"
+            errors.append({"invoice_number": candidate.invoice_number, "error": error})
+            metrics.inc(_SYNC_INVOICES, "error")
+            return
+        answered += 1
+        checked.append(candidate.invoice_number)
+        if remote.get("error_code"):
+            error = f"szamlazz.hu error {remote['error_code']}: {remote.get('error_message')}"
+            errors.append({"invoice_number": candidate.invoice_number, "error": error})
+            metrics.inc(_SYNC_INVOICES, "error")
+        else:
+            change = diff_invoice(candidate, remote)
+            if change is not None:
+                changes.append(change)
+            metrics.inc(_SYNC_INVOICES, "changed" if change else "unchanged")
+        if len(checked) >= WRITE_BATCH_SIZE:
+            flush()
+
+    with metrics.timed(_SYNC_SECONDS, None):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ledger-sync") as pool:
+            pending: Dict[Future, SyncCandidate] = {}
+            for candidate in candidates:
+                if len(pending) >= 2 * workers:
+                    finished: Set[Future] = wait(pending, return_when=FIRST_COMPLETED).done
+                    for future in finished:
+                        collect(future, pending.pop(future))
+                pending[pool.submit(_fetch, candidate.invoice_number)] = candidate
+            for future in list(pending):
+                collect(future, pending.pop(future))
+        flush()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Ledger sync checked %s invoices in %.1fs: %s updated (%s paid), %s failed",
+        answered,
+        elapsed,
+        len(updated),
+        paid,
+        len(errors),
+    )
+    return {
+        "checked": answered,
+        "updated": updated,
+        "paid": paid,
+        "failed": errors,
+        "more_due": len(candidates) == limit,
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+class SyncScheduler:
+    """Runs a sync cycle every ``interval`` seconds on a daemon thread."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                result = sync_invoices()
+            except Exception:
+                logger.exception("Ledger sync cycle failed")
+                result = {}
+            # Catch up without waiting while a backlog is left (e.g. on first start) and
+            # szamlazz.hu is answering.
+            if not (result.get("more_due") and result.get("checked")):
+                self._stopping.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="ledger-sync", daemon=True)
+        self._thread.start()
+        logger.info("Ledger sync every %ss", self.interval)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_scheduler: Optional[SyncScheduler] = None
+
+
+def start_sync() -> Optional[SyncScheduler]:
+    global _scheduler
+    interval = get_settings().sync_interval
+    if interval <= 0 or _scheduler is not None:
+        return _scheduler
+    _scheduler = SyncScheduler(interval)
+    _scheduler.start()
+    return _scheduler
+
+
+def stop_sync(timeout: Optional[float] = 30.0) -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop(timeout)
+        _scheduler = None
@@ -0,0 +1,186 @@
+"""asyncio counterpart of :mod:`szamlazz_client`.
+
+Request building and response parsing are shared with the synchronous client; only
+the transport differs, so a slow szamlazz.hu call suspends the calling tool instead of
+blocking the event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from . import metrics, pdf_cache
+from .agent_guard import get_guard
+from .agent_response import AgentResponse, ResponseParser
+from .config import get_settings
+from .pdf_cache import CachedPdf
+from .szamlazz_client import (
+    _REQUEST_BYTES,
+    _REQUEST_ERRORS,
+    _REQUEST_RETRIES,
+    _REQUEST_SECONDS,
+    _RESPONSE_BYTES,
+    BASE_URL,
+    IDEMPOTENT_ACTIONS,
+    _backoff_delay,
+    _cached_pdf,
+    _check_pdf,
+    _client_options,
+    _generate_invoice_request,
+    _invoice_result,
+    _is_final,
+    _is_retryable,
+    _payment_result,
+    _pdf_result,
+    _query_pdf_request,
+    _query_xml_request,
+    _register_payment_request,
+    _XmlCollector,
+)
+from .utils import run_blocking
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(**_client_options())
+    return _client
+
+
+async def close_async_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _check_status(response: httpx.Response) -> None:
+    if response.is_error:
+        await response.aread()
+        response.raise_for_status()
+
+
+async def request_agent(
+    field_name: str, xml_str: str, handler: Callable[[httpx.Response], Awaitable[T]]
+) -> T:
+    settings = get_settings()
+    payload = xml_str.encode("utf-8")
+    files = {field_name: ("request.xml", payload, "text/xml")}
+    url = settings.szamlazz_base_url or BASE_URL
+    idempotent = field_name in IDEMPOTENT_ACTIONS
+    retries = max(0, settings.szamlazz_retries)
+    logger.debug("Posting to Szamlazz.hu field=%s", field_name)
+    metrics.observe(_REQUEST_BYTES, len(payload), field_name)
+    client = get_async_client()
+    guard = get_guard()
+    attempt = 0
+    with metrics.timed(_REQUEST_SECONDS, _REQUEST_ERRORS, field_name):
+        while True:
+            try:
+                async with guard.attempt_async() as call:
+                    request = client.build_request("POST", url, files=files)
+                    response = await client.send(request, stream=True)
+                    call.record(response.status_code, response.headers.get("Retry-After"))
+                    try:
+                        if _is_final(response, attempt, retries, idempotent):
+                            await _check_status(response)
+                            result = await handler(response)
+                            metrics.observe(
+                                _RESPONSE_BYTES, response.num_bytes_downloaded, field_name
+                            )
+                            return result
+                    finally:
+                        await response.aclose()
+            except httpx.TransportError as exc:
+                if attempt >= retries or not _is_retryable(exc, idempotent):
+                    raise
+                logger.warning(
+                    "Szamlazz.hu %s failed (%s), retrying", field_name, exc.__class__.__name__
+                )
+            else:
+                logger.warning(
+                    "Szamlazz.hu %s returned %s, retrying", field_name, response.status_code
+                )
+            metrics.inc(_REQUEST_RETRIES, field_name)
+            await asyncio.sleep(_backoff_delay(attempt))
+            attempt += 1
+
+
+async def _read(response: httpx.Response) -> httpx.Response:
+    await response.aread()
+    return response
+
+
+async def post_xml(field_name: str, xml_str: str) -> httpx.Response:
+    return await request_agent(field_name, xml_str, _read)
+
+
+async def _parse(response: httpx.Response) -> AgentResponse:
+    parser = ResponseParser(response.headers)
+    async for chunk in response.aiter_bytes():
+        parser.feed(chunk)
+    return parser.close()
+
+
+async def _store_pdf(invoice_number: str, response: httpx.Response) -> CachedPdf:
+    # File writes go to the blocking pool, one chunk at a time.
+    writer = await run_blocking(pdf_cache.PdfWriter)
+    try:
+        parser = ResponseParser(response.headers, writer.write)
+        async for chunk in response.aiter_bytes():
+            await run_blocking(parser.feed, chunk)
+        _check_pdf(await run_blocking(parser.close))
+        return await run_blocking(writer.commit, invoice_number)
+    finally:
+        await run_blocking(writer.discard)
+
+
+async def generate_invoice(payload: Dict[str, Any]) -> Dict[str, Any]:
+    parsed = await request_agent(*_generate_invoice_request(payload), _parse)
+    return _invoice_result(parsed)
+
+
+async def query_invoice_pdf(
+    invoice_number: str,
+    save: bool = True,
+    output_dir: str = "./data",
+    inline: bool = True,
+    refresh: bool = False,
+) -> Dict[str, Any]:
+    cached = await run_blocking(_cached_pdf, invoice_number, refresh)
+    from_cache = cached is not None
+    if cached is None:
+        cached = await request_agent(
+            *_query_pdf_request(invoice_number),
+            lambda response: _store_pdf(invoice_number, response),
+        )
+    return await run_blocking(_pdf_result, cached, from_cache, save, output_dir, inline)
+
+
+async def query_invoice_xml(invoice_number: str, include_xml: bool = True) -> Dict[str, Any]:
+    async def handler(response: httpx.Response) -> Dict[str, Any]:
+        collector = _XmlCollector(response, include_xml)
+        async for chunk in response.aiter_bytes():
+            collector.feed(chunk)
+        return collector.result(invoice_number)
+
+    return await request_agent(*_query_xml_request(invoice_number), handler)
+
+
+async def register_payment(
+    invoice_number: str, paid_date: str, amount: float, currency: str = "HUF"
+) -> Dict[str, Any]:
+    parsed = await request_agent(
+        *_register_payment_request(invoice_number, paid_date, amount, currency), _parse
+    )
+    return _payment_result(parsed)
@@ -3,34 +3,70 @@ from __future__ import annotations
 import logging
 import mimetypes
 import os
-import re
-from typing import Any, Dict, Optional
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 
 import httpx
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import Environment
 
+from . import metrics, pdf_cache
+from .agent_guard import AgentUnavailable, get_guard
+from .agent_response import AgentResponse, PdfSink, ResponseParser, parse_chunks
 from .config import get_settings
-from .utils import encode_pdf, summarize_response
+from .pdf_cache import CachedPdf
+from .templating import get_environment
+from .utils import encode_file_base64
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 BASE_URL = "https://www.szamlazz.hu/szamla/"
 
+# Read-only agent actions. Only these are retried after the request may have reached
+# szamlazz.hu; retrying invoice generation or payment registration could duplicate them.
+IDEMPOTENT_ACTIONS = frozenset({"action-szamla_agent_pdf", "action-szamla_agent_xml"})
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+# Shared with the async client, so both transports report into the same series.
+_REQUEST_SECONDS = metrics.histogram(
+    "szamlazz_request_duration_seconds",
+    "szamlazz.hu Agent API call time, including retries",
+    ["action"],
+)
+_REQUEST_ERRORS = metrics.counter(
+    "szamlazz_request_errors_total", "szamlazz.hu Agent API calls that failed", ["action", "error"]
+)
+_REQUEST_RETRIES = metrics.counter(
+    "szamlazz_request_retries_total", "szamlazz.hu Agent API attempts retried", ["action"]
+)
+_REQUEST_BYTES = metrics.histogram(
+    "szamlazz_request_bytes", "XML request size", ["action"], metrics.SIZE_BUCKETS
+)
+_RESPONSE_BYTES = metrics.histogram(
+    "szamlazz_response_bytes", "Agent API response body size", ["action"], metrics.SIZE_BUCKETS
+)
+_BUILD_SECONDS = metrics.histogram(
+    "xml_build_duration_seconds", "Agent API request XML rendering time", ["template"]
+)
+_BUILD_ERRORS = metrics.counter(
+    "xml_build_errors_total", "Agent API request XML rendering failures", ["template", "error"]
+)
+
 
 def _jinja_env() -> Environment:
-    templates_path = os.path.join(os.path.dirname(__file__), "xml_templates")
-    return Environment(
-        loader=FileSystemLoader(templates_path),
-        autoescape=select_autoescape(enabled_extensions=(".xml",)),
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
+    return get_environment("xml")
 
 
 def build_xml(template_name: str, data: Dict[str, Any]) -> str:
-    env = _jinja_env()
-    template = env.get_template(template_name)
-    return template.render(**data)
+    with metrics.timed(_BUILD_SECONDS, _BUILD_ERRORS, template_name):
+        env = _jinja_env()
+        template = env.get_template(template_name)
+        return template.render(**data)
 
 
 def _auth_fragment() -> Dict[str, Any]:
@@ -43,73 +79,268 @@ def _auth_fragment() -> Dict[str, Any]:
     }
 
 
-def post_xml(field_name: str, xml_str: str) -> httpx.Response:
-    files = {field_name: ("request.xml", xml_str.encode("utf-8"), "text/xml")}
+def _http2_available(requested: bool) -> bool:
+    if not requested:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("SZAMLAZZ_HTTP2 is set but the 'h2' package is missing; using HTTP/1.1")
+        return False
+    return True
+
+
+def _client_options() -> Dict[str, Any]:
+    settings = get_settings()
+    return {
+        "timeout": httpx.Timeout(
+            settings.szamlazz_timeout, connect=settings.szamlazz_connect_timeout
+        ),
+        "limits": httpx.Limits(
+            max_connections=settings.szamlazz_max_connections,
+            max_keepalive_connections=settings.szamlazz_max_keepalive,
+            keepalive_expiry=settings.szamlazz_keepalive_expiry,
+        ),
+        "http2": _http2_available(settings.szamlazz_http2),
+    }
+
+
+def _build_client() -> httpx.Client:
+    return httpx.Client(**_client_options())
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide client, so calls share keep-alive connections to szamlazz.hu."""
+    global _client
+    client = _client
+    if client is not None and not client.is_closed:
+        return client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = _build_client()
+        return _client
+
+
+def close_http_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def request_not_sent(exc: BaseException) -> bool:
+    """Whether ``exc`` proves the request never reached szamlazz.hu."""
+    return isinstance(
+        exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, AgentUnavailable)
+    )
+
+
+def _is_retryable(exc: httpx.TransportError, idempotent: bool) -> bool:
+    if request_not_sent(exc):
+        return True
+    return idempotent and isinstance(
+        exc, (httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+    )
+
+
+def _backoff_delay(attempt: int) -> float:
+    return get_settings().szamlazz_retry_backoff * 2**attempt
+
+
+def _is_final(response: httpx.Response, attempt: int, retries: int, idempotent: bool) -> bool:
+    if attempt >= retries:
+        return True
+    # A 429 turns the request away unprocessed, so any action may be sent again.
+    if response.status_code == 429:
+        return False
+    return response.status_code < 500 or not idempotent
+
+
+def _check_status(response: httpx.Response) -> None:
+    if response.is_error:
+        # Error bodies are short; read them so the exception carries the message.
+        response.read()
+        response.raise_for_status()
+
+
+def request_agent(field_name: str, xml_str: str, handler: Callable[[httpx.Response], T]) -> T:
+    """POST a request to the Agent API and return ``handler`` applied to the response.
+
+    The response is handed over before its body is read, so ``handler`` can consume it
+    chunk by chunk. For read-only actions, a connection dropped while the body streams
+    in is retried like one dropped before the response, so ``handler`` must start from
+    scratch on every call.
+
+    Each attempt goes through the :mod:`agent_guard`, which may delay it or refuse it
+    with :class:`~.agent_guard.AgentUnavailable`.
+    """
+    settings = get_settings()
+    payload = xml_str.encode("utf-8")
+    files = {field_name: ("request.xml", payload, "text/xml")}
+    url = settings.szamlazz_base_url or BASE_URL
+    idempotent = field_name in IDEMPOTENT_ACTIONS
+    retries = max(0, settings.szamlazz_retries)
     logger.debug("Posting to Szamlazz.hu field=%s", field_name)
-    client = httpx.Client()
-    response = client.post(BASE_URL, files=files, timeout=30.0)
-    response.raise_for_status()
+    metrics.observe(_REQUEST_BYTES, len(payload), field_name)
+    client = get_http_client()
+    guard = get_guard()
+    attempt = 0
+    with metrics.timed(_REQUEST_SECONDS, _REQUEST_ERRORS, field_name):
+        while True:
+            try:
+                with guard.attempt() as call:
+                    request = client.build_request("POST", url, files=files)
+                    response = client.send(request, stream=True)
+                    call.record(response.status_code, response.headers.get("Retry-After"))
+                    try:
+                        if _is_final(response, attempt, retries, idempotent):
+                            _check_status(response)
+                            result = handler(response)
+                            metrics.observe(
+                                _RESPONSE_BYTES, response.num_bytes_downloaded, field_name
+                            )
+                            return result
+                    finally:
+                        response.close()
+            except httpx.TransportError as exc:
+                if attempt >= retries or not _is_retryable(exc, idempotent):
+                    raise
+                logger.warning(
+                    "Szamlazz.hu %s failed (%s), retrying", field_name, exc.__class__.__name__
+                )
+            else:
+                logger.warning(
+                    "Szamlazz.hu %s returned %s, retrying", field_name, response.status_code
+                )
+            metrics.inc(_REQUEST_RETRIES, field_name)
+            time.sleep(_backoff_delay(attempt))
+            attempt += 1
+
+
+def _read(response: httpx.Response) -> httpx.Response:
+    response.read()
     return response
 
 
-def _parse_invoice_number(text: str) -> Optional[str]:
-    match = re.search(r"DONE;\s*([A-Za-z0-9\-\/]+)", text)
-    if match:
-        return match.group(1)
-    match = re.search(r"<invoiceNumber>(.*?)</invoiceNumber>", text, re.IGNORECASE)
-    if match:
-        return match.group(1)
-    return None
+def post_xml(field_name: str, xml_str: str) -> httpx.Response:
+    """Buffered form of :func:`request_agent`: the returned response has its body read."""
+    return request_agent(field_name, xml_str, _read)
 
 
-def generate_invoice(payload: Dict[str, Any]) -> Dict[str, Any]:
+def _parse(response: httpx.Response, pdf_sink: Optional[PdfSink] = None) -> AgentResponse:
+    return parse_chunks(response.iter_bytes(), response.headers, pdf_sink)
+
+
+def _generate_invoice_request(payload: Dict[str, Any]) -> Tuple[str, str]:
     data = {**payload, **_auth_fragment()}
-    xml = build_xml("generate_invoice.xml.j2", data)
-    response = post_xml("action-xmlagentxmlfile", xml)
-    content_type = response.headers.get("content-type", "")
-    invoice_number = None
-    raw_summary = ""
-    pdf_b64 = None
-
-    if response.content.startswith(b"%PDF") or "pdf" in content_type:
-        pdf_b64 = encode_pdf(response.content)
-    else:
-        raw_text = response.text
-        raw_summary = summarize_response(raw_text)
-        invoice_number = _parse_invoice_number(raw_text)
+    return "action-xmlagentxmlfile", build_xml("generate_invoice.xml.j2", data)
+
 
+def _invoice_result(parsed: AgentResponse) -> Dict[str, Any]:
     return {
-        "invoice_number": invoice_number,
-        "pdf_base64": pdf_b64,
-        "raw_response_summary": raw_summary,
+        "invoice_number": parsed.invoice_number,
+        "pdf_base64": parsed.pdf_base64,
+        "raw_response_summary": parsed.summary,
+        "success": parsed.success,
+        "error_code": parsed.error_code,
+        "error_message": parsed.error_message,
+        **parsed.fields,
     }
 
 
-def query_invoice_pdf(invoice_number: str, save: bool = True, output_dir: str = "./data") -> Dict[str, Any]:
+def _query_pdf_request(invoice_number: str) -> Tuple[str, str]:
     data = {"invoice_number": invoice_number, **_auth_fragment()}
-    xml = build_xml("query_invoice_pdf.xml.j2", data)
-    response = post_xml("action-szamla_agent_pdf", xml)
-    if not response.content.startswith(b"%PDF"):
-        raise ValueError("Unexpected response when fetching PDF")
-
-    file_path = None
-    pdf_b64 = encode_pdf(response.content)
-    if save:
+    return "action-szamla_agent_pdf", build_xml("query_invoice_pdf.xml.j2", data)
+
+
+def _cached_pdf(invoice_number: str, refresh: bool) -> Optional[CachedPdf]:
+    return None if refresh else pdf_cache.lookup(invoice_number)
+
+
+def _check_pdf(parsed: AgentResponse) -> None:
+    if parsed.kind != "pdf":
+        detail = parsed.error_message or parsed.summary
+        raise ValueError(f"Unexpected response when fetching PDF: {detail}")
+
+
+def _store_pdf(invoice_number: str, response: httpx.Response) -> CachedPdf:
+    writer = pdf_cache.PdfWriter()
+    try:
+        _check_pdf(_parse(response, writer.write))
+        return writer.commit(invoice_number)
+    finally:
+        writer.discard()
+
+
+def _export_pdf(cached: CachedPdf, output_dir: str) -> str:
+    file_path = os.path.join(output_dir, f"{cached.invoice_number}.pdf")
+    if not os.path.exists(file_path) or os.path.getsize(file_path) != cached.size:
         os.makedirs(output_dir, exist_ok=True)
-        file_path = os.path.join(output_dir, f"{invoice_number}.pdf")
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-    return {"invoice_number": invoice_number, "pdf_base64": pdf_b64, "file_path": file_path}
+        shutil.copyfile(cached.path, file_path)
+    return file_path
+
 
+def _pdf_result(
+    cached: CachedPdf, from_cache: bool, save: bool, output_dir: str, inline: bool
+) -> Dict[str, Any]:
+    return {
+        "invoice_number": cached.invoice_number,
+        "pdf_base64": encode_file_base64(cached.path) if inline else None,
+        "file_path": _export_pdf(cached, output_dir) if save else None,
+        "cache_path": cached.path,
+        "sha256": cached.sha256,
+        "size": cached.size,
+        "cached": from_cache,
+    }
 
-def query_invoice_xml(invoice_number: str) -> Dict[str, Any]:
+
+def _query_xml_request(invoice_number: str) -> Tuple[str, str]:
     data = {"invoice_number": invoice_number, **_auth_fragment()}
-    xml = build_xml("query_invoice_xml.xml.j2", data)
-    response = post_xml("action-szamla_agent_xml", xml)
-    return {"invoice_number": invoice_number, "xml": response.text}
+    return "action-szamla_agent_xml", build_xml("query_invoice_xml.xml.j2", data)
+
+
+class _XmlCollector:
+    """Parses an XML response and, when asked, also keeps its raw chunks for one final join."""
+
+    def __init__(self, response: httpx.Response, include_xml: bool) -> None:
+        self.parser = ResponseParser(response.headers)
+        self.chunks: Optional[List[bytes]] = [] if include_xml else None
+        self.encoding = response.encoding or "utf-8"
 
+    def feed(self, chunk: bytes) -> None:
+        self.parser.feed(chunk)
+        if self.chunks is not None:
+            self.chunks.append(chunk)
 
-def register_payment(invoice_number: str, paid_date: str, amount: float, currency: str = "HUF") -> Dict[str, Any]:
+    def result(self, invoice_number: str) -> Dict[str, Any]:
+        parsed = self.parser.close()
+        xml = None
+        if self.chunks is not None:
+            xml = b"".join(self.chunks).decode(self.encoding, errors="replace")
+        return {
+            **parsed.fields,
+            "invoice_number": invoice_number,
+            "success": parsed.success,
+            "error_code": parsed.error_code,
+            "error_message": parsed.error_message,
+            "xml": xml,
+        }
+
+
+def _read_xml(invoice_number: str, include_xml: bool) -> Callable[[httpx.Response], Dict[str, Any]]:
+    def handler(response: httpx.Response) -> Dict[str, Any]:
+        collector = _XmlCollector(response, include_xml)
+        for chunk in response.iter_bytes():
+            collector.feed(chunk)
+        return collector.result(invoice_number)
+
+    return handler
+
+
+def _register_payment_request(
+    invoice_number: str, paid_date: str, amount: float, currency: str
+) -> Tuple[str, str]:
     data = {
         "invoice_number": invoice_number,
         "paid_date": paid_date,
@@ -117,8 +348,53 @@ def register_payment(invoice_number: str, paid_date: str, amount: float, currenc
         "currency": currency,
         **_auth_fragment(),
     }
-    xml = build_xml("register_payment.xml.j2", data)
-    response = post_xml("action-szamla_agent_kifiz", xml)
-    summary = summarize_response(response.text)
-    ok = "DONE" in response.text.upper()
-    return {"ok": ok, "message": summary}
+    return "action-szamla_agent_kifiz", build_xml("register_payment.xml.j2", data)
+
+
+def _payment_result(parsed: AgentResponse) -> Dict[str, Any]:
+    return {"ok": bool(parsed.success), "message": parsed.summary}
+
+
+def generate_invoice(payload: Dict[str, Any]) -> Dict[str, Any]:
+    parsed = request_agent(*_generate_invoice_request(payload), _parse)
+    return _invoice_result(parsed)
+
+
+def query_invoice_pdf(
+    invoice_number: str,
+    save: bool = True,
+    output_dir: str = "./data",
+    inline: bool = True,
+    refresh: bool = False,
+) -> Dict[str, Any]:
+    """Return an invoice PDF, downloading it only when it is not in the local cache.
+
+    A download streams straight into the cache. With ``inline=False`` the response
+    carries the cached file's path instead of the base64-encoded content.
+    """
+    cached = _cached_pdf(invoice_number, refresh)
+    from_cache = cached is not None
+    if cached is None:
+        cached = request_agent(
+            *_query_pdf_request(invoice_number),
+            lambda response: _store_pdf(invoice_number, response),
+        )
+    return _pdf_result(cached, from_cache, save, output_dir, inline)
+
+
+def query_invoice_xml(invoice_number: str, include_xml: bool = True) -> Dict[str, Any]:
+    """Return the invoice's key fields, parsed as the XML streams in.
+
+    The raw document is included under ``xml`` unless ``include_xml`` is false.
+    """
+    handler = _read_xml(invoice_number, include_xml)
+    return request_agent(*_query_xml_request(invoice_number), handler)
+
+
+def register_payment(
+    invoice_number: str, paid_date: str, amount: float, currency: str = "HUF"
+) -> Dict[str, Any]:
+    parsed = request_agent(
+        *_register_payment_request(invoice_number, paid_date, amount, currency), _parse
+    )
+    return _payment_result(parsed)
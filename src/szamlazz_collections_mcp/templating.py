@@ -0,0 +1,92 @@
+"""Process-wide Jinja environments for the agent XML and reminder templates.
+
+Environments are built once and keep their compiled templates, so rendering does not
+re-stat the template directory or recompile on every call. ``TEMPLATES_AUTO_RELOAD``
+restores per-call freshness checks for template development, and
+``TEMPLATES_COMPILED_DIR`` points at the output of :func:`compile_templates` so even the
+first render skips parsing.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import os
+from typing import Dict, List
+
+from jinja2 import (
+    BaseLoader,
+    ChoiceLoader,
+    Environment,
+    FileSystemLoader,
+    ModuleLoader,
+    select_autoescape,
+)
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_PACKAGE_DIR = os.path.dirname(__file__)
+
+TEMPLATE_DIRS: Dict[str, str] = {
+    "xml": os.path.join(_PACKAGE_DIR, "xml_templates"),
+    "reminder": os.path.join(_PACKAGE_DIR, "templates"),
+}
+
+
+def _environment_options(kind: str) -> dict:
+    if kind == "xml":
+        return {
+            "autoescape": select_autoescape(enabled_extensions=(".xml",)),
+            "trim_blocks": True,
+            "lstrip_blocks": True,
+        }
+    return {"autoescape": False}
+
+
+def _loader(kind: str) -> BaseLoader:
+    source_loader = FileSystemLoader(TEMPLATE_DIRS[kind])
+    compiled_dir = get_settings().templates_compiled_dir
+    if compiled_dir and os.path.isdir(os.path.join(compiled_dir, kind)):
+        return ChoiceLoader([ModuleLoader(os.path.join(compiled_dir, kind)), source_loader])
+    return source_loader
+
+
+@functools.cache
+def get_environment(kind: str) -> Environment:
+    if kind not in TEMPLATE_DIRS:
+        raise ValueError(f"Unknown template set {kind!r}")
+    auto_reload = get_settings().templates_auto_reload
+    env = Environment(loader=_loader(kind), auto_reload=auto_reload, **_environment_options(kind))
+    logger.debug("Built %s template environment (auto_reload=%s)", kind, auto_reload)
+    return env
+
+
+def reset_environments() -> None:
+    get_environment.cache_clear()
+
+
+def warm_templates() -> List[str]:
+    """Compile every template up front so the first tool call does not pay for it."""
+    loaded = []
+    for kind, source_dir in TEMPLATE_DIRS.items():
+        env = get_environment(kind)
+        # ModuleLoader cannot enumerate templates, so list names from the sources.
+        for name in FileSystemLoader(source_dir).list_templates():
+            env.get_template(name)
+            loaded.append(f"{kind}/{name}")
+    return loaded
+
+
+def compile_templates(target_dir: str) -> Dict[str, str]:
+    """Precompile all templates to Python modules under ``target_dir/<kind>``."""
+    written = {}
+    for kind, source_dir in TEMPLATE_DIRS.items():
+        env = Environment(loader=FileSystemLoader(source_dir), **_environment_options(kind))
+        destination = os.path.join(target_dir, kind)
+        os.makedirs(destination, exist_ok=True)
+        env.compile_templates(destination, zip=None, ignore_errors=False)
+        written[kind] = destination
+    logger.info("Compiled templates to %s", target_dir)
+    return written
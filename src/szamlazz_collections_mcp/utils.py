@@ -1,13 +1,28 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import functools
+import logging
 import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Generator, Optional
+from typing import Any, Callable, Generator, Iterator, List, Optional, TypeVar
 
+from . import metrics
 from .config import get_settings
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# A multiple of 3, so every chunk encodes to base64 without padding and chunks concatenate.
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
 
 def ensure_data_dir() -> None:
     db_path = get_settings().db_path
@@ -16,21 +31,252 @@ def ensure_data_dir() -> None:
         os.makedirs(directory, exist_ok=True)
 
 
+class ConnectionPool:
+    """Long-lived SQLite connections shared across tool calls.
+
+    Writes go through a single connection guarded by a re-entrant lock, so writers in
+    this process queue up instead of fighting over the database lock. Reads borrow one
+    of up to ``size`` ``query_only`` connections, which WAL mode lets run alongside the
+    writer. A thread that already holds a connection gets the same one back when it
+    nests ``db_connection`` calls.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = 4,
+        timeout: float = 30.0,
+        write_cache_kb: Optional[int] = None,
+    ) -> None:
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.write_cache_kb = write_cache_kb
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._idle_readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(self.size)
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.timeout,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn.execute("PRAGMA journal_mode = WAL")
+            if self.write_cache_kb:
+                # Index maintenance during bulk writes thrashes SQLite's 2 MiB default cache.
+                conn.execute(f"PRAGMA cache_size = -{int(self.write_cache_kb)}")
+        with self._connections_lock:
+            self._connections.append(conn)
+        logger.debug("Opened %s connection to %s", "read" if readonly else "write", self.db_path)
+        return conn
+
+    @contextmanager
+    def connection(self, readonly: bool = False) -> Generator[sqlite3.Connection, None, None]:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        local = self._local
+        if getattr(local, "writer_depth", 0):
+            # Reads inside a write block must see the uncommitted rows of that block.
+            with self._writer_connection() as conn:
+                yield conn
+        elif readonly:
+            with self._reader_connection() as conn:
+                yield conn
+        else:
+            with self._writer_connection() as conn:
+                yield conn
+
+    @contextmanager
+    def _writer_connection(self) -> Generator[sqlite3.Connection, None, None]:
+        local = self._local
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(readonly=False)
+            local.writer_depth = getattr(local, "writer_depth", 0) + 1
+            try:
+                yield self._writer
+            finally:
+                local.writer_depth -= 1
+                if not local.writer_depth and self._writer.in_transaction:
+                    self._writer.rollback()
+
+    @contextmanager
+    def _reader_connection(self) -> Generator[sqlite3.Connection, None, None]:
+        local = self._local
+        conn: Optional[sqlite3.Connection] = getattr(local, "reader", None)
+        if conn is not None:
+            local.reader_depth += 1
+            try:
+                yield conn
+            finally:
+                local.reader_depth -= 1
+            return
+
+        if not self._reader_slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Timed out waiting for a read connection")
+        try:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(readonly=True)
+            local.reader, local.reader_depth = conn, 1
+            try:
+                yield conn
+            finally:
+                local.reader, local.reader_depth = None, 0
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle_readers.put(conn)
+        finally:
+            self._reader_slots.release()
+
+    def close(self) -> None:
+        self._closed = True
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                logger.exception("Failed to close SQLite connection")
+        self._writer = None
+        logger.debug("Closed connection pool for %s", self.db_path)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    settings = get_settings()
+    pool = _pool
+    if pool is not None and pool.db_path == settings.db_path:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.db_path != settings.db_path:
+            if _pool is not None:
+                _pool.close()
+            ensure_data_dir()
+            _pool = ConnectionPool(
+                settings.db_path,
+                size=settings.db_pool_size,
+                timeout=settings.db_busy_timeout,
+                write_cache_kb=settings.db_write_cache_kb,
+            )
+        return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+_DB_WAIT = metrics.histogram(
+    "db_connection_wait_seconds", "Time to acquire a pooled SQLite connection", ["mode"]
+)
+_DB_HOLD = metrics.histogram(
+    "db_connection_hold_seconds", "Time a pooled SQLite connection is held", ["mode"]
+)
+_DB_ERRORS = metrics.counter(
+    "db_errors_total", "Exceptions raised while holding a SQLite connection", ["mode", "error"]
+)
+
+
 @contextmanager
-def db_connection() -> Generator[sqlite3.Connection, None, None]:
-    ensure_data_dir()
-    conn = sqlite3.connect(get_settings().db_path, detect_types=sqlite3.PARSE_DECLTYPES)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
+def db_connection(readonly: bool = False) -> Generator[sqlite3.Connection, None, None]:
+    if not metrics.enabled():
+        with get_pool().connection(readonly=readonly) as conn:
+            yield conn
+        return
+    mode = "read" if readonly else "write"
+    start = time.perf_counter()
+    with get_pool().connection(readonly=readonly) as conn:
+        acquired = time.perf_counter()
+        _DB_WAIT.labels(mode).observe(acquired - start)
+        try:
+            yield conn
+        except Exception as exc:
+            _DB_ERRORS.labels(mode, exc.__class__.__name__).inc()
+            raise
+        finally:
+            _DB_HOLD.labels(mode).observe(time.perf_counter() - acquired)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Bounded pool for blocking SQLite, SMTP and file work called from async tools."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_settings().blocking_workers, thread_name_prefix="szamlazz-blocking"
+            )
+        return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def resolve_within(base_dir: str, path: str) -> str:
+    """Resolve a client-supplied ``path`` inside ``base_dir``.
+
+    Absolute paths, ``..`` components and symlinks leading out of ``base_dir`` are
+    refused with ``ValueError``, so MCP clients only reach files under that directory.
+    """
+    parts = path.replace("\\", "/").split("/")
+    if not path or os.path.isabs(path) or ".." in parts:
+        raise ValueError(f"Path must be relative to {base_dir} and must not contain '..'")
+    base = os.path.realpath(base_dir)
+    resolved = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, resolved]) != base or resolved == base:
+        raise ValueError(f"Path must point to a file inside {base_dir}")
+    return resolved
 
 
 def encode_pdf(pdf_bytes: bytes) -> str:
     return base64.b64encode(pdf_bytes).decode()
 
 
+def iter_base64_file(path: str, chunk_size: int = BASE64_CHUNK_SIZE) -> Iterator[str]:
+    chunk_size = max(3, chunk_size - chunk_size % 3)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield base64.b64encode(chunk).decode()
+
+
+def encode_file_base64(path: str, chunk_size: int = BASE64_CHUNK_SIZE) -> str:
+    """Base64-encode a file without reading it into memory as a whole first."""
+    return "".join(iter_base64_file(path, chunk_size))
+
+
 def summarize_response(response_text: str, limit: int = 300) -> str:
     sanitized = response_text.strip().replace("\n", " ")
     return sanitized[:limit]
@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from szamlazz_collections_mcp import agent_guard, szamlazz_client
+from szamlazz_collections_mcp.config import reset_settings
+
+_ACTION_RE = re.compile(rb'name="(action-[a-z_]+)"')
+
+DEFAULT_RESPONSES = {
+    "action-xmlagentxmlfile": (
+        200,
+        b"<xmlszamlavalasz><szamlaszam>E-TEST-2024-1</szamlaszam></xmlszamlavalasz>",
+    ),
+    "action-szamla_agent_pdf": (200, b"%PDF-1.4\n% fake invoice\n%%EOF\n"),
+    "action-szamla_agent_xml": (200, b"<szamla><szamlaszam>E-TEST-2024-1</szamlaszam></szamla>"),
+    "action-szamla_agent_kifiz": (200, b"DONE"),
+}
+
+
+class FakeAgent:
+    """Local stand-in for the Számlázz.hu agent endpoint.
+
+    Responds per action from ``DEFAULT_RESPONSES`` unless a response was queued with
+    ``enqueue``, optionally with extra headers such as ``Retry-After``; ``latency``
+    delays every response, and ``on_request`` is called with the action of each request
+    before it is answered. Each request is recorded together
+    with the client port, which shows whether keep-alive connections were reused, and
+    ``max_in_flight`` is the most requests it was handling at once.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.queued = []
+        self.latency = 0.0
+        self.on_request = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        agent = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                match = _ACTION_RE.search(body)
+                action = match.group(1).decode() if match else None
+                with agent._lock:
+                    port = self.client_address[1]
+                    agent.requests.append({"action": action, "port": port, "body": body})
+                    queued = agent.queued.pop(0) if agent.queued else None
+                    agent.in_flight += 1
+                    agent.max_in_flight = max(agent.max_in_flight, agent.in_flight)
+                try:
+                    self._respond(queued, action)
+                finally:
+                    with agent._lock:
+                        agent.in_flight -= 1
+
+            def _respond(self, queued, action):
+                if agent.on_request is not None:
+                    agent.on_request(action)
+                if agent.latency:
+                    time.sleep(agent.latency)
+                status, payload, headers = queued or (
+                    *DEFAULT_RESPONSES.get(action, (400, b"unknown action")),
+                    {},
+                )
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                content_type = "application/pdf" if payload.startswith(b"%PDF") else "text/xml"
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/szamla/"
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    def enqueue(self, status, payload, headers=None):
+        self.queued.append((status, payload, headers or {}))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    agent = FakeAgent().start()
+    monkeypatch.setenv("SZAMLAZZ_BASE_URL", agent.url)
+    monkeypatch.setenv("SZAMLAZZ_AGENT_KEY", "test-key")
+    monkeypatch.setenv("SZAMLAZZ_RETRY_BACKOFF", "0")
+    reset_settings()
+    agent_guard.reset_guard()
+    szamlazz_client.close_http_client()
+    yield agent
+    szamlazz_client.close_http_client()
+    agent.stop()
+    agent_guard.reset_guard()
+    reset_settings()
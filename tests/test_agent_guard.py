@@ -0,0 +1,160 @@
+import asyncio
+
+import httpx
+import pytest
+
+from szamlazz_collections_mcp import agent_guard, szamlazz_async_client, szamlazz_client
+from szamlazz_collections_mcp.agent_guard import AgentGuard, AgentUnavailable, Clock
+from szamlazz_collections_mcp.config import reset_settings
+
+
+class FakeClock(Clock):
+    """Stands still until advanced; sleeping advances it and is recorded."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.advance(seconds)
+
+    async def sleep_async(self, seconds):
+        self.sleep(seconds)
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def configure(monkeypatch, fake_agent, clock):
+    def apply(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        reset_settings()
+        agent_guard.reset_guard(clock)
+
+    return apply
+
+
+def _query_all(numbers):
+    async def scenario():
+        try:
+            await asyncio.gather(*(szamlazz_async_client.query_invoice_xml(n) for n in numbers))
+        finally:
+            await szamlazz_async_client.close_async_client()
+
+    asyncio.run(scenario())
+
+
+def test_circuit_opens_fails_fast_and_recovers_after_probe(configure, fake_agent, clock):
+    configure(SZAMLAZZ_RETRIES=0, SZAMLAZZ_BREAKER_FAILURES=3, SZAMLAZZ_BREAKER_COOLDOWN=30)
+    for _ in range(3):
+        fake_agent.enqueue(503, b"busy")
+        with pytest.raises(httpx.HTTPStatusError):
+            szamlazz_client.query_invoice_xml("E-1")
+
+    with pytest.raises(AgentUnavailable):
+        szamlazz_client.register_payment("E-1", "2024-01-10", 100.0)
+    with pytest.raises(AgentUnavailable):
+        _query_all(["E-1"])
+    assert len(fake_agent.requests) == 3
+    assert agent_guard.agent_status()["circuit"]["state"] == "open"
+
+    # A failed probe opens the circuit again; a successful one closes it.
+    clock.advance(30)
+    fake_agent.enqueue(500, b"still down")
+    with pytest.raises(httpx.HTTPStatusError):
+        szamlazz_client.query_invoice_xml("E-1")
+    with pytest.raises(AgentUnavailable):
+        szamlazz_client.query_invoice_xml("E-1")
+    clock.advance(30)
+    assert "E-TEST-2024-1" in szamlazz_client.query_invoice_xml("E-1")["xml"]
+    status = agent_guard.agent_status()["circuit"]
+    assert status["state"] == "closed"
+    assert status["consecutive_failures"] == 0
+    assert len(fake_agent.requests) == 5
+
+
+def test_rate_limited_invoice_is_resent_after_retry_after(configure, fake_agent, clock):
+    configure(SZAMLAZZ_RETRIES=1)
+    fake_agent.enqueue(429, b"slow down", {"Retry-After": "3"})
+    result = szamlazz_client.generate_invoice({"buyer": {}, "items": []})
+    assert result["invoice_number"] == "E-TEST-2024-1"
+    assert clock.sleeps == [3.0]
+    assert [request["action"] for request in fake_agent.requests] == [
+        "action-xmlagentxmlfile",
+        "action-xmlagentxmlfile",
+    ]
+
+
+def test_token_bucket_spaces_calls(configure, fake_agent, clock):
+    configure(SZAMLAZZ_RATE_PER_SECOND=20, SZAMLAZZ_RATE_BURST=2)
+    _query_all([f"E-{i}" for i in range(6)])
+    # Two calls go out at once, the other four a twentieth of a second apart.
+    assert clock.sleeps == [0.05] * 4
+    assert clock.now == pytest.approx(1000.2)
+    assert len(fake_agent.requests) == 6
+
+
+def test_concurrency_limit_shrinks_under_latency_and_grows_back(configure, fake_agent, clock):
+    configure(SZAMLAZZ_MAX_CONNECTIONS=8, SZAMLAZZ_LATENCY_TARGET=0.1)
+    # Every answer takes longer than the latency target, without waiting for real.
+    fake_agent.on_request = lambda action: clock.advance(0.15)
+    _query_all([f"E-{i}" for i in range(8)])
+    assert agent_guard.agent_status()["concurrency"]["limit"] == 4
+
+    # Four slots for eight slow calls: no more than four are at szamlazz.hu at once.
+    fake_agent.max_in_flight = 0
+    fake_agent.latency = 0.05
+    _query_all([f"E-{i}" for i in range(8)])
+    assert fake_agent.max_in_flight == 4
+    shrunk = agent_guard.agent_status()["concurrency"]
+    assert shrunk["limit"] < 4
+    assert shrunk["in_flight"] == 0
+
+    fake_agent.on_request = None
+    fake_agent.latency = 0
+    for _ in range(10):
+        szamlazz_client.query_invoice_xml("E-1")
+    assert agent_guard.agent_status()["concurrency"]["limit"] > shrunk["limit"]
+
+
+def test_rejected_call_gives_its_rate_token_back(clock):
+    guard = AgentGuard(rate_per_second=1, burst=2, max_concurrency=1, queue_timeout=0, clock=clock)
+    with guard.attempt():
+        with pytest.raises(AgentUnavailable, match="slot"):
+            with guard.attempt():
+                pass
+        assert guard.snapshot()["rate"]["tokens"] == 1.0
+    assert clock.sleeps == []
+
+
+def test_call_granted_a_slot_waits_out_a_pause_set_while_it_queued(clock):
+    guard = AgentGuard(max_concurrency=1, clock=clock)
+    started = []
+
+    async def second():
+        async with guard.attempt_async():
+            started.append(clock.now)
+
+    async def scenario():
+        async with guard.attempt_async() as first:
+            queued = asyncio.create_task(second())
+            await asyncio.sleep(0)
+            assert guard.snapshot()["concurrency"]["waiting"] == 1
+            first.record(429, "5")
+        await queued
+
+    asyncio.run(scenario())
+    assert started == [1005.0]
+    assert clock.sleeps == [5.0]
@@ -0,0 +1,79 @@
+import base64
+import os
+
+from szamlazz_collections_mcp import szamlazz_client
+from szamlazz_collections_mcp.agent_response import PREFIX_BYTES, parse_chunks
+
+
+def _chunks(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def test_xml_fields_survive_any_chunking():
+    items = b"".join(
+        b"<tetel><netto>%d</netto><brutto>%d</brutto></tetel>" % (i, i) for i in range(2000)
+    )
+    body = (
+        b'<?xml version="1.0" encoding="UTF-8"?>\n<szamla xmlns="http://www.szamlazz.hu/szamla">'
+        b"<alap><szamlaszam>E-2024-7</szamlaszam><fizh>2024-02-01</fizh>"
+        b"<devizanem>EUR</devizanem></alap><vevo><nev>\xc3\x81rv\xc3\xadz Kft.</nev></vevo>"
+        b"<tetelek>" + items + b"</tetelek>"
+        b"<osszegek><totalossz><netto>100</netto><brutto>127,5</brutto></totalossz></osszegek>"
+        b"</szamla>"
+    )
+    for size in (1, 7, 4096, len(body)):
+        parsed = parse_chunks(_chunks(body, size))
+        assert parsed.kind == "xml"
+        assert parsed.invoice_number == "E-2024-7"
+        assert parsed.fields["due_date"] == "2024-02-01"
+        assert parsed.fields["currency"] == "EUR"
+        assert parsed.fields["buyer_name"] == "Árvíz Kft."
+        assert parsed.fields["gross_total"] == 127.5
+        assert parsed.size == len(body)
+        assert len(parsed.summary) == 300
+
+
+def test_error_response_and_headers():
+    body = (
+        b"<xmlszamlavalasz><sikeres>false</sikeres><hibakod>57</hibakod>"
+        b"<hibauzenet>Hiba a kapott XML-ben</hibauzenet></xmlszamlavalasz>"
+    )
+    parsed = parse_chunks(_chunks(body, 10), {"szlahu_bruttovegosszeg": "1270"})
+    assert parsed.success is False
+    assert (parsed.error_code, parsed.error_message) == ("57", "Hiba a kapott XML-ben")
+    assert parsed.invoice_number is None
+    assert parsed.fields == {"gross_total": 1270.0}
+
+
+def test_pdf_is_streamed_to_sink_or_encoded_incrementally():
+    pdf = b"%PDF-1.4\n" + os.urandom(100_001)
+    encoded = parse_chunks(_chunks(pdf, 1000))
+    assert encoded.kind == "pdf" and encoded.success is True
+    assert base64.b64decode(encoded.pdf_base64) == pdf
+    assert encoded.summary == ""
+
+    received = []
+    parsed = parse_chunks(_chunks(pdf, 4), {"szlahu_szamlaszam": "E-9"}, received.append)
+    assert b"".join(received) == pdf
+    assert parsed.pdf_base64 is None
+    assert parsed.invoice_number == "E-9"
+
+
+def test_plain_text_and_malformed_xml_fall_back_to_prefix():
+    done = parse_chunks([b"DO", b"NE;E-2024-3\n"])
+    assert (done.kind, done.invoice_number, done.success) == ("text", "E-2024-3", True)
+    assert done.summary == "DONE;E-2024-3"
+
+    broken = parse_chunks([b"<valasz><szamlaszam>E-5</szamlaszam><oops", b" " * PREFIX_BYTES])
+    assert broken.invoice_number == "E-5"
+    assert parse_chunks([]).kind == "text"
+
+
+def test_client_results_carry_parsed_fields(fake_agent):
+    result = szamlazz_client.generate_invoice({"buyer": {}, "items": []})
+    assert result["invoice_number"] == "E-TEST-2024-1"
+    assert result["pdf_base64"] is None
+    assert result["raw_response_summary"].startswith("<xmlszamlavalasz>")
+
+    result = szamlazz_client.query_invoice_xml("E-TEST-2024-1", include_xml=False)
+    assert result["xml"] is None
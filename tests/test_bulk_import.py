@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from szamlazz_collections_mcp import cli, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.importer import import_invoice_file
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import resolve_within
+
+
+def _record(number: str, amount: float) -> InvoiceRecord:
+    return InvoiceRecord(
+        invoice_number=number,
+        buyer_name="Bulk Buyer",
+        buyer_email="bulk@example.com",
+        issue_date=date.today(),
+        due_date=date.today() + timedelta(days=8),
+        gross_total=amount,
+        currency="HUF",
+        status="open",
+        created_at=datetime.utcnow(),
+        last_reminded_at=None,
+        reminders_sent_count=0,
+        external_id=None,
+    )
+
+
+def test_bulk_insert_reports_inserted_and_updated(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        reset_settings()
+        storage.init_db()
+        storage.insert_invoice(_record("INV-0", 1.0))
+        records = (_record(f"INV-{i}", float(i)) for i in range(5))
+        result = storage.bulk_insert_invoices(records, chunk_size=2)
+        assert result == {"processed": 5, "inserted": 4, "updated": 1}
+        assert len(storage.list_invoices()) == 5
+        assert storage.get_invoice("INV-0").gross_total == 0.0
+
+
+def test_import_csv_and_jsonl_files(monkeypatch, capsys):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        reset_settings()
+        storage.init_db()
+        csv_path = os.path.join(tmpdir, "ledger.csv")
+        with open(csv_path, "w", encoding="utf-8") as handle:
+            handle.write("invoice_number,buyer_name,buyer_email,issue_date,due_date,gross_total,currency,external_id\n")
+            handle.write("CSV-1,Kft,a@example.com,2024-01-01,2024-01-09,1200.5,HUF,\n")
+            handle.write("CSV-2,Kft,a@example.com,2024-01-02,2024-01-10,300,EUR,order-2\n")
+        jsonl_path = os.path.join(tmpdir, "ledger.jsonl")
+        with open(jsonl_path, "w", encoding="utf-8") as handle:
+            row = {
+                "invoice_number": "CSV-2",
+                "buyer_name": "Kft",
+                "buyer_email": "a@example.com",
+                "issue_date": "2024-01-02",
+                "due_date": "2024-01-10",
+                "gross_total": 310,
+                "currency": "EUR",
+                "status": "paid",
+            }
+            handle.write(json.dumps(row) + "\n\n")
+
+        assert import_invoice_file(csv_path)["inserted"] == 2
+        assert cli.main(["import-invoices", jsonl_path]) == 0
+        assert json.loads(capsys.readouterr().out)["updated"] == 1
+        updated = storage.get_invoice("CSV-2")
+        assert updated.status == "paid"
+        assert updated.gross_total == 310
+        assert storage.get_invoice("CSV-1").external_id is None
+
+
+def test_client_paths_are_confined_to_the_import_dir(tmp_path):
+    imports = tmp_path / "imports"
+    (imports / "2024").mkdir(parents=True)
+    (imports / "escape").symlink_to(tmp_path)
+    assert resolve_within(str(imports), "2024/ledger.csv") == str(
+        (imports / "2024" / "ledger.csv").resolve()
+    )
+    for path in ("/etc/passwd", "../app.db", "2024/../../app.db", "escape/app.db", ""):
+        with pytest.raises(ValueError):
+            resolve_within(str(imports), path)
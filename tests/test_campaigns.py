@@ -0,0 +1,103 @@
+import os
+import socket
+import tempfile
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from szamlazz_collections_mcp import storage
+from szamlazz_collections_mcp.campaigns import run_reminder_campaign
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.models import InvoiceRecord
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+from aiosmtpd.smtp import AuthResult  # noqa: E402
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        message = {"peer": session.peer, "to": envelope.rcpt_tos, "data": envelope.content}
+        self.messages.append(message)
+        return "250 Message accepted for delivery"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    handler = RecordingHandler()
+    port = _free_port()
+    controller = aiosmtpd_controller.Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=port,
+        authenticator=lambda server, session, envelope, mechanism, data: AuthResult(success=True),
+        auth_require_tls=False,
+    )
+    controller.start()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_USER", "user")
+    monkeypatch.setenv("SMTP_PASSWORD", "secret")
+    monkeypatch.setenv("SMTP_FROM", "collections@example.com")
+    monkeypatch.setenv("SMTP_STARTTLS", "false")
+    yield handler
+    controller.stop()
+
+
+def _record(number: str, days_overdue: int, last_reminded_at=None) -> InvoiceRecord:
+    today = date.today()
+    return InvoiceRecord(
+        invoice_number=number,
+        buyer_name="Late Buyer",
+        buyer_email=f"{number.lower()}@example.com",
+        issue_date=today - timedelta(days=days_overdue + 8),
+        due_date=today - timedelta(days=days_overdue),
+        gross_total=100.0,
+        currency="HUF",
+        status="open",
+        created_at=datetime.utcnow(),
+        last_reminded_at=last_reminded_at,
+        reminders_sent_count=0,
+    )
+
+
+def test_campaign_sends_over_one_session_and_records_batch(monkeypatch, smtp_server):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        reset_settings()
+        storage.init_db()
+        storage.bulk_insert_invoices(
+            [
+                _record("INV-1", 10),
+                _record("INV-2", 20),
+                _record("INV-3", 30),
+                _record("INV-RECENT", 30, last_reminded_at=datetime.utcnow() - timedelta(days=1)),
+                _record("INV-FRESH", 1),
+            ]
+        )
+
+        preview = run_reminder_campaign(min_days_overdue=5, dry_run=True)
+        assert preview["selected"] == 3
+        assert smtp_server.messages == []
+
+        result = run_reminder_campaign(min_days_overdue=5, language="en", batch_size=2)
+        assert result["sent"] == 3
+        assert result["failed"] == []
+        assert len({message["peer"] for message in smtp_server.messages}) == 1
+        assert sorted(message["to"][0] for message in smtp_server.messages) == [
+            "inv-1@example.com",
+            "inv-2@example.com",
+            "inv-3@example.com",
+        ]
+        assert storage.get_invoice("INV-2").reminders_sent_count == 1
+        assert storage.get_invoice("INV-RECENT").reminders_sent_count == 0
+
+        assert run_reminder_campaign(min_days_overdue=5)["selected"] == 0
@@ -0,0 +1,147 @@
+import os
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from szamlazz_collections_mcp import fx, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import close_pool, db_connection
+
+TODAY = date(2024, 6, 30)
+
+RECOMPUTE_SQL = """
+SELECT buyer_email, currency, COUNT(*), ROUND(SUM(gross_total), 2), SUM(status = 'open'),
+       ROUND(SUM(CASE WHEN status = 'open' THEN gross_total - paid_amount ELSE 0 END), 2),
+       SUM(reminders_sent_count),
+       (SELECT MIN(due_date) FROM invoices o WHERE o.buyer_email = i.buyer_email
+            AND o.currency = i.currency AND o.status = 'open')
+FROM invoices i GROUP BY buyer_email, currency ORDER BY buyer_email, currency
+"""
+
+MAINTAINED_SQL = """
+SELECT buyer_email, currency, invoice_count, ROUND(billed_total, 2), open_count,
+       ROUND(open_total, 2), reminders_sent, oldest_open_due_date
+FROM customer_balances ORDER BY buyer_email, currency
+"""
+
+
+def _record(number, email, due_offset, amount, status="open", currency="HUF", issue_offset=-30):
+    return InvoiceRecord(
+        invoice_number=number,
+        buyer_name=email.split("@")[0],
+        buyer_email=email,
+        issue_date=TODAY + timedelta(days=issue_offset),
+        due_date=TODAY + timedelta(days=due_offset),
+        gross_total=amount,
+        currency=currency,
+        status=status,
+        created_at=datetime.utcnow(),
+        last_reminded_at=None,
+        reminders_sent_count=0,
+    )
+
+
+def _assert_consistent():
+    with db_connection(readonly=True) as conn:
+        expected = [tuple(row) for row in conn.execute(RECOMPUTE_SQL)]
+        actual = [tuple(row) for row in conn.execute(MAINTAINED_SQL)]
+    oldest = [date.fromisoformat(row[7]) if row[7] else None for row in expected]
+    assert actual == [row[:7] + (due,) for row, due in zip(expected, oldest, strict=True)]
+
+
+@pytest.fixture
+def balances_db(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        reset_settings()
+        yield
+        close_pool()
+    reset_settings()
+
+
+def test_balances_follow_every_write_path(balances_db):
+    storage.init_db()
+    rng = random.Random(3)
+    records = [
+        _record(
+            f"INV-{index}",
+            f"c{rng.randrange(8)}@example.com",
+            rng.randrange(-60, 20),
+            round(rng.uniform(10, 500), 2),
+            status=rng.choice(("open", "paid")),
+            currency=rng.choice(("HUF", "EUR")),
+        )
+        for index in range(200)
+    ]
+    storage.bulk_insert_invoices(records)
+    _assert_consistent()
+
+    storage.bulk_insert_invoices(
+        [r.model_copy(update={"gross_total": r.gross_total + 1}) for r in records[:50]]
+    )
+    storage.mark_invoice_paid("INV-7", TODAY)
+    storage.update_reminder_metadata("INV-8")
+    storage.update_reminder_metadata_many(["INV-9", "INV-10"])
+    storage.insert_invoice(records[11].model_copy(update={"buyer_email": "moved@example.com"}))
+    with db_connection() as conn:
+        conn.execute("UPDATE invoices SET paid_amount = gross_total / 4 WHERE rowid % 3 = 0")
+        conn.commit()
+    _assert_consistent()
+
+
+def test_migration_backfills_existing_invoices(balances_db):
+    with db_connection() as conn:
+        storage.migrate(conn, target_version=5)
+        conn.executemany(
+            storage.UPSERT_INVOICE_SQL,
+            [
+                storage._record_params(_record("A-1", "a@example.com", -10, 100.0)),
+                storage._record_params(_record("A-2", "a@example.com", -40, 50.0)),
+                storage._record_params(_record("A-3", "a@example.com", -90, 70.0, status="paid")),
+            ],
+        )
+        conn.commit()
+    storage.init_db()
+    _assert_consistent()
+    (summary,) = storage.customer_summary("a@example.com", today=TODAY)
+    assert summary["oldest_open_invoice"] == "A-2"
+    assert summary["oldest_days_overdue"] == 40
+
+
+def test_top_debtors_and_dso(balances_db, tmp_path):
+    storage.init_db()
+    rates = tmp_path / "rates.csv"
+    rates.write_text("Dátum/ISO;EUR\n2024.06.28.;2,00\n", encoding="utf-8")
+    fx.load_fx_rates(str(rates))
+    storage.bulk_insert_invoices(
+        [
+            _record("B-1", "big@example.com", -5, 900.0, issue_offset=-20),
+            _record("B-2", "big@example.com", -50, 300.0, status="paid", issue_offset=-60),
+            _record("S-1", "small@example.com", 5, 100.0, issue_offset=-200),
+            _record("E-1", "euro@example.com", -1, 400.0, currency="EUR"),
+            _record("P-1", "paid@example.com", -1, 999.0, status="paid"),
+        ]
+    )
+    debtors = storage.top_debtors(limit=10, today=TODAY)
+    assert [(row["buyer_email"], row["currency"]) for row in debtors] == [
+        ("big@example.com", "HUF"),
+        ("euro@example.com", "EUR"),
+        ("small@example.com", "HUF"),
+    ]
+    assert [row["buyer_email"] for row in storage.top_debtors(currency="HUF", today=TODAY)] == [
+        "big@example.com",
+        "small@example.com",
+    ]
+    # Ranked by balance in forints: 400 EUR is worth 800 HUF.
+    assert debtors[1]["open_total_converted"] == 800.0
+    big = debtors[0]
+    # 900 open against 1200 billed in the last 90 days.
+    assert big["dso"] == pytest.approx(900 / 1200 * 90, abs=0.1)
+    assert big["oldest_open_invoice"] == "B-1" and big["oldest_days_overdue"] == 5
+    # Nothing billed in the trailing period, so DSO is undefined.
+    assert debtors[2]["dso"] is None
+    # Limiting the ranking leaves the figures of the customers it keeps unchanged.
+    assert storage.top_debtors(limit=2, today=TODAY) == debtors[:2]
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+from szamlazz_collections_mcp import storage, utils
+from szamlazz_collections_mcp.config import reset_settings
+
+
+def test_connections_are_reused_and_reads_are_read_only(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        monkeypatch.setenv("DB_POOL_SIZE", "2")
+        reset_settings()
+        storage.init_db()
+
+        with utils.db_connection() as first:
+            mode = first.execute("PRAGMA journal_mode").fetchone()[0]
+        with utils.db_connection() as second:
+            pass
+        assert first is second
+        assert mode == "wal"
+
+        with utils.db_connection(readonly=True) as reader:
+            assert reader is not first
+            with utils.db_connection(readonly=True) as nested:
+                assert nested is reader
+            with pytest.raises(sqlite3.OperationalError):
+                reader.execute("DELETE FROM invoices")
+
+        seen = []
+
+        def worker():
+            with utils.db_connection(readonly=True) as conn:
+                seen.append(conn)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        assert seen == [reader]
+
+        utils.close_pool()
+        with pytest.raises(sqlite3.ProgrammingError):
+            first.execute("SELECT 1")
+
+
+def test_pool_follows_db_path_changes(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "a.db"))
+        reset_settings()
+        pool_a = utils.get_pool()
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "b.db"))
+        reset_settings()
+        pool_b = utils.get_pool()
+        assert pool_a is not pool_b
+        assert pool_b.db_path.endswith("b.db")
+        utils.close_pool()
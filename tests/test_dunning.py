@@ -0,0 +1,187 @@
+import os
+import socket
+import tempfile
+from datetime import date, datetime, timedelta
+from email import message_from_bytes, policy
+
+import pytest
+
+from szamlazz_collections_mcp import storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.cron import CronSchedule
+from szamlazz_collections_mcp.dunning import (
+    due_actions,
+    dunning_history,
+    parse_policy,
+    preview_next_run,
+    run_dunning,
+)
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import close_pool
+
+
+def test_cron_next_after():
+    weekdays = CronSchedule.parse("30 9 * * 1-5")
+    # Friday 2024-03-08 10:00 -> Monday 09:30.
+    assert weekdays.next_after(datetime(2024, 3, 8, 10, 0)) == datetime(2024, 3, 11, 9, 30)
+    assert weekdays.next_after(datetime(2024, 3, 11, 9, 29, 59)) == datetime(2024, 3, 11, 9, 30)
+
+    every_quarter = CronSchedule.parse("*/15 * * * *")
+    assert every_quarter.next_after(datetime(2024, 12, 31, 23, 50)) == datetime(2025, 1, 1, 0, 0)
+
+    # Day of month or Sunday (7), as in cron.
+    either = CronSchedule.parse("0 0 13 * 7")
+    assert either.next_after(datetime(2024, 9, 1, 0, 0)) == datetime(2024, 9, 8, 0, 0)
+    assert either.next_after(datetime(2024, 9, 12, 0, 0)) == datetime(2024, 9, 13, 0, 0)
+
+    leap_day = CronSchedule.parse("0 0 29 2 *")
+    assert leap_day.next_after(datetime(2025, 1, 1)) == datetime(2028, 2, 29)
+
+    for expression in ("* * *", "60 * * * *", "0 0 0 * *", "*/0 * * * *"):
+        with pytest.raises(ValueError):
+            CronSchedule.parse(expression)
+
+
+def test_parse_policy_rejects_bad_steps():
+    assert [step.tone for step in parse_policy("1:polite, 14:firm,30:final")] == [
+        "polite",
+        "firm",
+        "final",
+    ]
+    for text in ("", "x:polite", "1:rude", "14:firm,1:final"):
+        with pytest.raises(ValueError):
+            parse_policy(text)
+
+
+def _record(number: str, days_overdue: int, reminders: int = 0, reminded_days_ago=None):
+    today = date.today()
+    reminded_at = None
+    if reminded_days_ago is not None:
+        reminded_at = datetime.utcnow() - timedelta(days=reminded_days_ago)
+    return InvoiceRecord(
+        invoice_number=number,
+        buyer_name="Late Buyer",
+        buyer_email=f"{number.lower()}@example.com",
+        issue_date=today - timedelta(days=days_overdue + 8),
+        due_date=today - timedelta(days=days_overdue),
+        gross_total=100.0,
+        currency="HUF",
+        status="open",
+        created_at=datetime.utcnow(),
+        last_reminded_at=reminded_at,
+        reminders_sent_count=reminders,
+    )
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        monkeypatch.delenv("DUNNING_SCHEDULE", raising=False)
+        reset_settings()
+        storage.init_db()
+        storage.bulk_insert_invoices(
+            [
+                _record("NEW-1", 0),  # not overdue yet
+                _record("LATE-1", 3),  # first reminder, polite
+                _record("LATE-2", 45),  # first reminder, but already at the final step
+                _record("SECOND-1", 20, reminders=1, reminded_days_ago=10),  # firm
+                _record("SECOND-2", 20, reminders=1, reminded_days_ago=2),  # reminded too recently
+                _record("SECOND-3", 10, reminders=1, reminded_days_ago=9),  # not at step 2 yet
+                _record("DONE-1", 90, reminders=3, reminded_days_ago=30),  # policy exhausted
+            ]
+        )
+        yield
+        close_pool()
+
+
+def test_due_actions_escalate_by_reminders_and_lateness(ledger):
+    actions = {action.record.invoice_number: action for action in due_actions()}
+
+    assert set(actions) == {"LATE-1", "LATE-2", "SECOND-1"}
+    assert (actions["LATE-1"].step, actions["LATE-1"].tone) == (0, "polite")
+    assert (actions["LATE-2"].step, actions["LATE-2"].tone) == (0, "final")
+    assert (actions["SECOND-1"].step, actions["SECOND-1"].tone) == (1, "firm")
+    assert len(due_actions(limit=2)) == 2
+
+    preview = preview_next_run(limit=1)
+    assert preview["next_run_at"] is None
+    assert preview["selected"] == 3
+    assert preview["by_tone"] == {"polite": 1, "final": 1, "firm": 1}
+    assert len(preview["actions"]) == 1
+
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+from aiosmtpd.smtp import AuthResult  # noqa: E402
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append({"to": envelope.rcpt_tos, "data": envelope.content})
+        return "250 Message accepted for delivery"
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    handler = RecordingHandler()
+    controller = aiosmtpd_controller.Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=port,
+        authenticator=lambda server, session, envelope, mechanism, data: AuthResult(success=True),
+        auth_require_tls=False,
+    )
+    controller.start()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_USER", "user")
+    monkeypatch.setenv("SMTP_PASSWORD", "secret")
+    monkeypatch.setenv("SMTP_FROM", "collections@example.com")
+    monkeypatch.setenv("SMTP_STARTTLS", "false")
+    reset_settings()
+    yield handler
+    controller.stop()
+
+
+def test_run_sends_due_reminders_and_records_history(ledger, smtp_server):
+    result = run_dunning(trigger="test")
+
+    assert (result["selected"], result["sent"], result["failed"]) == (3, 3, 0)
+    subjects = {
+        message_from_bytes(message["data"], policy=policy.default)["Subject"]
+        for message in smtp_server.messages
+    }
+    assert subjects == {
+        "Kíméletes emlékeztető: Számla LATE-1",
+        "Utolsó felszólítás: Számla LATE-2",
+        "Fizetési felszólítás: Számla SECOND-1",
+    }
+    assert storage.get_invoice("LATE-1").reminders_sent_count == 1
+    assert storage.get_invoice("SECOND-1").reminders_sent_count == 2
+    assert storage.get_invoice("SECOND-2").reminders_sent_count == 1
+
+    # Everything just reminded waits DUNNING_MIN_INTERVAL_DAYS for its next step.
+    assert run_dunning()["selected"] == 0
+
+    runs = dunning_history()["runs"]
+    assert [(run["trigger"], run["status"], run["sent"]) for run in runs] == [
+        ("manual", "succeeded", 0),
+        ("test", "succeeded", 3),
+    ]
+    detail = dunning_history(run_id=result["run_id"])
+    sent = {
+        (action["invoice_number"], action["tone"], action["ok"])
+        for action in detail["actions"]
+    }
+    assert sent == {
+        ("LATE-1", "polite", 1),
+        ("LATE-2", "final", 1),
+        ("SECOND-1", "firm", 1),
+    }
+    assert dunning_history(run_id=999)["status"] == "not_found"
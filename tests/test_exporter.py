@@ -0,0 +1,131 @@
+import os
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+
+from szamlazz_collections_mcp import exporter, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.exporter import export_invoices
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import close_pool
+
+
+def _record(number, status="open"):
+    return InvoiceRecord(
+        invoice_number=number,
+        buyer_name="Buyer",
+        buyer_email="buyer@example.com",
+        issue_date=date.today(),
+        due_date=date.today() + timedelta(days=7),
+        gross_total=100.0,
+        currency="HUF",
+        status=status,
+        created_at=datetime.utcnow(),
+        last_reminded_at=None,
+        reminders_sent_count=0,
+    )
+
+
+def test_export_fetches_concurrently_and_reuses_cached_pdfs(monkeypatch, fake_agent):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "app.db"))
+        monkeypatch.setenv("PDF_CACHE_DIR", os.path.join(tmpdir, "pdf-cache"))
+        reset_settings()
+        storage.init_db()
+        records = [_record(f"E-2024/{i}") for i in range(6)] + [_record("E-9", "paid")]
+        storage.bulk_insert_invoices(records)
+        fake_agent.latency = 0.1
+        progress = []
+
+        target = os.path.join(tmpdir, "export.zip")
+        start = time.perf_counter()
+        result = export_invoices(
+            target, status="open", concurrency=4, progress=lambda *step: progress.append(step)
+        )
+        elapsed = time.perf_counter() - start
+
+        assert result["invoices"] == 6
+        assert result["documents"] == 12 and result["downloaded"] == 12
+        assert result["failed"] == []
+        # Twelve sequential round trips would take at least 1.2s.
+        assert elapsed < 0.9
+        assert progress[-1] == (12, 12)
+        with zipfile.ZipFile(target) as archive:
+            names = set(archive.namelist())
+            assert "pdf/E-2024_0.pdf" in names and "xml/E-2024_5.xml" in names
+            assert archive.read("pdf/E-2024_0.pdf").startswith(b"%PDF")
+        assert not os.path.exists(f"{target}.partial")
+
+        fake_agent.requests.clear()
+        again = export_invoices(target, status="open", include_xml=False)
+        assert again["from_cache"] == 6 and again["downloaded"] == 0
+        assert fake_agent.requests == []
+        close_pool()
+    reset_settings()
+
+
+def test_export_reports_failed_documents(monkeypatch, fake_agent):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "app.db"))
+        monkeypatch.setenv("PDF_CACHE_DIR", os.path.join(tmpdir, "pdf-cache"))
+        reset_settings()
+        storage.init_db()
+        storage.insert_invoice(_record("E-1"))
+        fake_agent.enqueue(400, b"no such invoice")
+
+        result = export_invoices(os.path.join(tmpdir, "export.zip"), include_pdf=False)
+        assert result["documents"] == 0
+        assert result["failed"][0]["invoice_number"] == "E-1"
+        assert result["failed"][0]["error"].startswith("HTTPStatusError")
+        close_pool()
+    reset_settings()
+
+
+def test_export_does_not_archive_agent_error_responses(monkeypatch, fake_agent):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "app.db"))
+        reset_settings()
+        storage.init_db()
+        storage.bulk_insert_invoices([_record("E-1"), _record("E-2")])
+        fake_agent.enqueue(
+            200,
+            b"<xmlszamlavalasz><sikeres>false</sikeres><hibakod>7</hibakod>"
+            b"<hibauzenet>Invoice not found</hibauzenet></xmlszamlavalasz>",
+        )
+
+        target = os.path.join(tmpdir, "export.zip")
+        result = export_invoices(target, include_pdf=False, concurrency=1)
+        assert result["documents"] == 1 and result["downloaded"] == 1
+        assert result["failed"] == [
+            {"invoice_number": "E-1", "kind": "xml", "error": "RuntimeError: 7: Invoice not found"}
+        ]
+        with zipfile.ZipFile(target) as archive:
+            assert archive.namelist() == ["xml/E-2.xml"]
+        close_pool()
+    reset_settings()
+
+
+def test_export_survives_a_cached_pdf_evicted_before_archiving(monkeypatch, tmp_path):
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "app.db"))
+    reset_settings()
+    storage.init_db()
+    storage.bulk_insert_invoices([_record("E-1"), _record("E-2")])
+    present = tmp_path / "E-2.pdf"
+    present.write_bytes(b"%PDF-1.4\n%%EOF\n")
+
+    def query_pdf(number, **kwargs):
+        path = present if number == "E-2" else tmp_path / "evicted.pdf"
+        return {"cache_path": str(path), "cached": True}
+
+    monkeypatch.setattr(exporter, "query_invoice_pdf", query_pdf)
+    target = tmp_path / "export.zip"
+    result = export_invoices(str(target), include_xml=False)
+    assert result["documents"] == 1
+    assert [(item["invoice_number"], item["kind"]) for item in result["failed"]] == [
+        ("E-1", "pdf")
+    ]
+    with zipfile.ZipFile(target) as archive:
+        assert archive.namelist() == ["pdf/E-2.pdf"]
+    close_pool()
+    reset_settings()
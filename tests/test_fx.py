@@ -0,0 +1,140 @@
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from szamlazz_collections_mcp import fx, ledger, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import close_pool, db_connection
+
+TODAY = date(2024, 6, 30)
+
+MNB_CSV = """Dátum/ISO;EUR;JPY;USD
+Egység;1;100;1
+2024.06.27.;394,50;230,10;368,20
+2024.06.28.;395,00;231,00;
+"""
+
+
+def _record(number, due_offset, amount, currency, status="open"):
+    return InvoiceRecord(
+        invoice_number=number,
+        buyer_name="Buyer",
+        buyer_email=f"{currency.lower()}@example.com",
+        issue_date=TODAY - timedelta(days=60),
+        due_date=TODAY + timedelta(days=due_offset),
+        gross_total=amount,
+        currency=currency,
+        status=status,
+        created_at=datetime.utcnow(),
+        last_reminded_at=None,
+        reminders_sent_count=0,
+    )
+
+
+@pytest.fixture
+def fx_db(monkeypatch, tmp_path):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        reset_settings()
+        ledger.reset_snapshot()
+        storage.init_db()
+        rates = tmp_path / "rates.csv"
+        rates.write_text(MNB_CSV, encoding="utf-8")
+        fx.load_fx_rates(str(rates))
+        yield tmp_path
+        ledger.reset_snapshot()
+        close_pool()
+    reset_settings()
+
+
+def test_parse_mnb_csv_handles_units_commas_and_gaps(tmp_path):
+    path = tmp_path / "rates.csv"
+    path.write_bytes(MNB_CSV.encode("cp1250"))
+    rates = {(currency, day): rate for currency, day, rate in fx.parse_mnb_csv(str(path))}
+    assert rates[("EUR", date(2024, 6, 28))] == 395.0
+    assert rates[("JPY", date(2024, 6, 27))] == pytest.approx(2.301)
+    assert ("USD", date(2024, 6, 28)) not in rates
+    assert len(rates) == 5
+
+
+def test_rates_fall_back_to_last_published_day(fx_db):
+    assert fx.get_rate("HUF") == 1.0
+    assert fx.get_rate("EUR", date(2024, 6, 30)) == 395.0
+    assert fx.get_rate("USD", date(2024, 6, 30)) == 368.2
+    assert fx.get_rate("EUR", date(2024, 6, 1)) is None
+    factors, missing = fx.conversion_rates(["EUR", "HUF", "GBP"], TODAY, base="EUR")
+    assert factors == {"EUR": 1.0, "HUF": pytest.approx(1 / 395.0)}
+    assert missing == ["GBP"]
+
+    (fx_db / "update.csv").write_text("Dátum/ISO;EUR\n2024.06.29.;400,00\n", encoding="utf-8")
+    fx.load_fx_rates(str(fx_db / "update.csv"))
+    assert fx.get_rate("EUR", date(2024, 6, 30)) == 400.0
+
+
+@pytest.mark.parametrize("rollup", [False, True])
+def test_aging_reports_per_currency_and_converted(fx_db, monkeypatch, rollup):
+    monkeypatch.setenv("AGING_ROLLUP", "true" if rollup else "false")
+    reset_settings()
+    storage.init_db()
+    storage.bulk_insert_invoices(
+        [
+            _record("H-1", -5, 1000.0, "HUF"),
+            _record("E-1", -5, 10.0, "EUR"),
+            _record("E-2", -40, 20.0, "EUR"),
+            _record("E-3", -40, 5.0, "EUR", status="paid"),
+            _record("G-1", -5, 7.0, "GBP"),
+        ]
+    )
+    summary = storage.aging_summary(today=TODAY)
+
+    assert summary["base_currency"] == "HUF"
+    assert summary["missing_rates"] == ["GBP"]
+    eur = summary["by_currency"]["EUR"]
+    assert eur["rate"] == 395.0
+    assert eur["by_bucket"]["1-7"] == {"count": 1, "gross_total": 10.0}
+    assert eur["totals"] == {"count": 3, "gross_total": 35.0}
+    assert summary["by_bucket"]["1-7"] == {"count": 3, "gross_total": 1000.0 + 3950.0}
+    assert summary["by_bucket"]["31-60"] == {"count": 1, "gross_total": 7900.0}
+    assert summary["totals"] == {"count": 5, "gross_total": 1000.0 + 35 * 395.0}
+
+    monkeypatch.setattr(ledger, "np", None)
+    assert ledger.aging_summary(today=TODAY) == summary
+
+
+def test_old_aging_rollup_is_rebuilt_per_currency(fx_db, monkeypatch):
+    storage.bulk_insert_invoices([_record("E-1", -5, 10.0, "EUR"), _record("H-1", -5, 9.0, "HUF")])
+    with db_connection() as conn:
+        conn.execute(
+            "CREATE TABLE aging_rollup (due_date DATE, status TEXT, invoice_count INTEGER, "
+            "gross_total REAL, PRIMARY KEY (due_date, status)) WITHOUT ROWID"
+        )
+        conn.commit()
+    monkeypatch.setenv("AGING_ROLLUP", "true")
+    reset_settings()
+    storage.init_db()
+    assert storage.aging_summary(today=TODAY)["totals"] == {"count": 2, "gross_total": 3959.0}
+
+
+def test_list_pages_and_overdue_summary_convert_totals(fx_db):
+    storage.bulk_insert_invoices(
+        [
+            _record("H-1", -5, 1000.0, "HUF"),
+            _record("E-1", -5, 10.0, "EUR"),
+            _record("E-2", 5, 20.0, "EUR"),
+        ]
+    )
+    page = storage.list_invoices_page(limit=1, include_totals=True)
+    assert len(page.items) == 1
+    assert page.totals["by_currency"] == {
+        "EUR": {"count": 2, "gross_total": 30.0},
+        "HUF": {"count": 1, "gross_total": 1000.0},
+    }
+    assert page.totals["count"] == 3
+    assert storage.list_invoices_page().totals is None
+
+    overdue = ledger.overdue_summary(today=TODAY)
+    assert overdue["gross_total"] == 1000.0 + 3950.0
+    assert overdue["top_customers"][0] == {"buyer_email": "eur@example.com", "gross_total": 3950.0}
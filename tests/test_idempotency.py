@@ -0,0 +1,170 @@
+import asyncio
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+import httpx
+import pytest
+
+from szamlazz_collections_mcp import (
+    invoice_batch,
+    services,
+    storage,
+    szamlazz_async_client,
+    szamlazz_client,
+)
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.models import InvoiceCreate
+from szamlazz_collections_mcp.utils import close_pool, db_connection
+
+
+def _invoice(external_id=None, quantity=1):
+    return InvoiceCreate(
+        buyer={
+            "name": "Teszt Kft.",
+            "zip": "1111",
+            "city": "Budapest",
+            "address": "Fő utca 1.",
+            "email": "buyer@example.com",
+        },
+        items=[
+            {
+                "name": "Consulting",
+                "quantity": quantity,
+                "net_unit_price": 100.0,
+                "vat_rate": 27,
+                "net_value": 100.0 * quantity,
+                "vat_value": 27.0 * quantity,
+                "gross_value": 127.0 * quantity,
+            }
+        ],
+        payment_method="transfer",
+        issue_date=date.today(),
+        due_date=date.today() + timedelta(days=8),
+        external_id=external_id,
+    )
+
+
+@pytest.fixture
+def invoice_db(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "app.db"))
+        reset_settings()
+        storage.init_db()
+        yield
+        close_pool()
+    reset_settings()
+
+
+def test_retried_request_is_answered_from_the_store(invoice_db, fake_agent):
+    first = services.create_invoice(_invoice())
+    second = services.create_invoice(_invoice())
+    assert len(fake_agent.requests) == 1
+    assert first["invoice_number"] == "E-TEST-2024-1"
+    assert second["idempotent_replay"] is True
+    assert second["stored_record"] == first["stored_record"]
+    assert storage.get_invoice("E-TEST-2024-1") is not None
+
+    services.create_invoice(_invoice(quantity=2))
+    assert len(fake_agent.requests) == 2
+
+
+def test_identical_payload_is_a_new_invoice_after_the_dedupe_window(invoice_db, fake_agent):
+    services.create_invoice(_invoice())
+    services.create_invoice(_invoice(external_id="order-1"))
+    with db_connection() as conn:
+        conn.execute(
+            "UPDATE invoice_requests SET updated_at = ?",
+            (datetime.utcnow() - timedelta(hours=2),),
+        )
+        conn.commit()
+
+    assert "idempotent_replay" not in services.create_invoice(_invoice())
+    assert services.create_invoice(_invoice(external_id="order-1"))["idempotent_replay"]
+    assert services.create_invoice(_invoice())["idempotent_replay"] is True
+    assert len(fake_agent.requests) == 3
+
+
+def test_external_id_cannot_be_reused_for_a_different_invoice(invoice_db, fake_agent):
+    services.create_invoice(_invoice(external_id="order-1"))
+    with pytest.raises(ValueError, match="already used"):
+        services.create_invoice(_invoice(external_id="order-1", quantity=3))
+    assert len(fake_agent.requests) == 1
+
+
+def test_unparseable_response_is_not_stored_under_a_placeholder(invoice_db, fake_agent):
+    fake_agent.enqueue(200, b"<xmlszamlavalasz><sikeres>true</sikeres></xmlszamlavalasz>")
+    result = services.create_invoice(_invoice())
+    assert result["invoice_number"] is None and "warning" in result
+    assert services.create_invoice(_invoice())["idempotent_replay"] is True
+    with db_connection(readonly=True) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 0
+
+
+def test_rejections_release_the_key_but_timeouts_block_it(monkeypatch, invoice_db, fake_agent):
+    fake_agent.enqueue(400, b"invalid buyer")
+    with pytest.raises(httpx.HTTPStatusError):
+        services.create_invoice(_invoice())
+    services.create_invoice(_invoice())
+    assert len(fake_agent.requests) == 2
+
+    monkeypatch.setenv("SZAMLAZZ_TIMEOUT", "0.2")
+    reset_settings()
+    szamlazz_client.close_http_client()
+    fake_agent.latency = 0.5
+    with pytest.raises(httpx.ReadTimeout):
+        services.create_invoice(_invoice(external_id="order-2"))
+    fake_agent.latency = 0
+    with pytest.raises(ValueError, match="may already have created"):
+        services.create_invoice(_invoice(external_id="order-2"))
+    assert len(fake_agent.requests) == 3
+
+    result = services.create_invoice(_invoice(external_id="order-2"), force=True)
+    assert result["invoice_number"] == "E-TEST-2024-1"
+    assert len(fake_agent.requests) == 4
+
+
+def test_batch_reports_each_invoice_and_replays_on_retry(invoice_db, fake_agent):
+    fake_agent.latency = 0.2
+    for number in ("E-BATCH-1", "E-BATCH-2"):
+        body = f"<xmlszamlavalasz><szamlaszam>{number}</szamlaszam></xmlszamlavalasz>"
+        fake_agent.enqueue(200, body.encode())
+    fake_agent.enqueue(500, b"upstream failure")
+    batch = [_invoice(external_id=f"order-{index}") for index in range(3)]
+    batch.append(_invoice(external_id="order-0"))
+
+    async def submit(force=False):
+        try:
+            return await invoice_batch.create_invoices(batch, force=force)
+        finally:
+            await szamlazz_async_client.close_async_client()
+
+    first = asyncio.run(submit())
+    # The three distinct invoices were all at szamlazz.hu at the same time.
+    assert fake_agent.max_in_flight == 3
+    assert (first["total"], first["created"], first["failed"]) == (4, 2, 2)
+    assert [result["index"] for result in first["results"]] == [0, 1, 2, 3]
+    assert "still in progress" in first["results"][3]["error"]
+    created = {result["invoice_number"] for result in first["results"] if result["ok"]}
+    assert created == {"E-BATCH-1", "E-BATCH-2"}
+    assert all(storage.get_invoice(number) is not None for number in created)
+    assert len(fake_agent.requests) == 3
+
+    fake_agent.latency = 0
+    second = asyncio.run(submit())
+    # Which invoice got the 500 depends on arrival order; it is blocked, not resent.
+    unknown = next(
+        batch[result["index"]].external_id
+        for result in first["results"]
+        if not result["ok"] and result["index"] != 3
+    )
+    blocked = [index for index, invoice in enumerate(batch) if invoice.external_id == unknown]
+    assert (second["created"], second["failed"]) == (0, len(blocked))
+    for result in second["results"]:
+        if result["index"] in blocked:
+            assert "may already have created" in result["error"]
+        else:
+            assert result["idempotent_replay"] is True
+    replayed = {result.get("invoice_number") for result in second["results"] if result["ok"]}
+    assert replayed == created
+    assert len(fake_agent.requests) == 3
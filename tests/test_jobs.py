@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+from szamlazz_collections_mcp import jobs, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.utils import close_pool, db_connection
+
+PAYMENT = {"invoice_number": "E-TEST-2024-1", "paid_date": "2024-01-10", "amount": 100.0}
+DEDUPE_KEY = "register_payment:E-TEST-2024-1"
+
+
+@pytest.fixture
+def job_db(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "jobs.db"))
+        monkeypatch.setenv("JOBS_RETRY_BACKOFF", "0")
+        reset_settings()
+        storage.init_db()
+        yield
+        close_pool()
+    reset_settings()
+
+
+def test_enqueue_deduplicates_active_jobs_and_runs_once(job_db, fake_agent):
+    first = jobs.enqueue_job("register_payment", PAYMENT, dedupe_key=DEDUPE_KEY)
+    second = jobs.enqueue_job("register_payment", PAYMENT, dedupe_key=DEDUPE_KEY)
+    assert second["id"] == first["id"]
+    assert second["deduplicated"] and not first["deduplicated"]
+
+    assert jobs.run_pending_jobs() == 1
+    job = jobs.get_job(first["id"])
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 1
+    assert len(fake_agent.requests) == 1
+
+    # Once the job has finished the key is free again.
+    third = jobs.enqueue_job("register_payment", PAYMENT, dedupe_key=DEDUPE_KEY)
+    assert third["id"] != first["id"]
+
+
+def test_unsent_requests_are_retried_but_server_errors_are_not(monkeypatch, job_db, fake_agent):
+    monkeypatch.setenv("SZAMLAZZ_BASE_URL", "http://127.0.0.1:9/szamla/")
+    monkeypatch.setenv("SZAMLAZZ_RETRIES", "0")
+    reset_settings()
+    job = jobs.enqueue_job("register_payment", PAYMENT)
+    jobs.run_job(jobs.claim_job(jobs.SZAMLAZZ))
+    job = jobs.get_job(job["id"])
+    assert job["status"] == "queued"
+    assert job["last_error"].startswith("ConnectError")
+
+    monkeypatch.setenv("SZAMLAZZ_BASE_URL", fake_agent.url)
+    reset_settings()
+    fake_agent.enqueue(503, b"busy")
+    assert jobs.run_pending_jobs(jobs.SZAMLAZZ) == 1
+    job = jobs.get_job(job["id"])
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+    assert len(fake_agent.requests) == 1
+
+
+def test_interrupted_jobs_are_requeued_only_when_resumable(job_db):
+    payment = jobs.enqueue_job("register_payment", PAYMENT)
+    reminder = jobs.enqueue_job("send_reminder", {"invoice_number": "E-TEST-2024-1"})
+    with db_connection() as conn:
+        conn.execute("UPDATE jobs SET status = 'running', attempts = 1")
+        conn.commit()
+
+    assert jobs.recover_interrupted_jobs() == 2
+    assert jobs.get_job(reminder["id"])["status"] == "queued"
+    failed = jobs.get_job(payment["id"])
+    assert failed["status"] == "failed"
+    assert "Interrupted" in failed["last_error"]
+
+
+def test_recovery_leaves_jobs_with_a_live_lease_alone(job_db):
+    ours = jobs.enqueue_job("send_reminder", {"invoice_number": "E-1"})
+    peer = jobs.enqueue_job("send_reminder", {"invoice_number": "E-2"})
+    dead = jobs.enqueue_job("send_reminder", {"invoice_number": "E-3"})
+    jobs.claim_job(jobs.SMTP)
+    now = datetime.utcnow()
+    with db_connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires_at = ? WHERE id = ?",
+            ("other-host:1:live", now + timedelta(minutes=5), peer["id"]),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires_at = ? WHERE id = ?",
+            ("other-host:2:dead", now - timedelta(seconds=1), dead["id"]),
+        )
+        conn.commit()
+
+    assert jobs.recover_interrupted_jobs() == 1
+    assert jobs.get_job(ours["id"])["status"] == "running"
+    assert jobs.get_job(peer["id"])["status"] == "running"
+    assert jobs.get_job(dead["id"])["status"] == "queued"
+    assert jobs.renew_leases() == 1
+
+
+def test_enqueue_inserts_again_when_the_duplicate_finished_meanwhile(monkeypatch, job_db):
+    real_connection = jobs.db_connection
+    conflicts = []
+
+    class RacingConnection:
+        """Reports one dedupe conflict whose active job is gone by the time it is read."""
+
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, sql, *args):
+            if sql.lstrip().startswith("INSERT") and not conflicts:
+                conflicts.append(sql)
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: jobs.dedupe_key")
+            return self.conn.execute(sql, *args)
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+    @contextmanager
+    def racing_connection(readonly=False):
+        with real_connection(readonly) as conn:
+            yield conn if readonly else RacingConnection(conn)
+
+    monkeypatch.setattr(jobs, "db_connection", racing_connection)
+    job = jobs.enqueue_job("register_payment", PAYMENT, dedupe_key="register_payment:E-1")
+    assert conflicts and not job["deduplicated"]
+    assert job["status"] == "queued"
@@ -0,0 +1,83 @@
+import os
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from szamlazz_collections_mcp import ledger, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import close_pool
+
+
+def _records(count, today, seed=7):
+    rng = random.Random(seed)
+    for index in range(count):
+        yield InvoiceRecord(
+            invoice_number=f"INV-{index:05d}",
+            buyer_name="Buyer",
+            buyer_email=f"customer{rng.randrange(20)}@example.com",
+            issue_date=today - timedelta(days=120),
+            due_date=today + timedelta(days=rng.randrange(-100, 20)),
+            gross_total=round(rng.uniform(10, 1000), 2),
+            currency="HUF",
+            status=rng.choice(("open", "open", "paid")),
+            created_at=datetime.utcnow(),
+            last_reminded_at=None,
+            reminders_sent_count=0,
+        )
+
+
+@pytest.fixture(params=["numpy", "python"])
+def ledger_db(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(ledger, "np", None)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        reset_settings()
+        ledger.reset_snapshot()
+        storage.init_db()
+        yield
+        ledger.reset_snapshot()
+        close_pool()
+    reset_settings()
+
+
+def test_snapshot_matches_sql_aging_and_follows_writes(ledger_db):
+    today = date.today()
+    storage.bulk_insert_invoices(_records(500, today))
+    assert ledger.aging_summary(today=today) == storage.aging_summary(today=today)
+    bounds = [15, 45]
+    assert ledger.aging_summary(bounds, today=today) == storage.aging_summary(bounds, today=today)
+
+    open_invoice = next(iter(storage.iter_invoices(status="open")))
+    storage.mark_invoice_paid(open_invoice.invoice_number, today)
+    new_record = next(_records(1, today, seed=99))
+    storage.insert_invoice(new_record.model_copy(update={"invoice_number": "NEW-1"}))
+    assert ledger._dirty
+    assert ledger.aging_summary(today=today) == storage.aging_summary(today=today)
+    assert not ledger._dirty
+
+    storage.bulk_insert_invoices(_records(600, today, seed=8))
+    assert ledger.aging_summary(today=today) == storage.aging_summary(today=today)
+
+
+def test_overdue_summary_ranks_customers(ledger_db):
+    today = date.today()
+    storage.bulk_insert_invoices(_records(300, today))
+    overdue = storage.list_overdue(min_days_overdue=5)
+    summary = ledger.overdue_summary(min_days_overdue=5, top_customers=3, today=today)
+
+    assert summary["count"] == len(overdue)
+    assert summary["gross_total"] == pytest.approx(sum(r.gross_total for r in overdue), abs=0.01)
+    per_customer = {}
+    for record in overdue:
+        email = record.buyer_email
+        per_customer[email] = per_customer.get(email, 0) + record.gross_total
+    expected = sorted(per_customer.items(), key=lambda item: -item[1])[:3]
+    ranked = [row["buyer_email"] for row in summary["top_customers"]]
+    assert ranked == [email for email, _ in expected]
+    assert storage.overdue_summary(min_days_overdue=5, top_customers=3, today=today) == summary
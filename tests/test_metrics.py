@@ -0,0 +1,114 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import urllib.request
+
+import httpx
+import pytest
+
+from szamlazz_collections_mcp import metrics, szamlazz_client
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.utils import close_pool, db_connection
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def _series(name, **labels):
+    for series in metrics.snapshot().get(name, {}).get("series", []):
+        if series["labels"] == labels:
+            return series
+    return None
+
+
+def test_histogram_quantiles_and_text_format():
+    latency = metrics.histogram("test_op_seconds", "Test op", ["op"], buckets=(0.1, 1.0))
+    errors = metrics.counter("test_op_errors_total", "Test op errors", ["op", "error"])
+    child = latency.labels("a")
+    for value in (0.05, 0.05, 0.5, 5.0):
+        child.observe(value)
+    assert child.quantile(0.5) == pytest.approx(0.1)
+    assert child.quantile(0.99) == 1.0
+
+    with pytest.raises(KeyError):
+        with metrics.timed(latency, errors, 'quote"d'):
+            raise KeyError("boom")
+
+    text = metrics.render()
+    assert "# TYPE test_op_seconds histogram" in text
+    assert 'test_op_seconds_bucket{op="a",le="0.1"} 2' in text
+    assert 'test_op_seconds_bucket{op="a",le="+Inf"} 4' in text
+    assert 'test_op_seconds_count{op="a"} 4' in text
+    assert 'test_op_errors_total{op="quote\\"d",error="KeyError"} 1' in text
+
+
+def test_instrument_handles_sync_and_async_and_can_be_disabled(monkeypatch):
+    @metrics.instrument_tool
+    async def some_tool(value):
+        if value < 0:
+            raise ValueError(value)
+        return value * 2
+
+    assert some_tool.__name__ == "some_tool"
+    assert asyncio.run(some_tool(2)) == 4
+    with pytest.raises(ValueError):
+        asyncio.run(some_tool(-1))
+    assert _series("mcp_tool_duration_seconds", tool="some_tool")["count"] == 2
+    assert _series("mcp_tool_errors_total", tool="some_tool", error="ValueError")["value"] == 1
+
+    monkeypatch.setenv("METRICS_ENABLED", "false")
+    reset_settings()
+    try:
+        asyncio.run(some_tool(3))
+    finally:
+        reset_settings()
+    assert _series("mcp_tool_duration_seconds", tool="some_tool")["count"] == 2
+
+
+def test_db_connection_and_agent_calls_are_recorded(fake_agent, monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        reset_settings()
+        try:
+            with db_connection(readonly=True) as conn:
+                conn.execute("SELECT 1")
+            with pytest.raises(sqlite3.OperationalError):
+                with db_connection() as conn:
+                    conn.execute("SELECT * FROM missing_table")
+        finally:
+            close_pool()
+    assert _series("db_connection_hold_seconds", mode="read")["count"] == 1
+    assert _series("db_errors_total", mode="write", error="OperationalError")["value"] == 1
+
+    szamlazz_client.query_invoice_xml("E-TEST-2024-1")
+    fake_agent.enqueue(500, b"oops")
+    with pytest.raises(httpx.HTTPStatusError):
+        szamlazz_client.register_payment("E-TEST-2024-1", "2024-01-01", 10.0)
+    action = "action-szamla_agent_xml"
+    assert _series("szamlazz_request_duration_seconds", action=action)["count"] == 1
+    assert _series("szamlazz_response_bytes", action=action)["sum"] == len(
+        b"<szamla><szamlaszam>E-TEST-2024-1</szamlaszam></szamla>"
+    )
+    assert _series("xml_build_duration_seconds", template="query_invoice_xml.xml.j2") is not None
+    error = _series(
+        "szamlazz_request_errors_total", action="action-szamla_agent_kifiz", error="HTTPStatusError"
+    )
+    assert error["value"] == 1
+
+
+def test_metrics_endpoint_serves_text_format():
+    metrics.counter("test_requests_total", "Test requests").labels().inc(3)
+    server = metrics.start_http_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode()
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+        assert "test_requests_total 3" in body
+    finally:
+        metrics.stop_http_server()
@@ -1,6 +1,6 @@
-from datetime import date, datetime, timedelta
 import os
 import tempfile
+from datetime import date, datetime, timedelta
 
 from szamlazz_collections_mcp import storage
 from szamlazz_collections_mcp.config import reset_settings
@@ -74,3 +74,46 @@ def test_aging_summary(monkeypatch):
         summary = storage.aging_summary()
         assert summary["totals"]["count"] == 2
         assert summary["by_bucket"]["31-60"]["count"] == 1
+
+
+def test_aging_summary_rollup_matches_scan(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "test.db")
+        monkeypatch.setenv("DB_PATH", db_path)
+        monkeypatch.setenv("AGING_BUCKETS", "10,90")
+        reset_settings()
+        storage.init_db()
+        today = date.today()
+        invoices = [("A", 3, 10.0), ("B", 20, 20.0), ("C", 120, 40.0), ("D", -5, 5.0)]
+        for number, days_overdue, amount in invoices:
+            storage.insert_invoice(
+                InvoiceRecord(
+                    invoice_number=number,
+                    buyer_name="Buyer",
+                    buyer_email="b@example.com",
+                    issue_date=today - timedelta(days=days_overdue + 8),
+                    due_date=today - timedelta(days=days_overdue),
+                    gross_total=amount,
+                    currency="HUF",
+                    status="open",
+                    created_at=datetime.utcnow(),
+                    last_reminded_at=None,
+                    reminders_sent_count=0,
+                )
+            )
+        storage.mark_invoice_paid("B", today)
+        scanned = storage.aging_summary()
+        assert list(scanned["by_bucket"]) == ["current", "1-10", "11-90", "90+"]
+        assert scanned["by_bucket"]["1-10"] == {"count": 1, "gross_total": 10.0}
+        assert scanned["by_bucket"]["11-90"]["count"] == 0
+        assert scanned["totals"] == {"count": 4, "gross_total": 75.0}
+
+        monkeypatch.setenv("AGING_ROLLUP", "true")
+        reset_settings()
+        storage.init_db()
+        assert storage.aging_summary() == scanned
+        storage.mark_invoice_paid("C", today)
+        assert storage.aging_summary()["by_bucket"]["90+"]["count"] == 0
+        monkeypatch.delenv("AGING_ROLLUP")
+        reset_settings()
+        assert storage.aging_summary()["by_bucket"]["90+"]["count"] == 0
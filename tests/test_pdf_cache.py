@@ -0,0 +1,87 @@
+import base64
+import os
+import tempfile
+
+import pytest
+
+from szamlazz_collections_mcp import pdf_cache, storage, szamlazz_client
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.utils import close_pool, encode_file_base64
+
+PDF = b"%PDF-1.4\n% fake invoice\n%%EOF\n"
+
+
+@pytest.fixture
+def cache_dir(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "app.db"))
+        monkeypatch.setenv("PDF_CACHE_DIR", os.path.join(tmpdir, "pdf-cache"))
+        reset_settings()
+        storage.init_db()
+        yield tmpdir
+        close_pool()
+    reset_settings()
+
+
+def test_pdf_is_downloaded_once_and_served_from_cache(cache_dir, fake_agent):
+    first = szamlazz_client.query_invoice_pdf("E-1", save=False)
+    second = szamlazz_client.query_invoice_pdf("E-1", save=False, inline=False)
+    assert len(fake_agent.requests) == 1
+    assert not first["cached"] and second["cached"]
+    assert base64.b64decode(first["pdf_base64"]) == PDF
+    assert second["pdf_base64"] is None
+    with open(second["cache_path"], "rb") as f:
+        assert f.read() == PDF
+
+    exported = szamlazz_client.query_invoice_pdf("E-1", output_dir=os.path.join(cache_dir, "out"))
+    assert os.path.basename(exported["file_path"]) == "E-1.pdf"
+    assert len(fake_agent.requests) == 1
+
+    szamlazz_client.query_invoice_pdf("E-1", save=False, refresh=True)
+    assert len(fake_agent.requests) == 2
+
+
+def test_error_answer_leaves_no_partial_download(cache_dir, fake_agent):
+    fake_agent.enqueue(200, b"<xmlszamlavalasz><hibakod>7</hibakod></xmlszamlavalasz>")
+    with pytest.raises(ValueError, match="Unexpected response"):
+        szamlazz_client.query_invoice_pdf("E-1", save=False)
+    assert os.listdir(os.path.join(cache_dir, "pdf-cache")) == []
+    assert pdf_cache.lookup("E-1") is None
+
+
+def test_identical_pdfs_share_a_blob_and_lru_entries_are_evicted(cache_dir):
+    a = pdf_cache.store("E-1", PDF)
+    b = pdf_cache.store("E-2", PDF)
+    c = pdf_cache.store("E-3", PDF + b"extra")
+    assert a.path == b.path
+    assert pdf_cache.cache_size() == len(PDF) * 2 + 5
+
+    pdf_cache.lookup("E-1")
+    # E-2 is the least recently used entry, but its blob is still shared with E-1, so
+    # E-3 has to go as well before the cache fits.
+    assert pdf_cache.evict(max_bytes=len(PDF)) == 2
+    assert pdf_cache.lookup("E-2") is None and pdf_cache.lookup("E-3") is None
+    assert pdf_cache.lookup("E-1") is not None
+    assert not os.path.exists(c.path)
+
+
+def test_chunked_base64_matches_whole_file(cache_dir):
+    content = bytes(range(256)) * 41
+    cached = pdf_cache.store("E-1", content)
+    assert encode_file_base64(cached.path, chunk_size=1000) == base64.b64encode(content).decode()
+
+    parts, offset = [], 0
+    while offset is not None:
+        chunk = pdf_cache.read_chunk(cached, offset, length=1000)
+        parts.append(chunk["data_base64"])
+        offset = chunk["next_offset"]
+    assert base64.b64decode("".join(parts)) == content
+
+
+def test_lookup_without_touch_leaves_the_lru_order_alone(cache_dir):
+    pdf_cache.store("E-1", PDF)
+    pdf_cache.store("E-2", PDF + b"extra")
+    assert pdf_cache.lookup("E-1", touch=False).size == len(PDF)
+    # E-1 still counts as least recently used, so it is evicted first.
+    assert pdf_cache.evict(max_bytes=len(PDF) + 5) == 1
+    assert pdf_cache.lookup("E-1") is None and pdf_cache.lookup("E-2") is not None
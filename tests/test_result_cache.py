@@ -0,0 +1,150 @@
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from szamlazz_collections_mcp import fx, ledger, result_cache, storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import close_pool
+
+TODAY = date.today()
+
+
+def _record(number, due_offset=-10, amount=1000.0):
+    return InvoiceRecord(
+        invoice_number=number,
+        buyer_name="Buyer",
+        buyer_email="buyer@example.com",
+        issue_date=TODAY - timedelta(days=30),
+        due_date=TODAY + timedelta(days=due_offset),
+        gross_total=amount,
+        currency="HUF",
+        status="open",
+        created_at=datetime.utcnow(),
+        last_reminded_at=None,
+        reminders_sent_count=0,
+    )
+
+
+@pytest.fixture
+def cache_db(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "test.db"))
+        monkeypatch.setenv("RESULT_CACHE_SIZE", "2")
+        monkeypatch.setenv("RESULT_CACHE_TTL", "60")
+        reset_settings()
+        result_cache.reset_cache()
+        ledger.reset_snapshot()
+        storage.init_db()
+        yield tmpdir
+        result_cache.reset_cache()
+        ledger.reset_snapshot()
+        close_pool()
+    reset_settings()
+
+
+@pytest.fixture
+def overdue_tool():
+    calls = []
+
+    @result_cache.cached_tool
+    async def overdue(min_days_overdue: int = 1) -> list:
+        calls.append(min_days_overdue)
+        return [
+            (record.invoice_number, record.status)
+            for record in storage.list_overdue(min_days_overdue)
+        ]
+
+    return overdue, calls
+
+
+def test_repeated_call_is_served_from_cache(cache_db, overdue_tool):
+    overdue, calls = overdue_tool
+    storage.insert_invoice(_record("INV-1"))
+
+    first = asyncio.run(overdue())
+    assert asyncio.run(overdue(1)) == first == [("INV-1", "open")]
+    assert asyncio.run(overdue(min_days_overdue=1)) == first
+    assert calls == [1]
+
+    asyncio.run(overdue(5))
+    assert calls == [1, 5]
+
+
+@pytest.mark.parametrize(
+    "write",
+    [
+        lambda: storage.insert_invoice(_record("INV-2")),
+        lambda: storage.mark_invoice_paid("INV-1", TODAY),
+        lambda: storage.update_reminder_metadata("INV-1"),
+    ],
+)
+def test_ledger_writes_invalidate_cached_results(cache_db, overdue_tool, write):
+    overdue, calls = overdue_tool
+    storage.insert_invoice(_record("INV-1"))
+    before = asyncio.run(overdue())
+
+    write()
+    asyncio.run(overdue())
+    assert before == [("INV-1", "open")]
+    assert calls == [1, 1]
+
+
+def test_fx_rate_load_invalidates_cached_results(cache_db, overdue_tool, tmp_path):
+    overdue, calls = overdue_tool
+    asyncio.run(overdue())
+    rates = tmp_path / "rates.csv"
+    rates.write_text("Dátum/ISO;EUR\nEgység;1\n2024.06.28.;395,00\n", encoding="utf-8")
+    fx.load_fx_rates(str(rates))
+    asyncio.run(overdue())
+    assert calls == [1, 1]
+
+
+def test_entries_expire_after_ttl_and_at_midnight(cache_db, overdue_tool, monkeypatch):
+    overdue, calls = overdue_tool
+    asyncio.run(overdue())
+
+    monkeypatch.setattr(result_cache, "_today", lambda: TODAY + timedelta(days=1))
+    asyncio.run(overdue())
+    asyncio.run(overdue())
+    assert calls == [1, 1]
+
+    expired = time.monotonic() + 61
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(monotonic=lambda: expired))
+    asyncio.run(overdue())
+    assert calls == [1, 1, 1]
+
+
+def test_cache_keeps_only_the_most_recently_used_entries(cache_db, overdue_tool):
+    overdue, calls = overdue_tool
+    for days in (1, 2, 1, 3, 1, 2):
+        asyncio.run(overdue(days))
+    # 1 stays cached as the most recently used entry; 2 was evicted when 3 came in.
+    assert calls == [1, 2, 3, 2]
+    assert len(result_cache.get_cache()) == 2
+
+
+def test_snapshot_result_computed_during_a_write_is_not_served_after_it(cache_db, monkeypatch):
+    @result_cache.cached_tool
+    async def overdue_summary() -> dict:
+        return ledger.overdue_summary()
+
+    interleaved = []
+
+    def read_mid_write(invoice_numbers):
+        # Runs inside the write, before the ledger has marked the snapshot dirty.
+        if invoice_numbers == ["INV-2"]:
+            interleaved.append(asyncio.run(overdue_summary())["count"])
+
+    monkeypatch.setattr(storage, "_write_listeners", [read_mid_write])
+    storage.insert_invoice(_record("INV-1"))
+    assert asyncio.run(overdue_summary())["count"] == 1
+
+    storage.insert_invoice(_record("INV-2"))
+    assert interleaved == [1]
+    assert asyncio.run(overdue_summary())["count"] == 2
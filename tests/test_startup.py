@@ -0,0 +1,24 @@
+import json
+import os
+import subprocess
+import sys
+
+import szamlazz_collections_mcp
+
+SRC = os.path.dirname(os.path.dirname(szamlazz_collections_mcp.__file__))
+
+
+def test_core_modules_import_without_heavy_dependencies():
+    # What the server imports up front; clients, templates and SMTP load on first use.
+    code = (
+        "import json, sys\n"
+        "from szamlazz_collections_mcp import fx, importer, jobs, metrics, pdf_cache, storage\n"
+        "from szamlazz_collections_mcp.config import get_settings\n"
+        "print(json.dumps(sorted(name for name in ('httpx', 'jinja2', 'smtplib', 'numpy',"
+        " 'dotenv', 'http.server') if name in sys.modules)))\n"
+    )
+    env = {**os.environ, "PYTHONPATH": SRC}
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True
+    )
+    assert json.loads(proc.stdout) == []
@@ -1,10 +1,13 @@
-from datetime import date, datetime, timedelta
 import os
 import tempfile
+from datetime import date, datetime, timedelta
+
+import pytest
 
 from szamlazz_collections_mcp import storage
 from szamlazz_collections_mcp.config import reset_settings
 from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.utils import db_connection
 
 
 def test_insert_and_list_invoices(monkeypatch):
@@ -31,3 +34,87 @@ def test_insert_and_list_invoices(monkeypatch):
         invoices = storage.list_invoices()
         assert len(invoices) == 1
         assert invoices[0].invoice_number == "INV-1"
+
+
+def test_migrations_record_version_and_index_lookups(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "test.db")
+        monkeypatch.setenv("DB_PATH", db_path)
+        reset_settings()
+        storage.init_db()
+        storage.init_db()
+        with db_connection() as conn:
+            assert storage.schema_version(conn) == storage.MIGRATIONS[-1].version
+            applied = conn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]
+            assert applied == len(storage.MIGRATIONS)
+            plan = " ".join(
+                row[3]
+                for row in conn.execute(
+                    "EXPLAIN QUERY PLAN SELECT * FROM invoices "
+                    "WHERE status = 'open' AND due_date < ? ORDER BY due_date ASC",
+                    (date.today(),),
+                )
+            )
+            assert "USING INDEX idx_invoices_" in plan
+            assert "TEMP B-TREE" not in plan
+
+        record = InvoiceRecord(
+            invoice_number="INV-EXT",
+            buyer_name="Test Buyer",
+            buyer_email="buyer@example.com",
+            issue_date=date.today(),
+            due_date=date.today(),
+            gross_total=10.0,
+            currency="HUF",
+            status="open",
+            created_at=datetime.utcnow(),
+            last_reminded_at=None,
+            reminders_sent_count=0,
+            external_id="order-42",
+        )
+        storage.insert_invoice(record)
+        assert storage.get_invoice_by_external_id("order-42").invoice_number == "INV-EXT"
+        assert storage.get_invoice_by_external_id("missing") is None
+
+
+def test_keyset_pagination_walks_every_row_once(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "test.db")
+        monkeypatch.setenv("DB_PATH", db_path)
+        reset_settings()
+        storage.init_db()
+        today = date.today()
+        records = [
+            InvoiceRecord(
+                invoice_number=f"INV-{i:02d}",
+                buyer_name="Test Buyer",
+                buyer_email="buyer@example.com",
+                issue_date=today - timedelta(days=30),
+                due_date=today - timedelta(days=10 + i % 3),
+                gross_total=10.0,
+                currency="HUF",
+                status="open",
+                created_at=datetime.utcnow(),
+                last_reminded_at=None,
+                reminders_sent_count=0,
+            )
+            for i in range(7)
+        ]
+        storage.bulk_insert_invoices(records)
+
+        seen = []
+        cursor = None
+        while True:
+            page = storage.list_overdue_page(limit=3, cursor=cursor)
+            seen.extend(record.invoice_number for record in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert seen == [record.invoice_number for record in storage.list_overdue()]
+        assert sorted(seen) == sorted(record.invoice_number for record in records)
+
+        lazy = storage.iter_invoices(customer_email="buyer@example.com")
+        assert next(lazy).invoice_number == seen[0]
+        lazy.close()
+        with pytest.raises(ValueError):
+            storage.list_invoices_page(cursor="not-a-cursor")
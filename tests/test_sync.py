@@ -0,0 +1,108 @@
+import os
+import tempfile
+from datetime import date, datetime
+
+import pytest
+
+from szamlazz_collections_mcp import ledger as ledger_snapshot
+from szamlazz_collections_mcp import storage
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.models import InvoiceRecord
+from szamlazz_collections_mcp.sync import sync_invoices
+from szamlazz_collections_mcp.utils import close_pool
+
+
+def _invoice_xml(number, gross, payments=()):
+    paid = "".join(
+        f"<kifizetes><datum>2024-06-01</datum><osszeg>{amount}</osszeg></kifizetes>"
+        for amount in payments
+    )
+    return (
+        f"<szamla><alap><szamlaszam>{number}</szamlaszam></alap>"
+        f"<tetelek><tetel><brutto>1</brutto></tetel></tetelek>"
+        f"<osszegek><totalossz><brutto>{gross}</brutto></totalossz></osszegek>"
+        f"<kifizetesek>{paid}</kifizetesek></szamla>"
+    ).encode()
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("DB_PATH", os.path.join(tmpdir, "sync.db"))
+        reset_settings()
+        storage.init_db()
+        records = [
+            ("E-1", 1000.0, "open"),
+            ("E-2", 500.0, "open"),
+            ("E-3", 200.0, "open"),
+            ("E-4", 300.0, "paid"),
+        ]
+        storage.bulk_insert_invoices(
+            InvoiceRecord(
+                invoice_number=number,
+                buyer_name="Buyer",
+                buyer_email="buyer@example.com",
+                issue_date=date(2024, 5, 1),
+                due_date=date(2024, 5, 31),
+                gross_total=gross,
+                currency="HUF",
+                status=status,
+                created_at=datetime.utcnow(),
+                last_reminded_at=None,
+                reminders_sent_count=0,
+            )
+            for number, gross, status in records
+        )
+        yield
+        close_pool()
+    reset_settings()
+
+
+def test_sync_applies_remote_payments_and_skips_recently_checked(ledger, fake_agent):
+    fake_agent.enqueue(200, _invoice_xml("E-1", 1000, [600, "400.00"]))
+    fake_agent.enqueue(200, _invoice_xml("E-2", 500, [100]))
+    fake_agent.enqueue(200, _invoice_xml("E-3", 200))
+
+    result = sync_invoices(concurrency=1)
+    assert result["checked"] == 3
+    assert result["updated"] == ["E-1", "E-2"]
+    assert result["paid"] == 1 and not result["failed"]
+    assert len(fake_agent.requests) == 3
+
+    paid = storage.get_invoice("E-1")
+    assert (paid.status, paid.paid_amount) == ("paid", 1000.0)
+    partial = storage.get_invoice("E-2")
+    assert (partial.status, partial.paid_amount) == ("open", 100.0)
+    assert storage.get_invoice("E-3").last_synced_at is not None
+    assert storage.customer_summary("buyer@example.com")[0]["open_count"] == 2
+
+    # Reports count what is still unpaid: 400 of E-2 and all 200 of E-3.
+    today = date(2024, 6, 30)
+    assert storage.customer_summary("buyer@example.com", today=today)[0]["open_total"] == 600.0
+    aging = storage.aging_summary([30], today=today)
+    assert aging["by_bucket"]["1-30"]["gross_total"] == 600.0
+    assert ledger_snapshot.aging_summary([30], today=today) == aging
+    assert ledger_snapshot.overdue_summary(today=today)["gross_total"] == 600.0
+    assert storage.list_overdue_page(include_totals=True).totals["gross_total"] == 600.0
+
+    assert sync_invoices()["checked"] == 0
+    assert len(fake_agent.requests) == 3
+
+    # Forced: only the invoices still open are fetched again.
+    fake_agent.enqueue(200, _invoice_xml("E-2", 500, [100]))
+    fake_agent.enqueue(200, b"<xmlszamlavalasz><hibakod>7</hibakod></xmlszamlavalasz>")
+    result = sync_invoices(min_age=0, concurrency=1)
+    assert result["checked"] == 2 and result["updated"] == []
+    assert result["failed"][0]["invoice_number"] == "E-3"
+    assert len(fake_agent.requests) == 5
+
+
+def test_failed_fetches_keep_their_watermark(ledger, fake_agent, monkeypatch):
+    monkeypatch.setenv("SZAMLAZZ_RETRIES", "0")
+    reset_settings()
+    for _ in range(3):
+        fake_agent.enqueue(500, b"down")
+    result = sync_invoices(concurrency=1)
+    assert result["checked"] == 0 and len(result["failed"]) == 3
+    assert storage.get_invoice("E-1").last_synced_at is None
+    assert sync_invoices(concurrency=1)["checked"] == 3
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+
+from szamlazz_collections_mcp import szamlazz_async_client
+from szamlazz_collections_mcp.utils import run_blocking, shutdown_executor
+
+
+def test_async_queries_run_concurrently(fake_agent):
+    fake_agent.latency = 0.2
+
+    async def scenario():
+        try:
+            start = time.perf_counter()
+            results = await asyncio.gather(
+                *(szamlazz_async_client.query_invoice_xml(f"E-{i}") for i in range(5))
+            )
+            return results, time.perf_counter() - start
+        finally:
+            await szamlazz_async_client.close_async_client()
+
+    results, elapsed = asyncio.run(scenario())
+    assert [result["invoice_number"] for result in results] == [f"E-{i}" for i in range(5)]
+    assert elapsed < 0.6
+
+
+def test_async_payment_and_retry(fake_agent):
+    fake_agent.enqueue(500, b"oops")
+
+    async def scenario():
+        try:
+            xml = await szamlazz_async_client.query_invoice_xml("E-1")
+            payment = await szamlazz_async_client.register_payment("E-1", "2024-01-10", 100.0)
+            return xml, payment
+        finally:
+            await szamlazz_async_client.close_async_client()
+
+    xml, payment = asyncio.run(scenario())
+    assert "E-TEST-2024-1" in xml["xml"]
+    assert payment["ok"] is True
+    assert [request["action"] for request in fake_agent.requests] == [
+        "action-szamla_agent_xml",
+        "action-szamla_agent_xml",
+        "action-szamla_agent_kifiz",
+    ]
+
+
+def test_run_blocking_uses_worker_thread():
+    async def scenario():
+        return await run_blocking(threading.current_thread)
+
+    try:
+        worker = asyncio.run(scenario())
+    finally:
+        shutdown_executor()
+    assert worker is not threading.main_thread()
+    assert worker.name.startswith("szamlazz-blocking")
@@ -0,0 +1,44 @@
+import httpx
+import pytest
+
+from szamlazz_collections_mcp import szamlazz_client
+from szamlazz_collections_mcp.config import reset_settings
+
+
+def test_pooled_client_reuses_connection(fake_agent):
+    for _ in range(3):
+        result = szamlazz_client.query_invoice_xml("E-TEST-2024-1")
+        assert "<szamlaszam>" in result["xml"]
+    assert szamlazz_client.get_http_client() is szamlazz_client.get_http_client()
+    assert len({request["port"] for request in fake_agent.requests}) == 1
+
+
+def test_server_errors_retried_only_for_idempotent_actions(fake_agent):
+    fake_agent.enqueue(503, b"busy")
+    fake_agent.enqueue(502, b"busy")
+    result = szamlazz_client.query_invoice_xml("E-TEST-2024-1")
+    assert "E-TEST-2024-1" in result["xml"]
+    assert len(fake_agent.requests) == 3
+
+    fake_agent.requests.clear()
+    fake_agent.enqueue(503, b"busy")
+    with pytest.raises(httpx.HTTPStatusError):
+        szamlazz_client.register_payment("E-TEST-2024-1", "2024-01-10", 100.0)
+    assert len(fake_agent.requests) == 1
+
+
+def test_connection_errors_are_retried(monkeypatch, fake_agent):
+    monkeypatch.setenv("SZAMLAZZ_BASE_URL", "http://127.0.0.1:9/szamla/")
+    monkeypatch.setenv("SZAMLAZZ_RETRIES", "1")
+    reset_settings()
+    attempts = []
+    original = httpx.Client.send
+
+    def counting_send(self, *args, **kwargs):
+        attempts.append(args)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(httpx.Client, "send", counting_send)
+    with pytest.raises(httpx.ConnectError):
+        szamlazz_client.generate_invoice({"buyer": {}, "items": []})
+    assert len(attempts) == 2
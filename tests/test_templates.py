@@ -1,4 +1,9 @@
-from szamlazz_collections_mcp import szamlazz_client
+from datetime import date, datetime
+
+from szamlazz_collections_mcp import cli, szamlazz_client, templating
+from szamlazz_collections_mcp.config import reset_settings
+from szamlazz_collections_mcp.emailer import render_reminder
+from szamlazz_collections_mcp.models import InvoiceRecord
 
 
 def test_generate_invoice_xml_contains_buyer():
@@ -31,3 +36,33 @@ def test_generate_invoice_xml_contains_buyer():
     )
     assert "Teszt Kft." in xml
     assert "xmlszamla" in xml
+
+
+def test_environments_are_cached_and_compilable(monkeypatch, tmp_path):
+    record = InvoiceRecord(
+        invoice_number="INV-9",
+        buyer_name="Teszt Kft.",
+        buyer_email="teszt@example.com",
+        issue_date=date(2024, 1, 1),
+        due_date=date(2024, 1, 9),
+        gross_total=1270.0,
+        currency="HUF",
+        status="open",
+        created_at=datetime(2024, 1, 1),
+        last_reminded_at=None,
+        reminders_sent_count=0,
+    )
+    templating.reset_environments()
+    assert templating.get_environment("xml") is templating.get_environment("xml")
+    expected = render_reminder(record, language="en").body
+
+    assert cli.main(["compile-templates", str(tmp_path)]) == 0
+    monkeypatch.setenv("TEMPLATES_COMPILED_DIR", str(tmp_path))
+    reset_settings()
+    templating.reset_environments()
+    try:
+        assert (tmp_path / "reminder").is_dir()
+        assert "reminder/reminder_en.txt.j2" in templating.warm_templates()
+        assert render_reminder(record, language="en").body == expected
+    finally:
+        templating.reset_environments()